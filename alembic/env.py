@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -9,6 +10,10 @@ from alembic import context
 # access to the values within the .ini file in use.
 config = context.config
 
+# The application reads its database URL from CC_VC_DATABASE_URL, migrate the same database
+if os.environ.get("CC_VC_DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", os.environ["CC_VC_DATABASE_URL"])
+
 from database.models import Base
 
 # Interpret the config file for Python logging.
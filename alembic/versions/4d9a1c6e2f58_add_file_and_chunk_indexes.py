@@ -0,0 +1,69 @@
+"""Add file_id and chunk_id indexes
+
+Revision ID: 4d9a1c6e2f58
+Revises: e5b0f83c6a27
+Create Date: 2026-10-18 16:21:09.440183
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d9a1c6e2f58'
+down_revision: Union[str, None] = 'e5b0f83c6a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.create_index('ix_text_chunks_file_id_page_number', ['file_id', 'page_number'], unique=False)
+
+    with op.batch_alter_table('processed_texts', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_processed_texts_file_id'), ['file_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_processed_texts_text_chunk_id'), ['text_chunk_id'], unique=False)
+
+    with op.batch_alter_table('extracted_tables', schema=None) as batch_op:
+        batch_op.create_index('ix_extracted_tables_file_id_page_number', ['file_id', 'page_number'], unique=False)
+
+    # The composite (file_name, chunk_id) indexes replace the file_name ones
+    with op.batch_alter_table('embeddings', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_embeddings_file_name'))
+        batch_op.create_index('ix_embeddings_file_name_chunk_id', ['file_name', 'chunk_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_embeddings_chunk_id'), ['chunk_id'], unique=False)
+
+    with op.batch_alter_table('clusters', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_clusters_file_name'))
+        batch_op.create_index('ix_clusters_scope_file_name_chunk_id', ['scope', 'file_name', 'chunk_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_clusters_chunk_id'), ['chunk_id'], unique=False)
+
+    with op.batch_alter_table('entities', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_entities_chunk_id'), ['chunk_id'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('entities', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_entities_chunk_id'))
+
+    with op.batch_alter_table('clusters', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_clusters_chunk_id'))
+        batch_op.drop_index('ix_clusters_scope_file_name_chunk_id')
+        batch_op.create_index(batch_op.f('ix_clusters_file_name'), ['file_name'], unique=False)
+
+    with op.batch_alter_table('embeddings', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_embeddings_chunk_id'))
+        batch_op.drop_index('ix_embeddings_file_name_chunk_id')
+        batch_op.create_index(batch_op.f('ix_embeddings_file_name'), ['file_name'], unique=False)
+
+    with op.batch_alter_table('extracted_tables', schema=None) as batch_op:
+        batch_op.drop_index('ix_extracted_tables_file_id_page_number')
+
+    with op.batch_alter_table('processed_texts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_processed_texts_text_chunk_id'))
+        batch_op.drop_index(batch_op.f('ix_processed_texts_file_id'))
+
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.drop_index('ix_text_chunks_file_id_page_number')
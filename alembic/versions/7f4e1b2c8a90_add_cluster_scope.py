@@ -0,0 +1,29 @@
+"""Add cluster scope
+
+Revision ID: 7f4e1b2c8a90
+Revises: d3a7c91e5f24
+Create Date: 2026-10-18 19:05:16.740281
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f4e1b2c8a90'
+down_revision: Union[str, None] = 'd3a7c91e5f24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing labels can't be told apart, they are taken as per-file labels
+    with op.batch_alter_table('clusters', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('scope', sa.String(), nullable=False, server_default='file'))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('clusters', schema=None) as batch_op:
+        batch_op.drop_column('scope')
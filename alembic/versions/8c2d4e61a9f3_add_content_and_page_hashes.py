@@ -0,0 +1,52 @@
+"""Add content and page hashes
+
+Revision ID: 8c2d4e61a9f3
+Revises: f156bfa421c9
+Create Date: 2026-10-18 10:12:41.208113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2d4e61a9f3'
+down_revision: Union[str, None] = 'f156bfa421c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('tables_hash', sa.String(), nullable=True))
+
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('page_number', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('page_hash', sa.String(), nullable=True))
+
+    with op.batch_alter_table('extracted_tables', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('page_number', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('processed_texts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('text_chunk_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_processed_texts_text_chunk_id', 'text_chunks', ['text_chunk_id'], ['id'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('processed_texts', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_processed_texts_text_chunk_id', type_='foreignkey')
+        batch_op.drop_column('text_chunk_id')
+
+    with op.batch_alter_table('extracted_tables', schema=None) as batch_op:
+        batch_op.drop_column('page_number')
+
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.drop_column('page_hash')
+        batch_op.drop_column('page_number')
+
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_column('tables_hash')
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,48 @@
+"""Add jobs
+
+Revision ID: 9e3b7d52c1a6
+Revises: 4d9a1c6e2f58
+Create Date: 2026-10-18 17:02:37.285610
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e3b7d52c1a6'
+down_revision: Union[str, None] = '4d9a1c6e2f58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('task', sa.String(), nullable=True),
+    sa.Column('arg', sa.Text(), nullable=True),
+    sa.Column('options', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('max_attempts', sa.Integer(), nullable=True),
+    sa.Column('available_at', sa.Float(), nullable=True),
+    sa.Column('lease_expires_at', sa.Float(), nullable=True),
+    sa.Column('worker', sa.String(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.Float(), nullable=True),
+    sa.Column('started_at', sa.Float(), nullable=True),
+    sa.Column('finished_at', sa.Float(), nullable=True),
+    sa.Column('duration', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_jobs_status_available_at', ['status', 'available_at'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_jobs_status_available_at')
+
+    op.drop_table('jobs')
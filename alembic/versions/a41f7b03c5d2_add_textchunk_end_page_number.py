@@ -0,0 +1,31 @@
+"""Add TextChunk end page number
+
+Revision ID: a41f7b03c5d2
+Revises: 8c2d4e61a9f3
+Create Date: 2026-10-18 11:02:17.551930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41f7b03c5d2'
+down_revision: Union[str, None] = '8c2d4e61a9f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('end_page_number', sa.Integer(), nullable=True))
+
+    # Chunks stored so far were all taken from a single page
+    op.execute('UPDATE text_chunks SET end_page_number = page_number')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('text_chunks', schema=None) as batch_op:
+        batch_op.drop_column('end_page_number')
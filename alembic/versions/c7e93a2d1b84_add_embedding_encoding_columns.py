@@ -0,0 +1,32 @@
+"""Add embedding encoding columns
+
+Revision ID: c7e93a2d1b84
+Revises: a41f7b03c5d2
+Create Date: 2026-10-18 12:31:05.917342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e93a2d1b84'
+down_revision: Union[str, None] = 'a41f7b03c5d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('embeddings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('dtype', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('dim', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('scale', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('embeddings', schema=None) as batch_op:
+        batch_op.drop_column('scale')
+        batch_op.drop_column('dim')
+        batch_op.drop_column('dtype')
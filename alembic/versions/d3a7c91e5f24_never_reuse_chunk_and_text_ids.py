@@ -0,0 +1,33 @@
+"""Never reuse chunk and processed text ids
+
+Revision ID: d3a7c91e5f24
+Revises: c7e93a2d1b84
+Create Date: 2026-10-18 18:47:52.903114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a7c91e5f24'
+down_revision: Union[str, None] = 'c7e93a2d1b84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQLite only applies AUTOINCREMENT to a new table, batch mode recreates them
+    for table in ('text_chunks', 'processed_texts'):
+        with op.batch_alter_table(table, schema=None, recreate='always',
+                                  table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+            pass
+
+
+def downgrade() -> None:
+    for table in ('processed_texts', 'text_chunks'):
+        with op.batch_alter_table(table, schema=None, recreate='always',
+                                  table_kwargs={'sqlite_autoincrement': False}) as batch_op:
+            pass
@@ -0,0 +1,42 @@
+"""Add chunk_topics
+
+Revision ID: e5b0f83c6a27
+Revises: 7f4e1b2c8a90
+Create Date: 2026-10-18 15:52:40.118264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b0f83c6a27'
+down_revision: Union[str, None] = '7f4e1b2c8a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('chunk_topics',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('file_name', sa.String(), nullable=True),
+    sa.Column('chunk_id', sa.Integer(), nullable=True),
+    sa.Column('topic_id', sa.Integer(), nullable=True),
+    sa.Column('weight', sa.Float(), nullable=True),
+    sa.Column('model_version', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['chunk_id'], ['processed_texts.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('chunk_topics', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_chunk_topics_chunk_id'), ['chunk_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_chunk_topics_file_name'), ['file_name'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('chunk_topics', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_chunk_topics_file_name'))
+        batch_op.drop_index(batch_op.f('ix_chunk_topics_chunk_id'))
+
+    op.drop_table('chunk_topics')
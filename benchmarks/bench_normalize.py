@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of the text normalization steps against the Python loops they replaced.
+
+The reference loops double as the oracle of tests/test_normalize.py, which checks the vectorized
+versions against them on randomized input.
+
+Run from the repository root:
+    python -m benchmarks.bench_normalize --size 2000000
+or directly:
+    python benchmarks/bench_normalize.py --size 2000000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+if __package__ in (None, ""):
+    # Run as a script, the repository root isn't on the path
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from normalize import TextNormalizer, collapse_repeats, collapse_whitespace, join_single_letters
+
+
+def reference_reduce_duplicates(s):
+    if not s:
+        return s
+    result = [s[0]]
+    for i in range(1, len(s)):
+        if s[i] != s[i-1]:
+            result.append(s[i])
+    return ''.join(result)
+
+
+def reference_process_extracted_text(text):
+    words = text.split()
+    processed_words = []
+    for word in words:
+        if len(word) == 1 and processed_words:
+            processed_words[-1] += word
+        else:
+            processed_words.append(word)
+    return ' '.join(processed_words)
+
+
+def random_text(rng, size):
+    """Text with repeated letters, split words, mixed whitespace and a few non-ASCII characters."""
+    alphabet = string.ascii_letters + "€é"
+    whitespace = [" ", " ", " ", "  ", "\n", "\t", "\n\n", " ", " "]
+    parts = []
+    length = 0
+    while length < size:
+        word_length = rng.choice([1, 1, 1, 2, 3, 5, 8])
+        word = ''.join(rng.choice(alphabet) * rng.choice([1, 1, 1, 2, 3]) for _ in range(word_length))
+        parts.append(word)
+        parts.append(rng.choice(whitespace))
+        length += len(word) + 1
+    if rng.random() < 0.5:
+        parts.insert(0, rng.choice(whitespace))
+    return ''.join(parts)
+
+
+def best_of(function, text, repeat):
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function(text)
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark text normalization.")
+    parser.add_argument("--size", type=int, default=2000000, help="Characters of synthetic text.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs, the best one is reported.")
+    args = parser.parse_args()
+
+    text = random_text(random.Random(1), args.size)
+    cases = [
+        ("collapse repeats", reference_reduce_duplicates, collapse_repeats),
+        ("join single letters", reference_process_extracted_text, join_single_letters),
+        ("both steps", lambda t: reference_process_extracted_text(reference_reduce_duplicates(t)),
+         TextNormalizer(["collapse_repeats", "join_single_letters"])),
+    ]
+    for name, reference, fast in cases:
+        reference_time = best_of(reference, text, args.repeat)
+        fast_time = best_of(fast, text, args.repeat)
+        print(f"{name:<22} loop {reference_time * 1000:8.1f} ms   numpy {fast_time * 1000:8.1f} ms   "
+              f"speedup {reference_time / fast_time:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Latency of the per-file lookups of db_utils as the database grows.
+
+Builds synthetic SQLite databases of increasing size, every chunk with a processed text,
+an embedding, a cluster label and an entity, and times the per-file queries against one file.
+With the file_id/chunk_id indexes the latency stays flat as the database grows. Pass
+--without-indexes to drop them and see the full scans.
+
+Runs in a temporary directory, from the repository root:
+    python -m benchmarks.bench_queries --rows 10000 100000 1000000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from database import db_utils
+from database.models import TextChunk, File, ProcessedText, Entity, Embeddings, Clusters
+from database.session import configure_engine, get_engine
+
+# Indexes added for the per-file lookups, dropped by --without-indexes
+LOOKUP_INDEXES = [
+    "ix_text_chunks_file_id_page_number",
+    "ix_processed_texts_file_id",
+    "ix_processed_texts_text_chunk_id",
+    "ix_extracted_tables_file_id_page_number",
+    "ix_embeddings_file_name_chunk_id",
+    "ix_embeddings_chunk_id",
+    "ix_clusters_scope_file_name_chunk_id",
+    "ix_clusters_chunk_id",
+    "ix_entities_chunk_id",
+]
+
+QUERIES = {
+    "get_chunks_for_file": db_utils.get_chunks_for_file,
+    "get_file_hashes": db_utils.get_file_hashes,
+    "get_unprocessed_chunks": db_utils.get_unprocessed_chunks,
+    "get_unembedded_processed_texts": db_utils.get_unembedded_processed_texts,
+    "get_entities_by_file": db_utils.get_entities_by_file,
+    "get_embeddings_by_file": db_utils.get_embeddings_by_file,
+    "get_clusters_by_file": db_utils.get_clusters_by_file,
+}
+
+
+def build_database(rows, chunks_per_file, batch_size=50000):
+    """Fill the current database with rows chunks, ids assigned explicitly so every table is one insert."""
+    db_utils.initialize_database()
+    files = max(1, rows // chunks_per_file)
+    embedding = bytes(64)  # 32 float16 zeros
+    with get_engine().begin() as connection:
+        connection.execute(File.__table__.insert(), [{"id": file_id, "file_name": f"file{file_id}.pdf"}
+                                                     for file_id in range(1, files + 1)])
+        for start in range(1, rows + 1, batch_size):
+            ids = range(start, min(start + batch_size, rows + 1))
+            file_of = [(chunk_id - 1) // chunks_per_file % files + 1 for chunk_id in ids]
+            connection.execute(TextChunk.__table__.insert(), [
+                {"id": chunk_id, "chunk_content": "chunk text", "file_id": file_id,
+                 "page_number": (chunk_id - 1) % chunks_per_file + 1, "page_hash": "0" * 40}
+                for chunk_id, file_id in zip(ids, file_of)])
+            connection.execute(ProcessedText.__table__.insert(), [
+                {"id": chunk_id, "content": "processed text", "file_id": file_id, "text_chunk_id": chunk_id}
+                for chunk_id, file_id in zip(ids, file_of)])
+            connection.execute(Embeddings.__table__.insert(), [
+                {"file_name": f"file{file_id}.pdf", "chunk_id": chunk_id, "embedding": embedding,
+                 "dtype": "float16", "dim": 32}
+                for chunk_id, file_id in zip(ids, file_of)])
+            connection.execute(Clusters.__table__.insert(), [
+                {"file_name": f"file{file_id}.pdf", "chunk_id": chunk_id, "cluster_label": chunk_id % 20, "scope": "file"}
+                for chunk_id, file_id in zip(ids, file_of)])
+            connection.execute(Entity.__table__.insert(), [
+                {"entity_text": "Nairobi", "entity_label": "GPE", "chunk_id": chunk_id} for chunk_id in ids])
+        connection.execute(text("ANALYZE"))
+    return files
+
+
+def time_query(query, file_name, repeats):
+    query(file_name)  # Warm the page cache and the file id cache
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        query(file_name)
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-file database lookups.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Number of chunks of each database.")
+    parser.add_argument("--chunks-per-file", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--without-indexes", action="store_true", help="Drop the lookup indexes first.")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        for rows in args.rows:
+            configure_engine(f"sqlite:///{os.path.join(root, f'bench_{rows}.db')}")
+            start_time = time.perf_counter()
+            files = build_database(rows, args.chunks_per_file)
+            if args.without_indexes:
+                with get_engine().begin() as connection:
+                    for index in LOOKUP_INDEXES:
+                        connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+            print(f"built {rows} chunks over {files} files in {time.perf_counter() - start_time:.1f}s")
+
+            file_name = f"file{files // 2 + 1}.pdf"
+            results[rows] = {name: time_query(query, file_name, args.repeats) for name, query in QUERIES.items()}
+            get_engine().dispose()
+
+    print(f"\n{'query (ms per file)':<32}" + "".join(f"{rows:>12}" for rows in args.rows))
+    for name in QUERIES:
+        print(f"{name:<32}" + "".join(f"{results[rows][name]:>12.2f}" for rows in args.rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Recall and latency of the IVF search index against exact search, on synthetic clustered vectors.
+
+Only NumPy is needed, the index is built in a temporary directory and no database or model is used.
+
+Run from the repository root:
+    python -m benchmarks.bench_search --vectors 100000 --dim 384
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from database.vector_index import IVFIndex, normalize_rows, top_k_indices
+
+
+def synthetic_vectors(count, dim, topics=200, seed=0):
+    """Vectors scattered around a number of topic directions, roughly how chunk embeddings group."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    labels = rng.integers(0, topics, count)
+    return centers[labels] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the IVF search index.")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.vectors + args.queries, args.dim)
+    queries, vectors = vectors[:args.queries], vectors[args.queries:]
+    chunk_ids = np.arange(len(vectors), dtype=np.int64)
+    unit_vectors = normalize_rows(vectors)
+
+    # Ground truth and latency of the exact search
+    start_time = time.perf_counter()
+    truth = [set(top_k_indices(unit_vectors @ query, args.top_k).tolist()) for query in normalize_rows(queries)]
+    exact_ms = (time.perf_counter() - start_time) * 1000 / args.queries
+    print(f"exact        {exact_ms:8.2f} ms/query   recall 1.000")
+
+    with tempfile.TemporaryDirectory() as root:
+        index = IVFIndex(root)
+        start_time = time.perf_counter()
+        index.build(chunk_ids, vectors)
+        print(f"built index over {len(vectors)} vectors ({index.meta['nlist']} lists) "
+              f"in {time.perf_counter() - start_time:.1f}s")
+        index.search(queries[0], args.top_k)  # Warm up the mapping
+
+        for nprobe in args.nprobe:
+            hits = 0
+            latencies = []
+            for query, expected in zip(queries, truth):
+                start_time = time.perf_counter()
+                found, _ = index.search(query, args.top_k, nprobe=nprobe)
+                latencies.append(time.perf_counter() - start_time)
+                hits += len(expected & set(found.tolist()))
+            recall = hits / (args.top_k * args.queries)
+            print(f"nprobe {nprobe:<5} {np.median(latencies) * 1000:8.2f} ms/query   recall {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Concurrent ingestion into the single main database against sharded mode, where every worker
+process writes its own shard database and the shards are merged at the end.
+
+Workers write synthetic files (chunks committed in batches plus a processed text per chunk)
+through the same db_utils helpers extraction uses, no PDF parsing is involved, so the
+database is the only shared resource. Runs in a temporary directory, from the repository root:
+    python -m benchmarks.bench_shards --workers 8 --files 64
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from database.db_utils import (initialize_database, ChunkWriter, get_unprocessed_chunks, store_processed_text,
+                               count_rows_across_shards)
+from database.session import configure_engine, get_engine
+from database.shards import compact_shards, list_shards
+from scheduler import run_bulk_ingestion
+
+CHUNKS_PER_FILE = int(os.environ.get("BENCH_CHUNKS_PER_FILE", 500))
+CHUNK_SIZE = 4000
+
+
+def write_synthetic_file(file_name):
+    """Store CHUNKS_PER_FILE chunks and their processed texts, committing every 50 rows."""
+    with ChunkWriter(file_name, flush_every=50) as writer:
+        for page_number in range(1, CHUNKS_PER_FILE + 1):
+            writer.add_chunk("lorem ipsum " * (CHUNK_SIZE // 12), page_number)
+    chunks = get_unprocessed_chunks(file_name)
+    for start in range(0, len(chunks), 50):
+        batch = chunks[start:start + 50]
+        store_processed_text(file_name, [content[:1000] for _, content in batch], [chunk_id for chunk_id, _ in batch])
+    return CHUNKS_PER_FILE
+
+
+def run(mode, root, workers, files):
+    configure_engine(f"sqlite:///{os.path.join(root, f'{mode}.db')}")
+    initialize_database()
+    shard_dir = os.path.join(root, f"{mode}-shards") if mode == "sharded" else None
+    paths = [f"{mode}-file{number}.pdf" for number in range(files)]
+
+    summary = run_bulk_ingestion(paths, write_synthetic_file, workers=workers, shard_dir=shard_dir)
+    if summary["failures"]:
+        print(f"  {summary['failures']} files failed: {summary['failed_paths'][:3]}")
+    compaction = 0.0
+    if shard_dir:
+        compaction = compact_shards(list_shards(shard_dir))["seconds"]
+    rows = count_rows_across_shards(shard_paths=[])
+    get_engine().dispose()
+    return summary["seconds"], compaction, rows["text_chunks"] + rows["processed_texts"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded against single database ingestion.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--files", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"{'workers':>7}  {'single db':>10}  {'sharded':>10}  {'compaction':>10}  rows")
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as root:
+            single, _, single_rows = run("single", root, workers, args.files)
+            sharded, compaction, sharded_rows = run("sharded", root, workers, args.files)
+        print(f"{workers:>7}  {single:>9.1f}s  {sharded:>9.1f}s  {compaction:>9.1f}s  "
+              f"{single_rows} / {sharded_rows}")
+
+
+if __name__ == "__main__":
+    main()
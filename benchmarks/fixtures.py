@@ -0,0 +1,60 @@
+"""
+Small deterministic fixture databases for the benchmarks.
+
+Files hold chunks of synthetic prose, optionally with processed texts and float16 embeddings of
+seeded random vectors around a few directions, so clustering has structure to find. Everything is
+written through the db_utils helpers into the database the current engine points at.
+"""
+import numpy as np
+
+from benchmarks.synthetic_pdf import synthetic_text
+from database.db_utils import (initialize_database, ChunkWriter, store_processed_text, store_embeddings,
+                               get_unprocessed_chunks, get_unembedded_processed_texts)
+from database.embedding_codec import encode_embeddings
+
+CHUNK_CHARS = 2000
+EMBEDDING_DIM = 384
+
+
+def fixture_file_name(number):
+    return f"fixture-{number}.pdf"
+
+
+def synthetic_embeddings(count, dim=EMBEDDING_DIM, groups=16, seed=0):
+    """float32 vectors scattered around groups random directions."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((groups, dim)).astype(np.float32)
+    return centers[rng.integers(0, groups, count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+
+
+def build_fixture_db(files=2, chunks_per_file=500, processed=True, embedded=True, seed=0):
+    """
+    Fill the current database with fixture files.
+
+    Parameters:
+    - files (int, optional): Number of files. Default is 2.
+    - chunks_per_file (int, optional): Chunks of CHUNK_CHARS characters per file. Default is 500.
+    - processed (bool, optional): Store a processed text for every chunk. Default is True.
+    - embedded (bool, optional): Store an embedding for every processed text. Default is True.
+
+    Returns:
+    - list: The fixture file names.
+    """
+    initialize_database()
+    file_names = [fixture_file_name(number) for number in range(files)]
+    for number, file_name in enumerate(file_names):
+        with ChunkWriter(file_name) as writer:
+            for page_number in range(1, chunks_per_file + 1):
+                writer.add_chunk(synthetic_text(CHUNK_CHARS, seed=seed * 100003 + number * 10007 + page_number),
+                                 page_number)
+        if not processed:
+            continue
+        chunks = get_unprocessed_chunks(file_name)
+        store_processed_text(file_name, [content.lower() for _, content in chunks], [chunk_id for chunk_id, _ in chunks])
+        if not embedded:
+            continue
+        texts = get_unembedded_processed_texts(file_name)
+        vectors = synthetic_embeddings(len(texts), seed=seed + number)
+        store_embeddings([dict(encoded, file_name=file_name, chunk_id=text_id)
+                          for (text_id, _), encoded in zip(texts, encode_embeddings(vectors, "float16"))])
+    return file_names
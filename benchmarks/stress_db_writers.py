@@ -0,0 +1,96 @@
+"""
+Concurrency stress test of the database helpers: many threads writing and reading at once.
+
+Every thread ingests its own file through ChunkWriter, processes its chunks with
+store_processed_text and reads them back, the way enq.py worker threads do. Any
+"database is locked" error or leaked connection is counted. --legacy runs the same load
+without the SQLite PRAGMAs and with deferred write transactions, for comparison.
+
+Runs against a temporary SQLite database, from the repository root:
+    python -m benchmarks.stress_db_writers --threads 16 --files 4
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import func
+
+from database.db_utils import (initialize_database, ChunkWriter, get_unprocessed_chunks, store_processed_text,
+                               get_chunks_for_file, replace_clusters)
+from database.models import TextChunk, ProcessedText, Clusters
+from database.session import configure_engine, get_engine, session_scope
+
+
+def write_file(file_name, chunks, chunk_size, errors, lock):
+    try:
+        with ChunkWriter(file_name, flush_every=25) as writer:
+            for page_number in range(1, chunks + 1):
+                writer.add_chunk("x" * chunk_size, page_number)
+        unprocessed = get_unprocessed_chunks(file_name)
+        for start in range(0, len(unprocessed), 25):
+            batch = unprocessed[start:start + 25]
+            store_processed_text(file_name, [content.upper() for _, content in batch], [chunk_id for chunk_id, _ in batch])
+        replace_clusters([{"file_name": file_name, "chunk_id": chunk_id, "cluster_label": 0}
+                          for chunk_id, _ in unprocessed], file_name)
+        if len(get_chunks_for_file(file_name)) != chunks:
+            raise AssertionError(f"{file_name} lost chunks")
+    except Exception as error:
+        # Any failure counts, e.g. PendingRollbackError after a failed commit, not only lock errors
+        with lock:
+            errors.append(f"{file_name}: {type(error).__name__}: {str(error).splitlines()[0]}")
+
+
+def count_stored_rows():
+    """Rows actually stored, per table."""
+    with session_scope() as session:
+        return {model.__tablename__: session.query(func.count()).select_from(model).scalar()
+                for model in (TextChunk, ProcessedText, Clusters)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress the database helpers with concurrent writers.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--files", type=int, default=4, help="Files written by every thread.")
+    parser.add_argument("--chunks", type=int, default=200, help="Chunks per file.")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--legacy", action="store_true", help="Default SQLite settings and deferred writes.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        url = f"sqlite:///{os.path.join(root, 'stress.db')}"
+        if args.legacy:
+            configure_engine(url, pragmas={}, immediate_writes=False)
+        else:
+            configure_engine(url)
+        initialize_database()
+
+        errors = []
+        lock = threading.Lock()
+        threads = [threading.Thread(target=lambda thread=thread: [
+                       write_file(f"thread{thread}-file{file}.pdf", args.chunks, args.chunk_size, errors, lock)
+                       for file in range(args.files)])
+                   for thread in range(args.threads)]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+
+        pool = get_engine().pool
+        stored = count_stored_rows()
+        rows = sum(stored.values())
+        expected = args.threads * args.files * args.chunks * len(stored)
+        print(f"{'legacy' if args.legacy else 'configured'}: {args.threads} threads wrote {rows} of {expected} rows "
+              f"in {elapsed:.1f}s ({rows / elapsed:.0f} rows/sec)")
+        print("  " + ", ".join(f"{table}: {count}" for table, count in stored.items()))
+        print(f"errors: {len(errors)}   connections still checked out: {pool.checkedout()}")
+        for error in errors[:10]:
+            print(f"  {error}")
+        get_engine().dispose()
+
+
+if __name__ == "__main__":
+    main()
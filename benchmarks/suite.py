@@ -0,0 +1,298 @@
+"""
+Reproducible benchmark suite of the ingestion pipeline, with JSON baselines and regression checks.
+
+Every case runs in a fresh temporary directory and SQLite database, on deterministic synthetic
+PDFs (see benchmarks.synthetic_pdf) or fixture databases (see benchmarks.fixtures). Setup is not
+timed. Cases whose dependencies are missing (pdfplumber, pandas, the spaCy model) are recorded as
+skipped. Nothing is downloaded, everything runs offline on the CPU.
+
+Run from the repository root, save the results as a baseline, then compare a later run with it:
+    python -m benchmarks.suite run --output baseline.json
+    python -m benchmarks.suite run --output current.json --compare baseline.json --threshold 0.15
+    python -m benchmarks.suite compare baseline.json current.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixtures import build_fixture_db, fixture_file_name
+from benchmarks.synthetic_pdf import write_pdf
+from database import db_utils
+from database.session import configure_engine, get_engine
+
+DEFAULT_THRESHOLD = 0.15
+
+# Cases faster than this are dominated by noise, they are reported but never flagged
+MIN_SECONDS = 0.005
+
+
+def _get_data():
+    # get_data imports pdfplumber and PyPDF2 at module level
+    import get_data
+    return get_data
+
+
+def case_extract_text(pages):
+    def setup():
+        get_data = _get_data()
+        db_utils.initialize_database()
+        path = write_pdf("report.pdf", pages=pages, kind="text")
+        return lambda: get_data.extract_pdf_content_and_store(path)
+    return setup
+
+
+def case_extract_tables(pages):
+    def setup():
+        get_data = _get_data()
+        import pandas  # noqa: F401, extract_pdf_tables_and_store needs it
+        db_utils.initialize_database()
+        path = write_pdf("tables.pdf", pages=pages, kind="tables")
+
+        def run():
+            get_data.extract_pdf_tables_and_store(path)
+            return pages
+        return run
+    return setup
+
+
+def case_nlp(chunks):
+    def setup():
+        get_data = _get_data()
+        from model_registry import get_model
+        get_model("spacy")  # Loaded once, outside the timing
+        build_fixture_db(files=1, chunks_per_file=chunks, processed=False)
+        return lambda: get_data.retrieve_chunks_and_apply_nlp(fixture_file_name(0))
+    return setup
+
+
+def case_store_chunks(chunks):
+    def setup():
+        from benchmarks.synthetic_pdf import synthetic_text
+        db_utils.initialize_database()
+        texts = [synthetic_text(2000, seed=number) for number in range(chunks)]
+
+        def run():
+            with db_utils.ChunkWriter("store.pdf") as writer:
+                for page_number, text in enumerate(texts, start=1):
+                    writer.add_chunk(text, page_number)
+            return chunks
+        return run
+    return setup
+
+
+def case_store_processed_texts(chunks):
+    def setup():
+        file_name, = build_fixture_db(files=1, chunks_per_file=chunks, processed=False)
+        unprocessed = db_utils.get_unprocessed_chunks(file_name)
+
+        def run():
+            for start in range(0, len(unprocessed), 64):
+                batch = unprocessed[start:start + 64]
+                db_utils.store_processed_text(file_name, [content for _, content in batch],
+                                              [chunk_id for chunk_id, _ in batch])
+            return len(unprocessed)
+        return run
+    return setup
+
+
+def case_store_embeddings(chunks):
+    def setup():
+        from benchmarks.fixtures import synthetic_embeddings
+        from database.embedding_codec import encode_embeddings
+        file_name, = build_fixture_db(files=1, chunks_per_file=chunks, embedded=False)
+        texts = db_utils.get_unembedded_processed_texts(file_name)
+        rows = [dict(encoded, file_name=file_name, chunk_id=text_id)
+                for (text_id, _), encoded in zip(texts, encode_embeddings(synthetic_embeddings(len(texts)), "float16"))]
+
+        def run():
+            for start in range(0, len(rows), 512):
+                db_utils.store_embeddings(rows[start:start + 512])
+            return len(rows)
+        return run
+    return setup
+
+
+def case_get(getter, chunks, **fixture_options):
+    def setup():
+        # A second file, so the lookups have rows to skip
+        file_name = build_fixture_db(files=2, chunks_per_file=chunks, **fixture_options)[0]
+
+        def run():
+            return len(getter(file_name))
+        return run
+    return setup
+
+
+def case_cluster(chunks):
+    def setup():
+        from topic import cluster_embeddings
+        file_name, = build_fixture_db(files=1, chunks_per_file=chunks)
+        # Fixed k and no warm start, the silhouette search and earlier centroids would vary the work
+        return lambda: len(cluster_embeddings(file_name, n_clusters=16, warm_start=False))
+    return setup
+
+
+def build_cases(pages, chunks):
+    """name -> setup of every case. A setup returns the function to time, which returns its item count."""
+    cases = {}
+    for page_count in pages:
+        cases[f"extract_pdf_content_and_store[{page_count}p]"] = case_extract_text(page_count)
+        cases[f"extract_pdf_tables_and_store[{page_count}p]"] = case_extract_tables(page_count)
+    cases[f"retrieve_chunks_and_apply_nlp[{chunks}c]"] = case_nlp(chunks)
+    cases[f"ChunkWriter[{chunks}c]"] = case_store_chunks(chunks)
+    cases[f"store_processed_text[{chunks}c]"] = case_store_processed_texts(chunks)
+    cases[f"store_embeddings[{chunks}c]"] = case_store_embeddings(chunks)
+    for getter, fixture_options in ((db_utils.get_chunks_for_file, {}), (db_utils.get_processed_texts, {}),
+                                    (db_utils.get_unprocessed_chunks, {"processed": False}),
+                                    (db_utils.get_unembedded_processed_texts, {"embedded": False}),
+                                    (db_utils.get_embeddings_by_file, {})):
+        cases[f"{getter.__name__}[{chunks}c]"] = case_get(getter, chunks, **fixture_options)
+    cases[f"cluster_embeddings[{chunks}c]"] = case_cluster(chunks)
+    return cases
+
+
+def run_case(setup, repeats):
+    """Time a case repeats times, every repeat on a freshly set up directory and database."""
+    timings = []
+    items = 0
+    for _ in range(repeats):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as root:
+            os.chdir(root)
+            try:
+                configure_engine(f"sqlite:///{os.path.join(root, 'bench.db')}")
+                run = setup()
+                start_time = time.perf_counter()
+                items = run() or 0
+                timings.append(time.perf_counter() - start_time)
+            finally:
+                get_engine().dispose()
+                os.chdir(cwd)
+    median = statistics.median(timings)
+    return {"median": median, "min": min(timings), "runs": timings, "items": items,
+            "items_per_sec": items / median if median > 0 else 0.0}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "machine": platform.machine(),
+            "cpus": os.cpu_count(), "commit": commit}
+
+
+def run_suite(pages, chunks, repeats, only=None):
+    results = {}
+    for name, setup in build_cases(pages, chunks).items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        try:
+            results[name] = run_case(setup, repeats)
+        except ImportError as error:
+            results[name] = {"skipped": f"missing dependency: {error}"}
+        except OSError as error:
+            # e.g. the spaCy model isn't installed, it can't be downloaded offline
+            results[name] = {"skipped": str(error).splitlines()[0]}
+        result = results[name]
+        if "skipped" in result:
+            print(f"{name:<50} skipped ({result['skipped']})")
+        else:
+            print(f"{name:<50} {result['median'] * 1000:>10.1f} ms  {result['items_per_sec']:>10.1f} items/sec")
+    return {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment(),
+            "settings": {"pages": pages, "chunks": chunks, "repeats": repeats}, "results": results}
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the median timings of two runs.
+
+    Returns:
+    - list: (name, baseline seconds, current seconds, relative change, verdict) of every case timed in
+      both runs. The verdict is "regression" when the current run is more than threshold slower,
+      "improvement" when it is more than threshold faster, otherwise "ok".
+    """
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before or "skipped" in before or "skipped" in result:
+            continue
+        change = result["median"] / before["median"] - 1 if before["median"] > 0 else 0.0
+        verdict = "ok"
+        if max(before["median"], result["median"]) >= MIN_SECONDS:
+            if change > threshold:
+                verdict = "regression"
+            elif change < -threshold:
+                verdict = "improvement"
+        rows.append((name, before["median"], result["median"], change, verdict))
+    return rows
+
+
+def print_comparison(baseline, current, threshold):
+    if baseline["environment"].get("platform") != current["environment"].get("platform") or \
+            baseline["environment"].get("cpus") != current["environment"].get("cpus"):
+        print("warning: the baseline was recorded on a different machine, timings may not be comparable")
+    rows = compare(baseline, current, threshold)
+    print(f"\n{'case':<50} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, before, after, change, verdict in rows:
+        flag = "" if verdict == "ok" else f"  {verdict.upper()}"
+        print(f"{name:<50} {before * 1000:>8.1f}ms {after * 1000:>8.1f}ms {change:>+7.1%}{flag}")
+    regressions = [row for row in rows if row[4] == "regression"]
+    print(f"\n{len(regressions)} regressions beyond {threshold:.0%} in {len(rows)} compared cases")
+    return regressions
+
+
+def _load(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite of the ingestion pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks and write the results as JSON.")
+    run_parser.add_argument("--output", default="bench_results.json")
+    run_parser.add_argument("--pages", type=int, nargs="+", default=[10, 200],
+                            help="Page counts of the synthetic PDFs, up to 2000.")
+    run_parser.add_argument("--chunks", type=int, default=2000, help="Chunks of the fixture databases.")
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument("--only", nargs="+", help="Only run cases whose name contains one of these.")
+    run_parser.add_argument("--quick", action="store_true", help="10 pages, 200 chunks, one repeat.")
+    run_parser.add_argument("--compare", metavar="BASELINE", help="Compare the results with a baseline file.")
+    run_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Relative slowdown of the median flagged as a regression.")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if args.quick:
+            args.pages, args.chunks, args.repeats = [10], 200, 1
+        results = run_suite(args.pages, args.chunks, args.repeats, args.only)
+        with open(args.output, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f"Wrote {args.output}")
+        baseline_path = args.compare
+        current = results
+    else:
+        baseline_path = args.baseline
+        current = _load(args.current)
+
+    if baseline_path:
+        regressions = print_comparison(_load(baseline_path), current, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Deterministic synthetic PDFs for the benchmarks, written without any PDF library.
+
+Pages hold seeded pseudo-random report prose in Helvetica, table-heavy pages also hold ruled
+tables that pdfplumber's line based table finder detects. The same arguments always produce
+byte-identical files, so timings of different runs and machines are comparable.
+
+    python -m benchmarks.synthetic_pdf out.pdf --pages 200 --kind tables
+"""
+import argparse
+import random
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 72
+FONT_SIZE = 10
+LEADING = 12
+
+WORDS = (
+    "venture capital fund portfolio company investment round seed series growth equity valuation "
+    "founder market revenue customer product platform startup region report quarter annual deal "
+    "investor exit acquisition capital raised median average total share sector fintech agritech "
+    "healthtech logistics energy mobile payments lending insurance commerce climate nairobi lagos "
+    "cairo accra kigali johannesburg north south east west africa growth decline increase stable "
+    "early stage late stage debt grant angel syndicate limited partner general partner allocation "
+    "the of and in to for with by on from that this these were was is are has have had across"
+).split()
+
+TABLE_HEADER = ("Country", "Deals", "Capital", "Median", "Share")
+COUNTRIES = ("Kenya", "Nigeria", "Egypt", "Ghana", "Rwanda", "South Africa", "Senegal", "Morocco")
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+    words[0] = words[0].capitalize()
+    return " ".join(words) + "."
+
+
+def _text_lines(rng, line_count, width_chars=90):
+    """Lines of wrapped prose, about width_chars characters each."""
+    lines = []
+    line = ""
+    while len(lines) < line_count:
+        for word in _sentence(rng).split():
+            if len(line) + len(word) + 1 > width_chars:
+                lines.append(line)
+                line = ""
+            line = f"{line} {word}" if line else word
+    return lines[:line_count]
+
+
+def synthetic_text(chars, seed=0):
+    """Deterministic prose of about chars characters, e.g. for fixture chunks."""
+    rng = random.Random(f"text-{seed}")
+    sentences = []
+    length = 0
+    while length < chars:
+        sentences.append(_sentence(rng))
+        length += len(sentences[-1]) + 1
+    return " ".join(sentences)[:chars]
+
+
+def _text_ops(lines, top):
+    ops = [f"BT /F1 {FONT_SIZE} Tf {LEADING} TL {MARGIN} {top} Td"]
+    for line in lines:
+        ops.append(f"({_escape(line)}) Tj T*")
+    ops.append("ET")
+    return ops
+
+
+def _table_ops(rng, top, rows=8, column_width=90, row_height=18):
+    """A ruled table with a header row, its top left corner at (MARGIN, top)."""
+    columns = len(TABLE_HEADER)
+    width = columns * column_width
+    height = (rows + 1) * row_height
+    ops = ["0.5 w"]
+    for row in range(rows + 2):
+        y = top - row * row_height
+        ops.append(f"{MARGIN} {y} m {MARGIN + width} {y} l S")
+    for column in range(columns + 1):
+        x = MARGIN + column * column_width
+        ops.append(f"{x} {top} m {x} {top - height} l S")
+
+    cells = [TABLE_HEADER]
+    for _ in range(rows):
+        cells.append((rng.choice(COUNTRIES), str(rng.randint(1, 400)), f"{rng.uniform(0.5, 900):.1f}M",
+                      f"{rng.uniform(0.1, 20):.2f}M", f"{rng.uniform(0, 40):.1f}%"))
+    for row, values in enumerate(cells):
+        y = top - (row + 1) * row_height + 5
+        for column, value in enumerate(values):
+            ops.append(f"BT /F1 {FONT_SIZE - 1} Tf {MARGIN + column * column_width + 4} {y} Td "
+                       f"({_escape(value)}) Tj ET")
+    return ops, height
+
+
+def _page_content(rng, page_number, kind):
+    top = PAGE_HEIGHT - MARGIN
+    ops = _text_ops([f"Synthetic report page {page_number}"], top)
+    top -= 2 * LEADING
+    if kind == "tables":
+        # Two tables with a paragraph between them
+        for _ in range(2):
+            table_ops, height = _table_ops(rng, top)
+            ops += table_ops
+            top -= height + 2 * LEADING
+            lines = _text_lines(rng, 6)
+            ops += _text_ops(lines, top)
+            top -= (len(lines) + 2) * LEADING
+    else:
+        ops += _text_ops(_text_lines(rng, (top - MARGIN) // LEADING), top)
+    return "\n".join(ops).encode("latin-1")
+
+
+def write_pdf(path, pages=10, kind="text", seed=0):
+    """
+    Write a synthetic PDF.
+
+    Parameters:
+    - path (str): Where to write it.
+    - pages (int, optional): Number of pages. Default is 10.
+    - kind (str, optional): "text" for full pages of prose, "tables" for pages with two ruled
+      tables each. Default is "text".
+    - seed (int, optional): Seed of the page contents. Default is 0.
+
+    Returns:
+    - str: path.
+    """
+    if kind not in ("text", "tables"):
+        raise ValueError(f"Unknown kind {kind!r}, expected 'text' or 'tables'")
+    rng = random.Random(f"{kind}-{seed}")
+
+    # Objects 1-3 are the catalog, the page tree and the font, then a page and its content per page
+    page_ids = [4 + 2 * number for number in range(pages)]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] /Count {pages} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for number, page_id in enumerate(page_ids, start=1):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode())
+        content = _page_content(rng, number, kind)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for object_id, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % object_id + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+
+    with open(path, "wb") as pdf_file:
+        pdf_file.write(output)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic PDF.")
+    parser.add_argument("path")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--kind", choices=["text", "tables"], default="text")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_pdf(args.path, pages=args.pages, kind=args.kind, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
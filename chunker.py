@@ -0,0 +1,112 @@
+import re
+
+# spaCy refuses texts longer than nlp.max_length (1,000,000 by default), stay below it
+MAX_CHUNK_SIZE = 900000
+
+# Paragraph breaks, or whitespace following the end of a sentence
+_BOUNDARY = re.compile(r'\n\s*\n|(?<=[.!?])\s+')
+
+# Separators units are joined with in a chunk
+PARAGRAPH_BREAK = "\n\n"
+SENTENCE_BREAK = " "
+# Pages of a document are joined with a newline, as in get_data.extract_text_from_pdf
+PAGE_BREAK = "\n"
+
+
+def split_units(text):
+    """Split text into sentence or paragraph sized units, dropping the whitespace between them."""
+    return [unit for _, unit in _split_with_separators(text)]
+
+
+def _split_with_separators(text):
+    """(separator, unit) of every unit of text, separator being the break before it or None if nothing precedes it."""
+    separator = None
+    position = 0
+    for match in _BOUNDARY.finditer(text):
+        unit = text[position:match.start()]
+        if unit and not unit.isspace():
+            yield separator, unit
+            separator = None
+        # Of the breaks between two units (around a blank unit), the paragraph break wins
+        if separator != PARAGRAPH_BREAK:
+            separator = PARAGRAPH_BREAK if match.group().count("\n") >= 2 else SENTENCE_BREAK
+        position = match.end()
+    unit = text[position:]
+    if unit and not unit.isspace():
+        yield separator, unit
+
+
+def _hard_split(unit, chunk_size):
+    """Split a unit that is larger than a chunk on whitespace, or anywhere if it has none."""
+    while len(unit) > chunk_size:
+        cut = unit.rfind(' ', 0, chunk_size)
+        if cut <= 0:
+            cut = chunk_size
+        yield unit[:cut]
+        unit = unit[cut:].lstrip()
+    if unit:
+        yield unit
+
+
+def chunk_pages(pages, chunk_size=100000, overlap=0):
+    """
+    Stream pages of text into sentence bounded chunks.
+
+    Sentences are joined with a space and paragraphs with a blank line, so the chunks keep the
+    paragraph structure of the text.
+
+    Only the current chunk and the page being read are held in memory, so memory use does not
+    depend on the size of the document.
+
+    Parameters:
+    - pages (iterable): (page_number, text) tuples, in page order.
+    - chunk_size (int, optional): Maximum number of characters in a chunk. Default is 100000.
+    - overlap (int, optional): Number of characters of trailing sentences repeated at the start of
+      the next chunk. Default is 0.
+
+    Yields:
+    - dict: text of the chunk with the start_page and end_page it was taken from.
+    """
+    chunk_size = min(chunk_size, MAX_CHUNK_SIZE)
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+
+    units = []  # (separator, text, page_number) of the sentences in the current chunk
+    length = 0  # Length of the current chunk, the separator of its first unit left out
+
+    def emit():
+        return {
+            "text": units[0][1] + "".join(separator + text for separator, text, _ in units[1:]),
+            "start_page": units[0][2],
+            "end_page": units[-1][2],
+        }
+
+    for page_number, text in pages:
+        page_break = PAGE_BREAK
+        for separator, sentence in _split_with_separators(text or ""):
+            separator = separator or page_break
+            page_break = None
+            for unit in _hard_split(sentence, chunk_size):
+                if units and length + len(separator) + len(unit) > chunk_size:
+                    yield emit()
+
+                    # Carry the trailing sentences over, as long as they leave room for this unit
+                    carried = []
+                    carried_length = 0
+                    for kept in reversed(units):
+                        kept_length = len(kept[1]) + (len(carried[-1][0]) if carried else 0)
+                        if (carried_length + kept_length > overlap
+                                or carried_length + kept_length + len(separator) + len(unit) > chunk_size):
+                            break
+                        carried.append(kept)
+                        carried_length += kept_length
+                    units = carried[::-1]
+                    length = carried_length
+
+                units.append((separator, unit, page_number))
+                length += len(unit) + (len(separator) if len(units) > 1 else 0)
+                # Pieces of a split unit were cut at whitespace
+                separator = SENTENCE_BREAK
+
+    if units:
+        yield emit()
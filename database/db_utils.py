@@ -1,243 +1,777 @@
-from sqlalchemy.orm import sessionmaker
-from database.models import engine, TextChunk, File, ProcessedText, ExtractedTable, Entity, Topics, Embeddings, Clusters
+import threading
+from itertools import repeat
+
+import numpy as np
+from sqlalchemy import exists, func
+from database.models import (TextChunk, File, ProcessedText, ExtractedTable, Entity, Topics, Embeddings,
+                             Clusters, ChunkTopic)
 from logging_util import logger
+from metrics import metrics
+from database.session import get_engine, session_scope, WriteSession
+from database.shards import query_shards
+from database.embedding_codec import decode_embeddings
+from database.vector_store import VectorStore
+from database.vector_index import IVFIndex
 from utility import table_to_string
 
-Session = sessionmaker(bind=engine)
+# (database URL, file name) -> files.id. File rows are never deleted, so a cached id stays valid.
+_file_ids = {}
+_file_ids_lock = threading.Lock()
+
+def _count_written(table, rows, content_key=None):
+    """Count committed rows of a table, and the size of their content column (characters of text, bytes of blobs)."""
+    if not rows:
+        return
+    metrics.inc("rows_written_total", len(rows), table=table)
+    if content_key:
+        metrics.inc("bytes_written_total", sum(len(row[content_key] or "") for row in rows), table=table)
 
 def initialize_database():
     # This will create all tables that don't exist yet, based on your models
-    File.metadata.create_all(engine)
+    File.metadata.create_all(get_engine())
 
 def store_file_with_chunks(file_name, text_chunks):
-    session = Session()
-    
-    # Query the database to check if a file with the given file_name already exists
-    file_entry = session.query(File).filter_by(file_name=file_name).first()
-
-    # If the file does not exist, create a new file entry
-    if not file_entry:
-        file_entry = File(file_name=file_name)
-        session.add(file_entry)
-        session.flush()  # This will ensure that file_entry gets an ID even if not committed yet
-
-    # For each chunk in text_chunks, create a TextChunk entry associated with the file
-    
-    chunk_entry = TextChunk(chunk_content=text_chunks, file=file_entry)
-    session.add(chunk_entry)
-
-    session.commit()
-    session.close()
+    with session_scope(write=True) as session:
+        # Query the database to check if a file with the given file_name already exists
+        file_entry = session.query(File).filter_by(file_name=file_name).first()
+
+        # If the file does not exist, create a new file entry
+        if not file_entry:
+            file_entry = File(file_name=file_name)
+            session.add(file_entry)
+            session.flush()  # This will ensure that file_entry gets an ID even if not committed yet
+
+        # For each chunk in text_chunks, create a TextChunk entry associated with the file
+
+        chunk_entry = TextChunk(chunk_content=text_chunks, file=file_entry)
+        session.add(chunk_entry)
+
+
+class ChunkWriter:
+    """
+    Buffers the text chunks and tables of one file and writes them in bulk.
+
+    The File row is resolved once, rows are inserted with bulk_insert_mappings and
+    committed every ``flush_every`` rows (or once, when the writer is closed, if
+    ``flush_every`` is None). ``on_flush`` is called with the writer after every
+    commit, so callers can record how far a file got.
+
+    Usage:
+        with ChunkWriter(pdf_path) as writer:
+            writer.add_chunk(text)
+    """
+
+    def __init__(self, file_name, flush_every=500, on_flush=None):
+        self.file_name = file_name
+        self.flush_every = flush_every
+        self.on_flush = on_flush
+        self.rows_written = 0
+        self._chunks = []
+        self._tables = []
+        self.session = WriteSession()
+
+        # Resolve the file once instead of once per chunk
+        self.file_id = get_file_id(file_name)
+        if self.file_id is None:
+            file_entry = File(file_name=file_name)
+            self.session.add(file_entry)
+            # Committed right away, a failed flush is rolled back and must not take the file with it
+            self.session.commit()
+            self.file_id = file_entry.id
+
+    def add_chunk(self, text_chunk, page_number=None, page_hash=None, end_page_number=None):
+        self._chunks.append({"chunk_content": text_chunk, "file_id": self.file_id,
+                             "page_number": page_number, "page_hash": page_hash,
+                             "end_page_number": end_page_number or page_number})
+        self._maybe_flush()
+
+    def add_tables(self, tables_batch, page_number=None):
+        for table in tables_batch:
+            self._tables.append({"content": table_to_string(table), "file_id": self.file_id,
+                                 "page_number": page_number})
+        self._maybe_flush()
+
+    def set_content_hash(self, content_hash, tables=False):
+        """
+        Record the file hash, committed together with the last buffered rows. With tables, also
+        record that the tables of every page are stored.
+        """
+        values = {"content_hash": content_hash}
+        if tables:
+            values["tables_hash"] = content_hash
+        self.session.query(File).filter_by(id=self.file_id).update(values)
+
+    def _maybe_flush(self):
+        if self.flush_every and len(self._chunks) + len(self._tables) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Insert the buffered rows and commit them. If that fails the transaction is rolled back and
+        the rows stay buffered, so the session is usable again and a later flush can retry them.
+        """
+        try:
+            if self._chunks:
+                self.session.bulk_insert_mappings(TextChunk, self._chunks)
+            if self._tables:
+                self.session.bulk_insert_mappings(ExtractedTable, self._tables)
+            self.session.commit()
+        except BaseException:
+            self.session.rollback()
+            raise
+        _count_written("text_chunks", self._chunks, "chunk_content")
+        _count_written("extracted_tables", self._tables, "content")
+
+        self.rows_written += len(self._chunks) + len(self._tables)
+        self._chunks = []
+        self._tables = []
+        if self.on_flush:
+            self.on_flush(self)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return False
+        # Rows extracted before a failure are still valid, try to keep them. The file hash is
+        # dropped, the file wasn't stored completely, and the original error always propagates.
+        try:
+            self.session.rollback()
+            self.flush()
+        except Exception as error:
+            logger.warning("Couldn't store the %d buffered rows of %s after an error: %s",
+                           len(self._chunks) + len(self._tables), self.file_name, error)
+        finally:
+            self.session.close()
+        return False
 
 
 def store_chunk(text_chunk):
-    session = Session()
-    chunk = TextChunk(chunk_content=text_chunk)
-    session.add(chunk)
-    session.commit()
-    session.close()
+    with session_scope(write=True) as session:
+        session.add(TextChunk(chunk_content=text_chunk))
+
+def get_file_id(file_name):
+    """Resolve a file name to its files.id, or None for unknown files. Found ids are cached per database."""
+    key = (str(get_engine().url), file_name)
+    file_id = _file_ids.get(key)
+    if file_id is None:
+        with session_scope() as session:
+            file_id = session.query(File.id).filter(File.file_name == file_name).scalar()
+        if file_id is not None:
+            with _file_ids_lock:
+                _file_ids[key] = file_id
+    return file_id
+
+def _iter_by_id(id_column, columns, filters, batch_size=500, start_after=None, stop_at=None):
+    """
+    Yield (id, *columns) rows in id order, one query of at most batch_size rows at a time.
+
+    Every query resumes after the last id it returned (keyset pagination) and runs in its own short
+    session, so memory stays bounded by batch_size, no read transaction is held open while the caller
+    works on a batch, and rows the caller writes in between don't disturb the iteration.
+
+    Parameters:
+    - start_after (int, optional): Only yield rows with a larger id, e.g. the last id a previous run handled.
+    - stop_at (int, optional): Only yield rows up to and including this id.
+    """
+    last_id = start_after
+    while True:
+        with session_scope() as session:
+            query = session.query(id_column, *columns).filter(*filters)
+            if last_id is not None:
+                query = query.filter(id_column > last_id)
+            if stop_at is not None:
+                query = query.filter(id_column <= stop_at)
+            rows = query.order_by(id_column).limit(batch_size).all()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+def iter_chunks(file_name, batch_size=500, start_after=None, stop_at=None, unprocessed_only=False):
+    """
+    Stream (chunk_id, page_number, chunk_content) of the chunks of a file in id order.
+
+    Chunk ids follow the page order of the ingestion that stored them. See _iter_by_id for batch_size,
+    start_after and stop_at. With unprocessed_only, chunks that have a processed text are skipped.
+    """
+    file_id = get_file_id(file_name)
+    if file_id is None:
+        logger.error("No file found with name: %s", file_name)
+        return
+    filters = [TextChunk.file_id == file_id]
+    if unprocessed_only:
+        filters.append(~exists().where(ProcessedText.text_chunk_id == TextChunk.id))
+    yield from _iter_by_id(TextChunk.id, (TextChunk.page_number, TextChunk.chunk_content), filters,
+                           batch_size, start_after, stop_at)
+
+
+def iter_tables(file_name, batch_size=500, start_after=None, stop_at=None):
+    """Stream (table_id, page_number, content) of the extracted tables of a file in id order, see _iter_by_id."""
+    file_id = get_file_id(file_name)
+    if file_id is None:
+        logger.error("No file found with name: %s", file_name)
+        return
+    yield from _iter_by_id(ExtractedTable.id, (ExtractedTable.page_number, ExtractedTable.content),
+                           [ExtractedTable.file_id == file_id], batch_size, start_after, stop_at)
 
 # In db_utils.py or equivalent
 
 def get_chunks_for_file(file_name):
     """Retrieve chunks associated with a file from the database."""
-    session = Session()
-    file_entry = session.query(File).filter_by(file_name=file_name).first()
-    if not file_entry:
-        logger.error(f"No file found with name: {file_name}")
-        session.close()
-        return []
-    
-    chunks = [chunk.chunk_content for chunk in file_entry.chunks]
-    session.close()
-    return chunks
-
-def store_processed_text(file_name, processed_data):
-    """Store the processed NLP data in the database."""
-    session = Session()
-    file_entry = session.query(File).filter_by(file_name=file_name).first()
-    if not file_entry:
-        logger.error(f"No file found with name: {file_name}")
-        session.close()
+    return [content for _, _, content in iter_chunks(file_name)]
+
+def get_file_hashes(file_name):
+    """
+    Return the stored hashes of a file.
+
+    Returns:
+    - tuple: (content_hash, {page_number: page_hash}, has_untracked_chunks). The content
+      hash is None for unknown files or files whose last ingestion did not finish.
+      has_untracked_chunks is True when chunks were stored without a page number.
+    """
+    file_id = get_file_id(file_name)
+    if file_id is None:
+        return None, {}, False
+
+    with session_scope() as session:
+        content_hash = session.query(File.content_hash).filter(File.id == file_id).scalar()
+        page_hashes = {}
+        has_untracked_chunks = False
+        rows = session.query(TextChunk.page_number, TextChunk.page_hash).filter(TextChunk.file_id == file_id)
+        for page_number, page_hash in rows:
+            if page_number is None:
+                has_untracked_chunks = True
+            else:
+                page_hashes[page_number] = page_hash
+    return content_hash, page_hashes, has_untracked_chunks
+
+
+def invalidate_pages(file_name, page_numbers, drop_untracked=False):
+    """
+    Delete the chunks and tables of the given pages together with everything derived from them.
+
+    Processed texts of the deleted chunks are removed along with their embeddings, clusters and
+    entities, so only the changed pages have to go through NLP again. Processed texts that are not
+    linked to a chunk cannot be attributed to a page and are dropped as well. With drop_untracked,
+    chunks and tables stored without a page number are deleted too.
+
+    Returns:
+    - int: Number of deleted chunks.
+    """
+    file_id = get_file_id(file_name)
+    if file_id is None:
+        return 0
+
+    with session_scope(write=True) as session:
+        page_numbers = list(page_numbers)
+        chunk_filter = TextChunk.page_number.in_(page_numbers)
+        table_filter = ExtractedTable.page_number.in_(page_numbers)
+        if drop_untracked:
+            chunk_filter = chunk_filter | TextChunk.page_number.is_(None)
+            table_filter = table_filter | ExtractedTable.page_number.is_(None)
+
+        chunk_ids = [row.id for row in session.query(TextChunk.id).filter(TextChunk.file_id == file_id, chunk_filter)]
+
+        processed_filter = ProcessedText.text_chunk_id.is_(None)
+        if chunk_ids:
+            processed_filter = processed_filter | ProcessedText.text_chunk_id.in_(chunk_ids)
+        processed_ids = [row.id for row in session.query(ProcessedText.id).filter(ProcessedText.file_id == file_id, processed_filter)]
+
+        if processed_ids:
+            for model in (Embeddings, Clusters, Entity, ChunkTopic):
+                session.query(model).filter(model.chunk_id.in_(processed_ids)).delete(synchronize_session=False)
+            # The sidecar store is append-only, it is rebuilt from the table on the next read
+            VectorStore(file_name).drop()
+            session.query(ProcessedText).filter(ProcessedText.id.in_(processed_ids)).delete(synchronize_session=False)
+        if chunk_ids:
+            session.query(TextChunk).filter(TextChunk.id.in_(chunk_ids)).delete(synchronize_session=False)
+        session.query(ExtractedTable).filter(ExtractedTable.file_id == file_id, table_filter).delete(synchronize_session=False)
+
+        # The file is only up to date again once the changed pages are stored, and the tables of the
+        # changed pages are gone until an extraction with tables stores them again
+        session.query(File).filter(File.id == file_id).update({"content_hash": None, "tables_hash": None},
+                                                              synchronize_session=False)
+
+    # The search index is append-only too, its rows of the deleted texts are tombstoned
+    IVFIndex().remove(processed_ids)
+    logger.info("Invalidated %d chunks and %d processed texts of %s", len(chunk_ids), len(processed_ids), file_name)
+    return len(chunk_ids)
+
+
+def get_unprocessed_chunks(file_name):
+    """Retrieve (chunk_id, chunk_content) of the chunks of a file that have no processed text yet."""
+    return [(chunk_id, content) for chunk_id, _, content in iter_chunks(file_name, unprocessed_only=True)]
+
+
+def get_tables_hash(file_name):
+    """The content hash of the file its tables were extracted for, None if they never were completely."""
+    file_id = get_file_id(file_name)
+    if file_id is None:
+        return None
+    with session_scope() as session:
+        return session.query(File.tables_hash).filter(File.id == file_id).scalar()
+
+
+def delete_tables(file_name, page_numbers):
+    """Delete the extracted tables of the given pages of a file, before they are extracted again."""
+    file_id = get_file_id(file_name)
+    if file_id is None or not page_numbers:
+        return
+    with session_scope(write=True) as session:
+        session.query(ExtractedTable).filter(ExtractedTable.file_id == file_id,
+                                             ExtractedTable.page_number.in_(list(page_numbers))
+                                             ).delete(synchronize_session=False)
+
+
+def store_processed_text(file_name, processed_data, chunk_ids=None):
+    """Store the processed NLP data in the database.
+
+    chunk_ids, when given, holds the id of the TextChunk each entry of processed_data came from.
+    """
+    file_id = get_file_id(file_name)
+    if file_id is None:
+        logger.error("No file found with name: %s", file_name)
         return
-    
-    for data in processed_data:
-        processed_text_entry = ProcessedText(content=data, file=file_entry)
-        session.add(processed_text_entry)
-    
-    session.commit()
-    session.close()
+
+    if chunk_ids is None:
+        chunk_ids = repeat(None)
+    rows = [{"content": data, "file_id": file_id, "text_chunk_id": chunk_id}
+            for data, chunk_id in zip(processed_data, chunk_ids)]
+    with session_scope(write=True) as session:
+        session.bulk_insert_mappings(ProcessedText, rows)
+    _count_written("processed_texts", rows, "content")
 
 def get_processed_texts(file_name):
-    session = Session()
-    # This query will retrieve the File record and its related ProcessedText records
-    file_with_texts = session.query(File).filter(File.file_name == file_name).first()
-
-    if file_with_texts is not None:
-        processed_texts = [text.content for text in file_with_texts.processed_texts]
-        return processed_texts
-    else:
-        logger.warn(f"No file found with ID: {file_name}")
+    return list(iter_processed_texts(file_name))
+
+
+
+def iter_processed_texts(file_name, batch_size=500, with_ids=False, start_after=None, stop_at=None,
+                         unembedded_only=False):
+    """
+    Stream the processed texts of a file in id order, see _iter_by_id.
+
+    Yields the contents, or (processed_text_id, content) tuples with_ids. With unembedded_only,
+    processed texts that have an embedding are skipped.
+    """
+    file_id = get_file_id(file_name)
+    if file_id is None:
+        logger.warning("No file found with name: %s", file_name)
+        return
+    filters = [ProcessedText.file_id == file_id]
+    if unembedded_only:
+        filters.append(~exists().where(Embeddings.chunk_id == ProcessedText.id))
+    for processed_text_id, content in _iter_by_id(ProcessedText.id, (ProcessedText.content,), filters,
+                                                  batch_size, start_after, stop_at):
+        yield (processed_text_id, content) if with_ids else content
+
+
+def get_unembedded_processed_texts(file_name):
+    """Retrieve (processed_text_id, content) of the processed texts of a file that have no embedding yet."""
+    file_id = get_file_id(file_name)
+    if file_id is None:
+        logger.error("No file found with name: %s", file_name)
         return []
 
+    with session_scope() as session:
+        embedded = session.query(Embeddings.chunk_id).filter(Embeddings.file_name == file_name)
+        texts = (session.query(ProcessedText.id, ProcessedText.content)
+                 .filter(ProcessedText.file_id == file_id, ~ProcessedText.id.in_(embedded))
+                 .order_by(ProcessedText.id)
+                 .all())
+    return [(text_id, content) for text_id, content in texts]
 
 
 # In db_utils.py or equivalent
 
+def get_file_backlog(file_name):
+    """
+    Count the work the pipeline stages (see pipeline.py) still have to do for a file.
+
+    Returns:
+    - dict: chunks, unprocessed (chunks without a processed text), unembedded (processed texts
+      without an embedding), unclustered (embeddings without a per-file cluster label) and without_topics
+      (processed texts without chunk topics). None for unknown files.
+    """
+    file_id = get_file_id(file_name)
+    if file_id is None:
+        return None
+
+    with session_scope() as session:
+        texts = session.query(ProcessedText.id).filter(ProcessedText.file_id == file_id)
+        embedded = session.query(Embeddings.chunk_id).filter(Embeddings.file_name == file_name)
+        return {
+            "chunks": session.query(func.count(TextChunk.id)).filter(TextChunk.file_id == file_id).scalar(),
+            "unprocessed": session.query(func.count(TextChunk.id)).filter(
+                TextChunk.file_id == file_id,
+                ~exists().where(ProcessedText.text_chunk_id == TextChunk.id)).scalar(),
+            "unembedded": texts.filter(~ProcessedText.id.in_(embedded)).count(),
+            "unclustered": session.query(func.count(Embeddings.id)).filter(
+                Embeddings.file_name == file_name,
+                ~exists().where(Clusters.scope == "file", Clusters.chunk_id == Embeddings.chunk_id)).scalar(),
+            "without_topics": texts.filter(~exists().where(ChunkTopic.chunk_id == ProcessedText.id)).count(),
+        }
+
+
 def store_extracted_tables(file_name, tables_batch):
     """Store a batch of extracted tables in the database."""
-    session = Session()
-    
-    # Check if the file entry exists in the database
-    file_entry = session.query(File).filter_by(file_name=file_name).first()
-    if not file_entry:
-        file_entry = File(file_name=file_name)
-        session.add(file_entry)
-        session.flush()  # To ensure ID is generated if this is a new entry
+    with session_scope(write=True) as session:
+        # Check if the file entry exists in the database
+        file_entry = session.query(File).filter_by(file_name=file_name).first()
+        if not file_entry:
+            file_entry = File(file_name=file_name)
+            session.add(file_entry)
+            session.flush()  # To ensure ID is generated if this is a new entry
 
-    # For each table in tables_batch, create an ExtractedTable entry associated with the file
-    for table in tables_batch:
-        table_string = table_to_string(table)
-        table_entry = ExtractedTable(content=table_string, file=file_entry)
-        session.add(table_entry)
-
-    session.commit()
-    session.close()
+        # For each table in tables_batch, create an ExtractedTable entry associated with the file
+        for table in tables_batch:
+            table_string = table_to_string(table)
+            table_entry = ExtractedTable(content=table_string, file=file_entry)
+            session.add(table_entry)
 
 
 def get_tables_for_file(file_name):
     """Retrieve tables associated with a file from the database."""
-    session = Session()
-    file_entry = session.query(File).filter_by(file_name=file_name).first()
-    if not file_entry:
-        logger.error(f"No file found with name: {file_name}")
-        session.close()
-        return []
-    
-    tables = [table.content for table in file_entry.extracted_tables]
-    session.close()
-    return tables
+    return [content for _, _, content in iter_tables(file_name)]
 
 
 def get_entities_by_file(file_name):
-    db_session = Session()
-    entities = db_session.query(Entity).join(Entity.chunk).join(TextChunk.file).filter(File.file_name == file_name).all()
-    
+    file_id = get_file_id(file_name)
+    if file_id is None:
+        return []
+    with session_scope() as db_session:
+        # processed_texts by its file_id index, then entities by their chunk_id index
+        entities = (db_session.query(Entity.entity_text, Entity.entity_label, Entity.chunk_id)
+                    .join(ProcessedText, Entity.chunk_id == ProcessedText.id)
+                    .filter(ProcessedText.file_id == file_id)
+                    .all())
+
     # Convert entities to a list of dictionaries
-    entity_list = []
-    for entity in entities:
-        entity_dict = {
-            "entity_text": entity.entity_text,
-            "entity_label": entity.entity_label,
-            "chunk_id": entity.chunk_id
-        }
-        entity_list.append(entity_dict)
-    
-    return entity_list
+    return [{"entity_text": entity_text, "entity_label": entity_label, "chunk_id": chunk_id}
+            for entity_text, entity_label, chunk_id in entities]
 
 # Function to store entities in the database
 def store_entities(entities, chunk_id):
-    db_session = Session()
-    for entity in entities:
-        new_entity = Entity(
-            entity_text=entity["entity_text"],
-            entity_label=entity["entity_label"],
-            chunk_id=chunk_id
-        )
-        db_session.add(new_entity)
-    
-    # Commit the changes to the database
-    db_session.commit()
+    with session_scope(write=True) as db_session:
+        for entity in entities:
+            new_entity = Entity(
+                entity_text=entity["entity_text"],
+                entity_label=entity["entity_label"],
+                chunk_id=chunk_id
+            )
+            db_session.add(new_entity)
 
 
 
 # Function to fetch topics by file name
 def get_topics_by_file(file_name):
-    db_session = Session()
-    topics = db_session.query(Topics).filter(Topics.file_name == file_name).all()
-    
-    # Convert topics to a list of dictionaries
-    topic_list = []
-    for topic in topics:
-        topic_dict = {
-            "file_name": topic.file_name,
-            "topic": topic.topic
-        }
-        topic_list.append(topic_dict)
-    
+    with session_scope() as db_session:
+        topics = db_session.query(Topics).filter(Topics.file_name == file_name).all()
+
+        # Convert topics to a list of dictionaries
+        topic_list = []
+        for topic in topics:
+            topic_dict = {
+                "file_name": topic.file_name,
+                "topic": topic.topic
+            }
+            topic_list.append(topic_dict)
+
     return topic_list
 
 
 def get_embeddings_by_file(file_name):
-    db_session = Session()
-    embeddings = db_session.query(Embeddings).join(Embeddings.chunk).join(ProcessedText.file).filter(File.file_name == file_name).all()
-    
-    # Convert embeddings to a list of dictionaries
-    embedding_list = []
-    for embedding in embeddings:
-        embedding_dict = {
-            "file_name": embedding.file_name,
-            "chunk_id": embedding.chunk_id,
-            "embedding": embedding.embedding  # Assuming you want to retrieve embeddings as binary data
-        }
-        embedding_list.append(embedding_dict)
-    
-    return embedding_list
+    with session_scope() as db_session:
+        # Served by the (file_name, chunk_id) index, no join needed
+        embeddings = (db_session.query(Embeddings.chunk_id, Embeddings.embedding)
+                      .filter(Embeddings.file_name == file_name)
+                      .order_by(Embeddings.chunk_id)
+                      .all())
+
+    # Convert embeddings to a list of dictionaries, the embeddings stay encoded (see get_embedding_matrix)
+    return [{"file_name": file_name, "chunk_id": chunk_id, "embedding": embedding} for chunk_id, embedding in embeddings]
+
+
+def get_embedding_matrix(file_name=None):
+    """
+    Load embeddings as one contiguous float32 matrix.
+
+    Parameters:
+    - file_name (str, optional): Only load the embeddings of this file. Default is None, every embedding.
+
+    Returns:
+    - tuple: (matrix of shape (n, dim), int64 array of the n ProcessedText ids), both ordered by chunk id.
+    """
+    with session_scope() as db_session:
+        query = db_session.query(Embeddings.chunk_id, Embeddings.embedding, Embeddings.dtype,
+                                 Embeddings.dim, Embeddings.scale)
+        if file_name:
+            query = query.filter(Embeddings.file_name == file_name)
+        rows = query.order_by(Embeddings.chunk_id).all()
+
+    if not rows:
+        return np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64)
+
+    chunk_ids, blobs, dtypes, dims, scales = zip(*rows)
+    chunk_ids = np.array(chunk_ids, dtype=np.int64)
+    dtypes = [dtype or "float32" for dtype in dtypes]
+
+    if len(set(dtypes)) == 1:
+        return decode_embeddings(blobs, dtypes[0], dims[0], scales), chunk_ids
+
+    # Embeddings written with different settings, decode each dtype separately
+    parts = {}
+    for dtype in set(dtypes):
+        index = [i for i, row_dtype in enumerate(dtypes) if row_dtype == dtype]
+        parts[dtype] = (index, decode_embeddings([blobs[i] for i in index], dtype, dims[index[0]],
+                                                 [scales[i] for i in index]))
+    dim = {part.shape[1] for _, part in parts.values()}
+    if len(dim) != 1:
+        raise ValueError(f"Embeddings have mixed dimensions: {sorted(dim)}")
+    matrix = np.empty((len(rows), dim.pop()), dtype=np.float32)
+    for index, part in parts.values():
+        matrix[index] = part
+    return matrix, chunk_ids
+
+
+def check_vector_store(file_name):
+    """
+    Compare the sidecar vector store of a file with its rows in the embeddings table.
+
+    Returns:
+    - dict: file_name, db_count, store_count, missing (ids only in the table), extra (ids only in
+      the store) and consistent.
+    """
+    with session_scope() as db_session:
+        db_ids = {chunk_id for chunk_id, in db_session.query(Embeddings.chunk_id).filter(Embeddings.file_name == file_name)}
+
+    _, store_ids = VectorStore(file_name).load()
+    store_ids = set(store_ids.tolist())
+    missing = db_ids - store_ids
+    extra = store_ids - db_ids
+    return {
+        "file_name": file_name,
+        "db_count": len(db_ids),
+        "store_count": len(store_ids),
+        "missing": sorted(missing),
+        "extra": sorted(extra),
+        "consistent": not missing and not extra,
+    }
+
+
+def rebuild_vector_store(file_name):
+    """Rewrite the sidecar vector store of a file from the embeddings table. Returns the number of vectors."""
+    matrix, chunk_ids = get_embedding_matrix(file_name)
+    VectorStore(file_name).rewrite(chunk_ids, matrix)
+    logger.info("Rebuilt vector store of %s with %d vectors", file_name, len(chunk_ids))
+    return len(chunk_ids)
+
+
+def count_embeddings():
+    with session_scope() as db_session:
+        return db_session.query(Embeddings.id).count()
+
+
+def get_processed_texts_by_ids(processed_text_ids):
+    """Retrieve {processed_text_id: (file_name, content)} for the given ids, unknown ids are left out."""
+    if not processed_text_ids:
+        return {}
+    with session_scope() as db_session:
+        rows = (db_session.query(ProcessedText.id, File.file_name, ProcessedText.content)
+                .join(File, ProcessedText.file_id == File.id)
+                .filter(ProcessedText.id.in_(processed_text_ids))
+                .all())
+    return {text_id: (file_name, content) for text_id, file_name, content in rows}
+
+
+def get_embedded_file_names():
+    with session_scope() as db_session:
+        return [file_name for file_name, in db_session.query(Embeddings.file_name).distinct()]
+
+
+def load_file_vectors(file_name):
+    """
+    Memory-map the embeddings of a file from its sidecar store.
+
+    The store is append-only, so deleted embeddings leave it with more rows than the table. If the
+    row counts differ the store is rebuilt from the table first.
+
+    Returns:
+    - tuple: (float32 matrix of shape (n, dim), int64 array of the n ProcessedText ids).
+    """
+    store = VectorStore(file_name)
+    with session_scope() as db_session:
+        db_count = db_session.query(Embeddings.id).filter(Embeddings.file_name == file_name).count()
+
+    if store.count() != db_count:
+        logger.info("Vector store of %s is out of date, rebuilding it", file_name)
+        rebuild_vector_store(file_name)
+    return store.load()
+
+
+def get_clusters_by_file(file_name, scope="file"):
+    """Cluster labels of a file's chunks, from clustering the file alone (scope "file") or the corpus ("corpus")."""
+    with session_scope() as db_session:
+        # Served by the (scope, file_name, chunk_id) index, no join needed
+        clusters = (db_session.query(Clusters.chunk_id, Clusters.cluster_label)
+                    .filter(Clusters.scope == scope, Clusters.file_name == file_name)
+                    .order_by(Clusters.chunk_id)
+                    .all())
 
-
-def get_clusters_by_file(file_name):
-    db_session = Session()
-    clusters = db_session.query(Clusters).join(Clusters.chunk).join(ProcessedText.file).filter(File.file_name == file_name).all()
-    
     # Convert clusters to a list of dictionaries
-    cluster_list = []
-    for cluster in clusters:
-        cluster_dict = {
-            "file_name": cluster.file_name,
-            "chunk_id": cluster.chunk_id,
-            "cluster_label": cluster.cluster_label
-        }
-        cluster_list.append(cluster_dict)
-    
-    return cluster_list
+    return [{"file_name": file_name, "chunk_id": chunk_id, "cluster_label": cluster_label}
+            for chunk_id, cluster_label in clusters]
 
 
 def store_topics(topics):
-    db_session = Session()
-    for topic in topics:
-        new_topic = Topics(
-            file_name=topic["file_name"],
-            topic=topic["topic"]
-        )
-        db_session.add(new_topic)
-    
-    # Commit the changes to the database
-    db_session.commit()
+    with session_scope(write=True) as db_session:
+        for topic in topics:
+            new_topic = Topics(
+                file_name=topic["file_name"],
+                topic=topic["topic"]
+            )
+            db_session.add(new_topic)
+
+
+def replace_topics(file_name, topics):
+    """Replace the stored topics of a file in one transaction."""
+    with session_scope(write=True) as db_session:
+        db_session.query(Topics).filter(Topics.file_name == file_name).delete(synchronize_session=False)
+        db_session.bulk_insert_mappings(Topics, [{"file_name": file_name, "topic": topic["topic"]} for topic in topics])
+    _count_written("topics", topics, "topic")
 
 # Function to store embeddings in the database
 def store_embeddings(embeddings):
-    db_session = Session()
-    for embedding in embeddings:
-        new_embedding = Embeddings(
-            file_name=embedding["file_name"],
-            chunk_id=embedding["chunk_id"],
-            embedding=embedding["embedding"]
-        )
-        db_session.add(new_embedding)
-    
-    # Commit the changes to the database
-    db_session.commit()
+    """Store embeddings, encoded with database.embedding_codec (rows without a dtype are float32)."""
+    rows = [{"file_name": embedding["file_name"], "chunk_id": embedding["chunk_id"],
+             "embedding": embedding["embedding"], "dtype": embedding.get("dtype"),
+             "dim": embedding.get("dim"), "scale": embedding.get("scale")} for embedding in embeddings]
+    with session_scope(write=True) as db_session:
+        db_session.bulk_insert_mappings(Embeddings, rows)
+    _count_written("embeddings", rows, "embedding")
+
+    # Mirror the committed rows into the memory-mapped sidecar store of each file
+    groups = {}
+    for row in rows:
+        groups.setdefault((row["file_name"], row["dtype"] or "float32"), []).append(row)
+    for (file_name, dtype), group in groups.items():
+        vectors = decode_embeddings([row["embedding"] for row in group], dtype, group[0]["dim"],
+                                    [row["scale"] for row in group])
+        chunk_ids = [row["chunk_id"] for row in group]
+        VectorStore(file_name).append(chunk_ids, vectors)
+
+        # Keep the search index current, new rows go to the lists of their nearest centroid
+        index = IVFIndex()
+        if index.exists():
+            index.add(chunk_ids, vectors)
 
 # Function to store clusters in the database
 def store_clusters(clusters):
-    db_session = Session()
-    for cluster in clusters:
-        new_cluster = Clusters(
-            file_name=cluster["file_name"],
-            chunk_id=cluster["chunk_id"],
-            cluster_label=cluster["cluster_label"]
-        )
-        db_session.add(new_cluster)
-    
-    # Commit the changes to the database
-    db_session.commit()
\ No newline at end of file
+    rows = [{"file_name": cluster["file_name"], "chunk_id": cluster["chunk_id"],
+             "cluster_label": cluster["cluster_label"], "scope": cluster.get("scope", "file")} for cluster in clusters]
+    with session_scope(write=True) as db_session:
+        db_session.bulk_insert_mappings(Clusters, rows)
+
+
+def replace_clusters(clusters, file_name=None):
+    """
+    Replace the cluster labels of a clustering of one file, or of the corpus if file_name is None,
+    in one transaction. The two scopes are stored side by side, neither replaces the other.
+    """
+    scope = "file" if file_name else "corpus"
+    rows = [{"file_name": cluster["file_name"], "chunk_id": cluster["chunk_id"],
+             "cluster_label": cluster["cluster_label"], "scope": scope} for cluster in clusters]
+    with session_scope(write=True) as db_session:
+        query = db_session.query(Clusters).filter(Clusters.scope == scope)
+        if file_name:
+            query = query.filter(Clusters.file_name == file_name)
+        query.delete(synchronize_session=False)
+        db_session.bulk_insert_mappings(Clusters, rows)
+    _count_written("clusters", rows)
+
+
+def get_chunk_topic_versions(file_name):
+    """Versions of the topic model that assigned the stored chunk topics of a file."""
+    with session_scope() as db_session:
+        return {version for version, in db_session.query(ChunkTopic.model_version)
+                .filter(ChunkTopic.file_name == file_name).distinct()}
+
+
+def replace_chunk_topics(file_name, chunk_topics):
+    """Replace the chunk topic weights of a file in one transaction."""
+    rows = [{"file_name": file_name, "chunk_id": row["chunk_id"], "topic_id": row["topic_id"],
+             "weight": row["weight"], "model_version": row["model_version"]} for row in chunk_topics]
+    with session_scope(write=True) as db_session:
+        db_session.query(ChunkTopic).filter(ChunkTopic.file_name == file_name).delete(synchronize_session=False)
+        db_session.bulk_insert_mappings(ChunkTopic, rows)
+    _count_written("chunk_topics", rows)
+
+
+def get_topic_distributions(file_names=None):
+    """
+    Mean topic distribution of the chunks of each file, computed in SQL.
+
+    Returns:
+    - dict: file_name -> {"chunks": number of chunks, "model_versions": set of model versions,
+      "topics": {topic_id: mean weight}}.
+    """
+    with session_scope() as db_session:
+        chunk_query = (db_session.query(ChunkTopic.file_name, func.count(func.distinct(ChunkTopic.chunk_id)))
+                       .group_by(ChunkTopic.file_name))
+        version_query = db_session.query(ChunkTopic.file_name, ChunkTopic.model_version).distinct()
+        weight_query = (db_session.query(ChunkTopic.file_name, ChunkTopic.topic_id, func.sum(ChunkTopic.weight))
+                        .group_by(ChunkTopic.file_name, ChunkTopic.topic_id))
+        if file_names:
+            chunk_query = chunk_query.filter(ChunkTopic.file_name.in_(file_names))
+            version_query = version_query.filter(ChunkTopic.file_name.in_(file_names))
+            weight_query = weight_query.filter(ChunkTopic.file_name.in_(file_names))
+
+        distributions = {file_name: {"chunks": chunks, "model_versions": set(), "topics": {}}
+                         for file_name, chunks in chunk_query}
+        for file_name, version in version_query:
+            distributions[file_name]["model_versions"].add(version)
+        for file_name, topic_id, total_weight in weight_query:
+            distribution = distributions[file_name]
+            distribution["topics"][topic_id] = total_weight / distribution["chunks"]
+    return distributions
+
+
+# Readers across the main database and the shards written in sharded mode (see database.shards)
+
+def get_file_names_across_shards(shard_paths=None):
+    """Map every file name in the main database or a shard to the number of chunks stored for it."""
+    chunk_counts = {}
+    rows = query_shards("SELECT f.file_name, COUNT(c.id) FROM {db}.files f "
+                        "LEFT JOIN {db}.text_chunks c ON c.file_id = f.id GROUP BY f.file_name",
+                        shard_paths=shard_paths)
+    for file_name, chunk_count in rows:
+        chunk_counts[file_name] = chunk_counts.get(file_name, 0) + chunk_count
+    return chunk_counts
+
+
+def count_rows_across_shards(shard_paths=None):
+    """Number of rows of every table, summed over the main database and the shards."""
+    tables = [table.name for table in File.metadata.sorted_tables]
+    sql = "SELECT " + ", ".join(f"(SELECT COUNT(*) FROM {{db}}.{table})" for table in tables)
+    totals = dict.fromkeys(tables, 0)
+    for row in query_shards(sql, shard_paths=shard_paths):
+        for table, count in zip(tables, row):
+            totals[table] += count
+    return totals
+
+
+def iter_chunks_across_shards(file_name, shard_paths=None):
+    """Stream (page_number, chunk_content) of a file from whichever databases hold it, in page order per database."""
+    yield from query_shards("SELECT * FROM (SELECT c.page_number, c.chunk_content FROM {db}.text_chunks c "
+                            "JOIN {db}.files f ON c.file_id = f.id WHERE f.file_name = ? ORDER BY c.id)",
+                            (file_name,), shard_paths=shard_paths)
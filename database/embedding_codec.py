@@ -0,0 +1,53 @@
+import numpy as np
+
+# On-disk dtypes, always little-endian. int8 rows carry a per-row scale: value = int8 * scale.
+DTYPES = {
+    "float32": np.dtype('<f4'),
+    "float16": np.dtype('<f2'),
+    "int8": np.dtype('i1'),
+}
+DEFAULT_DTYPE = "float16"
+
+
+def encode_embeddings(vectors, dtype=DEFAULT_DTYPE):
+    """
+    Encode a matrix of embeddings (one row per vector) for storage.
+
+    Returns:
+    - list: One dict per row with the encoded bytes under "embedding" and its "dtype", "dim" and "scale"
+      (None unless dtype is int8), ready to be merged into the rows given to store_embeddings.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported embedding dtype {dtype!r}. Supported: {sorted(DTYPES)}")
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    dim = vectors.shape[1]
+
+    if dtype == "int8":
+        # Symmetric quantization, the largest component of each row maps to +-127
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        encoded = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(DTYPES[dtype])
+        scales = scales.tolist()
+    else:
+        encoded = vectors.astype(DTYPES[dtype])
+        scales = [None] * len(vectors)
+
+    return [{"embedding": row.tobytes(), "dtype": dtype, "dim": dim, "scale": scale}
+            for row, scale in zip(encoded, scales)]
+
+
+def decode_embeddings(blobs, dtype, dim, scales=None):
+    """
+    Decode encoded embeddings of one dtype into a contiguous float32 matrix.
+
+    The blobs are joined once and viewed with np.frombuffer, no Python object is built per row.
+    """
+    if not blobs:
+        return np.empty((0, dim or 0), dtype=np.float32)
+    raw = np.frombuffer(b"".join(blobs), dtype=DTYPES[dtype])
+    if dim is None:
+        dim = len(raw) // len(blobs)
+    matrix = raw.reshape(len(blobs), dim).astype(np.float32)
+    if dtype == "int8":
+        matrix *= np.asarray(scales, dtype=np.float32)[:, None]
+    return matrix
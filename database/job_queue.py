@@ -0,0 +1,256 @@
+import json
+import os
+import socket
+import threading
+import time
+
+from sqlalchemy import func
+
+from database.models import Job
+from database.session import get_engine, session_scope
+from logging_util import logger
+
+# Attempts before a failing job is dead-lettered
+MAX_ATTEMPTS = int(os.environ.get("CC_VC_JOB_MAX_ATTEMPTS", 3))
+
+# Seconds a claimed job is reserved for its worker. Workers renew the lease while the job runs, a
+# job whose lease expired belongs to a crashed worker, the attempt counts as failed.
+LEASE_SECONDS = int(os.environ.get("CC_VC_JOB_LEASE_SECONDS", 300))
+
+# Retry backoff: BACKOFF_SECONDS after the first failure, doubling after every further one
+BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 3600
+
+STATUSES = ("pending", "running", "done", "dead")
+
+
+def ensure_job_table():
+    """Create the jobs table if it doesn't exist yet, without touching the other tables."""
+    Job.__table__.create(get_engine(), checkfirst=True)
+
+
+def worker_id():
+    """Name of the calling thread, unique across hosts and processes."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+
+def backoff_seconds(attempts):
+    """Seconds a job waits before its next attempt, after failing attempts times."""
+    return min(BACKOFF_SECONDS * 2 ** max(attempts - 1, 0), MAX_BACKOFF_SECONDS)
+
+
+def _job_dict(job):
+    return {
+        "id": job.id, "task": job.task, "arg": json.loads(job.arg), "options": json.loads(job.options),
+        "status": job.status, "attempts": job.attempts, "max_attempts": job.max_attempts,
+        "available_at": job.available_at, "lease_expires_at": job.lease_expires_at, "worker": job.worker,
+        "last_error": job.last_error, "created_at": job.created_at, "started_at": job.started_at,
+        "finished_at": job.finished_at, "duration": job.duration,
+    }
+
+
+def enqueue(task, arg=None, options=None, max_attempts=None, dedupe=True):
+    """
+    Add a job to the queue.
+
+    Parameters:
+    - task (str): Name of the task, dispatched by the worker.
+    - arg, options: JSON serializable argument and keyword arguments of the task.
+    - max_attempts (int, optional): Attempts before the job is dead-lettered. Default is MAX_ATTEMPTS.
+    - dedupe (bool, optional): Return the id of an identical pending or running job instead of adding
+      a second one, so a batch run can simply be started again. Default is True.
+
+    Returns:
+    - int: Id of the job.
+    """
+    arg_json = json.dumps(arg)
+    options_json = json.dumps(options or {}, sort_keys=True)
+    with session_scope(write=True) as session:
+        if dedupe:
+            existing = session.query(Job.id).filter(
+                Job.task == task, Job.arg == arg_json, Job.options == options_json,
+                Job.status.in_(("pending", "running"))).first()
+            if existing:
+                logger.info("Job %s (%s %s) is already queued", existing.id, task, arg)
+                return existing.id
+        now = time.time()
+        job = Job(task=task, arg=arg_json, options=options_json, status="pending", attempts=0,
+                  max_attempts=max_attempts or MAX_ATTEMPTS, available_at=now, created_at=now)
+        session.add(job)
+        session.flush()
+        return job.id
+
+
+def _record_failure(job, now, error):
+    """Retry a failed attempt of job after backoff_seconds, or dead-letter it once it used up its attempts."""
+    job.finished_at = now
+    job.duration = now - job.started_at if job.started_at else None
+    job.lease_expires_at = None
+    job.last_error = error
+    if job.attempts >= job.max_attempts:
+        job.status = "dead"
+        logger.error("Job %s (%s %s) failed %s times, moved to the dead letters",
+                     job.id, job.task, json.loads(job.arg), job.attempts)
+    else:
+        job.status = "pending"
+        job.available_at = now + backoff_seconds(job.attempts)
+        logger.warning("Job %s (%s) failed attempt %s of %s, retrying in %ss",
+                       job.id, job.task, job.attempts, job.max_attempts, backoff_seconds(job.attempts))
+
+
+def _recover_expired_leases(session, now):
+    """
+    Count the attempt of every running job whose lease expired as failed, its worker crashed or hung.
+    A job that keeps killing its worker is dead-lettered like one that keeps raising.
+    """
+    for job in session.query(Job).filter(Job.status == "running", Job.lease_expires_at < now):
+        logger.warning("Job %s (%s) of %s lost its lease", job.id, job.task, job.worker)
+        _record_failure(job, now, f"Lease expired, worker {job.worker} crashed or hung")
+    session.flush()
+
+
+def claim_job(worker, lease_seconds=None):
+    """
+    Atomically claim the oldest job that is ready to run. Running jobs whose lease expired are
+    first failed (see _recover_expired_leases), so they are retried after a backoff or dead-lettered.
+
+    The select and the update happen in one write transaction, on SQLite it holds the write lock
+    from the start (BEGIN IMMEDIATE), so two workers never claim the same job. The update is also
+    conditional on the job being unchanged, which keeps the claim atomic on other databases.
+
+    Returns:
+    - dict: The claimed job, or None if no job is ready.
+    """
+    lease_seconds = lease_seconds or LEASE_SECONDS
+    with session_scope(write=True) as session:
+        now = time.time()
+        _recover_expired_leases(session, now)
+        job = session.query(Job).filter(Job.status == "pending", Job.available_at <= now).order_by(Job.id).first()
+        if job is None:
+            return None
+        claimed = session.query(Job).filter(Job.id == job.id, Job.status == "pending",
+                                            Job.attempts == job.attempts).update(
+            {"status": "running", "attempts": Job.attempts + 1, "worker": worker,
+             "lease_expires_at": now + lease_seconds, "started_at": now, "finished_at": None},
+            synchronize_session=False)
+        if not claimed:
+            return None
+        session.expire(job)
+        return _job_dict(job)
+
+
+def renew_lease(job_id, worker, lease_seconds=None):
+    """Extend the lease of a running job. Returns False if the worker no longer holds it."""
+    lease_seconds = lease_seconds or LEASE_SECONDS
+    with session_scope(write=True) as session:
+        return session.query(Job).filter(Job.id == job_id, Job.worker == worker, Job.status == "running").update(
+            {"lease_expires_at": time.time() + lease_seconds}, synchronize_session=False) > 0
+
+
+def complete_job(job_id, worker):
+    with session_scope(write=True) as session:
+        job = session.get(Job, job_id)
+        if job.worker != worker or job.status != "running":
+            logger.warning("Job %s was claimed by %s while %s ran it", job_id, job.worker, worker)
+            return
+        now = time.time()
+        job.status = "done"
+        job.finished_at = now
+        job.duration = now - job.started_at
+        job.lease_expires_at = None
+        job.last_error = None
+
+
+def fail_job(job_id, worker, error):
+    """
+    Record a failed attempt. The job is retried after backoff_seconds, or dead-lettered once it
+    used up its attempts.
+
+    Returns:
+    - str: The new status of the job, pending or dead.
+    """
+    with session_scope(write=True) as session:
+        job = session.get(Job, job_id)
+        if job.worker != worker or job.status != "running":
+            logger.warning("Job %s was claimed by %s while %s ran it", job_id, job.worker, worker)
+            return job.status
+        _record_failure(job, time.time(), error)
+        return job.status
+
+
+def list_jobs(status=None, limit=100):
+    """The most recent jobs, optionally only those with a given status."""
+    with session_scope() as session:
+        query = session.query(Job)
+        if status:
+            query = query.filter(Job.status == status)
+        return [_job_dict(job) for job in query.order_by(Job.id.desc()).limit(limit)]
+
+
+def count_jobs():
+    """Number of jobs per status."""
+    with session_scope() as session:
+        return dict(session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+
+
+def requeue_jobs(job_ids=None):
+    """
+    Make jobs pending again with a fresh set of attempts, by default every dead job.
+
+    Returns:
+    - int: Number of jobs requeued.
+    """
+    with session_scope(write=True) as session:
+        query = session.query(Job)
+        if job_ids:
+            query = query.filter(Job.id.in_(job_ids), Job.status != "running")
+        else:
+            query = query.filter(Job.status == "dead")
+        return query.update({"status": "pending", "attempts": 0, "available_at": time.time(),
+                             "lease_expires_at": None, "worker": None}, synchronize_session=False)
+
+
+def next_job_at():
+    """
+    Epoch seconds at which the next job becomes claimable: the end of the earliest backoff or
+    lease. None if no job is pending or running.
+    """
+    with session_scope() as session:
+        pending = session.query(func.min(Job.available_at)).filter(Job.status == "pending").scalar()
+        leased = session.query(func.min(Job.lease_expires_at)).filter(Job.status == "running").scalar()
+    times = [value for value in (pending, leased) if value is not None]
+    return min(times) if times else None
+
+
+class LeaseKeeper:
+    """
+    Renew the lease of a job from a background thread while it runs.
+
+    Usage:
+        with LeaseKeeper(job["id"], worker):
+            run(job)
+    """
+
+    def __init__(self, job_id, worker, lease_seconds=None):
+        self.job_id = job_id
+        self.worker = worker
+        self.lease_seconds = lease_seconds or LEASE_SECONDS
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._renew, daemon=True)
+
+    def _renew(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                if not renew_lease(self.job_id, self.worker, self.lease_seconds):
+                    logger.warning("Job %s lost its lease", self.job_id)
+                    return
+            except Exception as error:
+                logger.warning("Couldn't renew the lease of job %s: %s", self.job_id, error)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
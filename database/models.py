@@ -1,11 +1,10 @@
 # models.py
 
-from sqlalchemy import Column, Integer, String, create_engine, MetaData, ForeignKey, Text, LargeBinary
+from sqlalchemy import Column, Integer, String, Float, MetaData, ForeignKey, Text, LargeBinary, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
-DATABASE_URL = "sqlite:///text_data.db"
-engine = create_engine(DATABASE_URL)
+# The engine is configured in database.session
 metadata = MetaData()
 
 Base = declarative_base()
@@ -15,6 +14,8 @@ class File(Base):
     __tablename__ = 'files'
     id = Column(Integer, primary_key=True)
     file_name = Column(String, unique=True)
+    content_hash = Column(String)  # sha256 of the file, set once ingestion finished
+    tables_hash = Column(String)  # content_hash of the file its tables were stored for, None if they weren't
     chunks = relationship("TextChunk", back_populates="file")
 
 class TextChunk(Base):
@@ -22,18 +23,29 @@ class TextChunk(Base):
     id = Column(Integer, primary_key=True)
     chunk_content = Column(Text)
     file_id = Column(Integer, ForeignKey('files.id'))
+    page_number = Column(Integer)  # First page the chunk was taken from
+    end_page_number = Column(Integer)  # Last page, chunks may span pages
+    page_hash = Column(String)  # Hash of the page content stream the chunk was extracted from
     file = relationship("File", back_populates="chunks")
 
+    # Ids are never reused, the vector stores and the search index refer to them
+    __table_args__ = (Index('ix_text_chunks_file_id_page_number', 'file_id', 'page_number'),
+                      {'sqlite_autoincrement': True})
+
 
 class ProcessedText(Base):
     __tablename__ = 'processed_texts'
     
     id = Column(Integer, primary_key=True)
     content = Column(Text)  # Store the processed NLP content here
-    file_id = Column(Integer, ForeignKey('files.id'))
+    file_id = Column(Integer, ForeignKey('files.id'), index=True)
+    text_chunk_id = Column(Integer, ForeignKey('text_chunks.id'), index=True)  # Chunk the content was processed from
     
     file = relationship("File", back_populates="processed_texts")
 
+    # Ids are never reused, embeddings, the vector stores and the search index refer to them
+    __table_args__ = {'sqlite_autoincrement': True}
+
 # Update the File model to establish the relationship
 File.processed_texts = relationship("ProcessedText", back_populates="file")
 
@@ -43,9 +55,12 @@ class ExtractedTable(Base):
     id = Column(Integer, primary_key=True)
     content = Column(Text)  # Store the table content here
     file_id = Column(Integer, ForeignKey('files.id'))
+    page_number = Column(Integer)
     
     file = relationship("File", back_populates="extracted_tables")
 
+    __table_args__ = (Index('ix_extracted_tables_file_id_page_number', 'file_id', 'page_number'),)
+
 # Update the File model to establish the relationship
 File.extracted_tables = relationship("ExtractedTable", back_populates="file")
 
@@ -62,19 +77,40 @@ class Topics(Base):
 class Embeddings(Base):
     __tablename__ = 'embeddings'
     
+    id = Column(Integer, primary_key=True)
+    file_name = Column(String)
+    chunk_id = Column(Integer, ForeignKey('processed_texts.id'), index=True)  # Assuming there's a chunks table with an id column
+    embedding = Column(LargeBinary)  # Storing embeddings as binary data, encoded by database.embedding_codec
+    dtype = Column(String)  # float32, float16 or int8, NULL rows are float32
+    dim = Column(Integer)
+    scale = Column(Float)  # int8 only, value = int8 * scale
+
+    # Also serves lookups by file_name alone, and returns a file's rows in chunk order
+    __table_args__ = (Index('ix_embeddings_file_name_chunk_id', 'file_name', 'chunk_id'),)
+
+# Topic distribution of a processed text under the corpus-level LDA model, one row per (chunk, topic)
+class ChunkTopic(Base):
+    __tablename__ = 'chunk_topics'
+
     id = Column(Integer, primary_key=True)
     file_name = Column(String, index=True)
-    chunk_id = Column(Integer, ForeignKey('processed_texts.id'))  # Assuming there's a chunks table with an id column
-    embedding = Column(LargeBinary)  # Storing embeddings as binary data
+    chunk_id = Column(Integer, ForeignKey('processed_texts.id'), index=True)
+    topic_id = Column(Integer)
+    weight = Column(Float)
+    model_version = Column(Integer)  # Version of the topic model that assigned the weight
 
 # Clusters Model
 class Clusters(Base):
     __tablename__ = 'clusters'
     
     id = Column(Integer, primary_key=True)
-    file_name = Column(String, index=True)
-    chunk_id = Column(Integer, ForeignKey('processed_texts.id'))
+    file_name = Column(String)
+    chunk_id = Column(Integer, ForeignKey('processed_texts.id'), index=True)
     cluster_label = Column(Integer)
+    # "file" for labels of a clustering of one file, "corpus" for a clustering of every file
+    scope = Column(String, nullable=False, default="file")
+
+    __table_args__ = (Index('ix_clusters_scope_file_name_chunk_id', 'scope', 'file_name', 'chunk_id'),)
 
 
 
@@ -84,10 +120,33 @@ class Entity(Base):
     id = Column(Integer, primary_key=True)
     entity_text = Column(Text)
     entity_label = Column(String)
-    chunk_id = Column(Integer, ForeignKey('processed_texts.id'))
+    chunk_id = Column(Integer, ForeignKey('processed_texts.id'), index=True)
 
     # Establishing relationship with the TextChunk model
     processed_text = relationship("ProcessedText", back_populates="entities")
 
 # Update the ProcessedText model to establish the relationship with entities
 ProcessedText.entities = relationship("Entity", back_populates="processed_text")
+
+
+# Durable task queue of enq.py, see job_queue.py
+class Job(Base):
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True)
+    task = Column(String)  # Name of the enq.py task
+    arg = Column(Text)  # JSON
+    options = Column(Text)  # JSON
+    status = Column(String)  # pending, running, done or dead
+    attempts = Column(Integer)
+    max_attempts = Column(Integer)
+    available_at = Column(Float)  # Epoch seconds, pending jobs wait until then (retry backoff)
+    lease_expires_at = Column(Float)  # Running jobs whose lease expired are claimed again
+    worker = Column(String)
+    last_error = Column(Text)
+    created_at = Column(Float)
+    started_at = Column(Float)
+    finished_at = Column(Float)
+    duration = Column(Float)  # Seconds taken by the last attempt
+
+    __table_args__ = (Index('ix_jobs_status_available_at', 'status', 'available_at'),)
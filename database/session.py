@@ -0,0 +1,128 @@
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+
+from logging_util import logger
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+DATABASE_URL = os.environ.get("CC_VC_DATABASE_URL", "sqlite:///text_data.db")
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    # Readers don't block the writer and the writer doesn't block readers
+    "journal_mode": os.environ.get("CC_VC_SQLITE_JOURNAL_MODE", "WAL"),
+    # Safe with WAL, a power loss can only lose the last transactions, not corrupt the database
+    "synchronous": os.environ.get("CC_VC_SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negative values are KiB, 64 MB of page cache per connection
+    "cache_size": _env_int("CC_VC_SQLITE_CACHE_SIZE", -65536),
+    "mmap_size": _env_int("CC_VC_SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    # Milliseconds a connection waits for a lock before failing with "database is locked"
+    "busy_timeout": _env_int("CC_VC_SQLITE_BUSY_TIMEOUT", 30000),
+}
+
+POOL_OPTIONS = {
+    "pool_size": _env_int("CC_VC_DB_POOL_SIZE", 10),
+    "max_overflow": _env_int("CC_VC_DB_MAX_OVERFLOW", 20),
+    "pool_timeout": _env_int("CC_VC_DB_POOL_TIMEOUT", 60),
+    "pool_pre_ping": True,
+}
+
+# Sessions for reads, and for writes: on SQLite these start with BEGIN IMMEDIATE and take the
+# write lock up front. A deferred transaction that read first can't wait for the lock when it
+# starts writing, SQLite fails it with "database is locked" right away.
+Session = sessionmaker()
+WriteSession = sessionmaker()
+
+_engine = None
+
+
+def _on_sqlite_connect(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        # Transactions are begun by the begin listener, not implicitly by the sqlite3 module
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return set_pragmas
+
+
+def _on_sqlite_begin(connection):
+    immediate = connection.get_execution_options().get("sqlite_immediate")
+    connection.exec_driver_sql("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
+
+def configure_engine(url=None, pragmas=None, immediate_writes=True, **pool_options):
+    """
+    Create the engine every session uses, replacing (and disposing) the current one.
+
+    Parameters:
+    - url (str, optional): Database URL. Default is CC_VC_DATABASE_URL, or sqlite:///text_data.db.
+    - pragmas (dict, optional): PRAGMAs run on every new SQLite connection. Default is SQLITE_PRAGMAS.
+    - immediate_writes (bool, optional): Begin write sessions with BEGIN IMMEDIATE on SQLite. Default is True.
+    - pool_options: Overrides of POOL_OPTIONS, passed to create_engine.
+
+    Returns:
+    - Engine: The new engine.
+    """
+    global _engine
+    url = make_url(url or DATABASE_URL)
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    options = {}
+    # In-memory SQLite databases live in a single connection, they keep SQLAlchemy's default pool
+    if not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")):
+        options = dict(POOL_OPTIONS, **pool_options)
+
+    engine = create_engine(url, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _on_sqlite_connect(pragmas))
+        event.listen(engine, "begin", _on_sqlite_begin)
+
+    if _engine is not None:
+        _engine.dispose()
+    _engine = engine
+    Session.configure(bind=engine)
+    WriteSession.configure(bind=engine.execution_options(sqlite_immediate=immediate_writes))
+    logger.debug("Configured database engine for %s", url.render_as_string(hide_password=True))
+    return engine
+
+
+def get_engine():
+    return _engine
+
+
+def get_database_url():
+    """URL of the current engine, including its password, e.g. to configure worker processes."""
+    return _engine.url.render_as_string(hide_password=False)
+
+
+@contextmanager
+def session_scope(write=False):
+    """
+    Provide a session that is committed when the block succeeds, rolled back when it raises, and
+    always closed.
+
+    Usage:
+        with session_scope(write=True) as session:
+            session.add(row)
+    """
+    session = WriteSession() if write else Session()
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+configure_engine()
@@ -0,0 +1,180 @@
+import glob
+import os
+import time
+from contextlib import contextmanager
+
+from database.models import (File, TextChunk, ProcessedText, ExtractedTable, Topics, Embeddings, Clusters, Entity,
+                             ChunkTopic)
+from database.session import get_engine
+from database.vector_store import VectorStore
+from database.vector_index import IVFIndex
+from logging_util import logger
+
+# Where ingestion workers write their shard databases in sharded mode
+SHARD_DIR = os.environ.get("CC_VC_SHARD_DIR", "shards")
+
+# SQLite attaches at most 10 databases to a connection by default
+ATTACH_LIMIT = 8
+
+# main.files id of the shard file row a table row belongs to
+_MAIN_FILE_ID = "(SELECT m.id FROM main.files m JOIN shard.files f ON f.file_name = m.file_name WHERE f.id = t.file_id)"
+
+# How the columns of every table are rewritten when its rows move into the main database. Ids of
+# text_chunks and processed_texts are shifted past the main database's largest id, which keeps the
+# references to them valid. Columns mapped to None are left out and get new ids. Tables are copied
+# in this order.
+_REMAP = [
+    (TextChunk, {"id": "t.id + :chunk_offset", "file_id": _MAIN_FILE_ID}),
+    (ProcessedText, {"id": "t.id + :text_offset", "file_id": _MAIN_FILE_ID,
+                     "text_chunk_id": "t.text_chunk_id + :chunk_offset"}),
+    (ExtractedTable, {"id": None, "file_id": _MAIN_FILE_ID}),
+    (Topics, {"id": None}),
+    (Embeddings, {"id": None, "chunk_id": "t.chunk_id + :text_offset"}),
+    (Clusters, {"id": None, "chunk_id": "t.chunk_id + :text_offset"}),
+    (Entity, {"id": None, "chunk_id": "t.chunk_id + :text_offset"}),
+    (ChunkTopic, {"id": None, "chunk_id": "t.chunk_id + :text_offset"}),
+]
+
+
+def shard_url(name, shard_dir=None):
+    """SQLite URL of the shard called name."""
+    shard_dir = shard_dir or SHARD_DIR
+    os.makedirs(shard_dir, exist_ok=True)
+    return f"sqlite:///{os.path.join(shard_dir, f'{name}.db')}"
+
+
+def list_shards(shard_dir=None):
+    return sorted(glob.glob(os.path.join(shard_dir or SHARD_DIR, "*.db")))
+
+
+@contextmanager
+def attached(shard_paths):
+    """
+    Attach shard databases to a raw connection of the main engine.
+
+    Yields the DBAPI connection and the schema names the shards were attached as. The connection
+    is in autocommit mode (see database.session), callers issue BEGIN/COMMIT themselves.
+    """
+    if len(shard_paths) > ATTACH_LIMIT:
+        raise ValueError(f"At most {ATTACH_LIMIT} shards can be attached at once, got {len(shard_paths)}")
+    pooled = get_engine().raw_connection()
+    connection = pooled.driver_connection
+    schemas = []
+    try:
+        for number, path in enumerate(shard_paths):
+            schema = f"shard{number}"
+            connection.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+            schemas.append(schema)
+        yield connection, schemas
+    finally:
+        for schema in schemas:
+            connection.execute(f"DETACH DATABASE {schema}")
+        pooled.close()
+
+
+def query_shards(sql, params=(), shard_paths=None, include_main=True):
+    """
+    Run one SELECT over the main database and every shard, yielding the rows of all of them.
+
+    ``sql`` names its tables with a ``{db}`` schema placeholder, e.g. "SELECT file_name FROM {db}.files",
+    and is repeated for every database as one UNION ALL statement. Shards are attached ATTACH_LIMIT
+    at a time. ``params`` are positional and bound for every repetition.
+    """
+    shard_paths = list_shards() if shard_paths is None else list(shard_paths)
+    groups = [shard_paths[start:start + ATTACH_LIMIT] for start in range(0, len(shard_paths), ATTACH_LIMIT)] or [[]]
+    for number, group in enumerate(groups):
+        with attached(group) as (connection, schemas):
+            if include_main and number == 0:
+                schemas = ["main"] + schemas
+            if not schemas:
+                continue
+            statement = " UNION ALL ".join(sql.format(db=schema) for schema in schemas)
+            yield from connection.execute(statement, tuple(params) * len(schemas))
+
+
+def _merge_shard(connection, path):
+    """Copy every file of one attached shard into the main database, in one transaction."""
+    connection.execute("ATTACH DATABASE ? AS shard", (path,))
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        file_names = [name for name, in connection.execute("SELECT file_name FROM shard.files")]
+
+        # Files already in the main database are replaced, they keep their id
+        existing = "SELECT id FROM main.files WHERE file_name IN (SELECT file_name FROM shard.files)"
+        replaced_texts = f"SELECT id FROM main.processed_texts WHERE file_id IN ({existing})"
+        removed_text_ids = [text_id for text_id, in connection.execute(
+            f"SELECT chunk_id FROM main.embeddings WHERE chunk_id IN ({replaced_texts})")]
+        for table in ("embeddings", "clusters", "entities", "chunk_topics"):
+            connection.execute(f"DELETE FROM main.{table} WHERE chunk_id IN ({replaced_texts})")
+        for table in ("processed_texts", "text_chunks", "extracted_tables"):
+            connection.execute(f"DELETE FROM main.{table} WHERE file_id IN ({existing})")
+        connection.execute("DELETE FROM main.topics WHERE file_name IN (SELECT file_name FROM shard.files)")
+        connection.execute("UPDATE main.files SET (content_hash, tables_hash) = (SELECT f.content_hash, f.tables_hash "
+                           "FROM shard.files f WHERE f.file_name = main.files.file_name) "
+                           "WHERE file_name IN (SELECT file_name FROM shard.files)")
+        connection.execute("INSERT INTO main.files (file_name, content_hash, tables_hash) "
+                           "SELECT file_name, content_hash, tables_hash "
+                           "FROM shard.files WHERE file_name NOT IN (SELECT file_name FROM main.files)")
+
+        # Past the largest id ever used, not only the largest one left, ids of deleted rows are never reused
+        offsets = {
+            key: connection.execute(f"SELECT MAX(COALESCE((SELECT MAX(id) FROM main.{table}), 0), "
+                                    f"COALESCE((SELECT seq FROM main.sqlite_sequence WHERE name = '{table}'), 0))"
+                                    ).fetchone()[0]
+            for key, table in (("chunk_offset", "text_chunks"), ("text_offset", "processed_texts"))
+        }
+        embedded = connection.execute("SELECT COUNT(*) FROM shard.embeddings").fetchone()[0]
+        for model, remap in _REMAP:
+            columns = [column.name for column in model.__table__.columns if remap.get(column.name, "") is not None]
+            values = [remap.get(column) or f"t.{column}" for column in columns]
+            connection.execute(f"INSERT INTO main.{model.__tablename__} ({', '.join(columns)}) "
+                               f"SELECT {', '.join(values)} FROM shard.{model.__tablename__} t", offsets)
+        connection.execute("COMMIT")
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.execute("DETACH DATABASE shard")
+    return file_names, embedded, removed_text_ids
+
+
+def compact_shards(shard_paths=None, remove=True):
+    """
+    Merge shard databases into the main database, one transaction per shard.
+
+    Ids are remapped past the main database's largest ids. A file that is already in the main
+    database is replaced by its shard copy. Merged shards are deleted unless remove is False.
+
+    Returns:
+    - dict: shards, files and seconds.
+    """
+    shard_paths = list_shards() if shard_paths is None else list(shard_paths)
+    start_time = time.perf_counter()
+    summary = {"shards": 0, "files": 0, "seconds": 0.0}
+    any_embedded = False
+    for path in shard_paths:
+        raw_connection = get_engine().raw_connection()
+        try:
+            # The sqlite3 connection under the pool's proxy, it exposes in_transaction
+            file_names, embedded, removed_text_ids = _merge_shard(raw_connection.driver_connection, path)
+        finally:
+            raw_connection.close()
+        IVFIndex().remove(removed_text_ids)
+
+        # Merged embeddings have new ids, the sidecar stores of their files are rebuilt on the next read
+        for file_name in file_names:
+            VectorStore(file_name).drop()
+        any_embedded = any_embedded or embedded > 0
+        summary["shards"] += 1
+        summary["files"] += len(file_names)
+        logger.info("Merged %d files from shard %s", len(file_names), path)
+        if remove:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    if any_embedded and IVFIndex().exists():
+        logger.warning("Merged shards held embeddings, rebuild the search index with enq.py -c buildIndex")
+    summary["seconds"] = time.perf_counter() - start_time
+    return summary
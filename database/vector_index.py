@@ -0,0 +1,222 @@
+import fcntl
+import json
+import os
+import shutil
+
+import numpy as np
+
+from database.vector_store import VECTOR_STORE_DIR
+
+# Rows are assigned to lists in blocks, bounding the size of the distance matrix
+_ASSIGN_BLOCK = 65536
+
+
+def normalize_rows(vectors):
+    """Scale rows to unit length, so a dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _assign(vectors, centroids):
+    """Index of the most similar centroid of every (unit length) row."""
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK):
+        block = vectors[start:start + _ASSIGN_BLOCK]
+        lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return lists
+
+
+def train_centroids(vectors, nlist, iterations=10, sample_size=None, seed=42):
+    """Spherical k-means on a sample of the (unit length) vectors."""
+    rng = np.random.default_rng(seed)
+    sample_size = sample_size or nlist * 256
+    if len(vectors) > sample_size:
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    else:
+        sample = np.asarray(vectors)
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        lists = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, lists, sample)
+        counts = np.bincount(lists, minlength=nlist)
+        # Empty lists keep their old centroid
+        filled = counts > 0
+        centroids[filled] = normalize_rows(sums[filled])
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index over unit length embeddings, persisted under ``<root>/.ivf``.
+
+    The vectors are partitioned into ``nlist`` lists by their nearest k-means centroid. A query
+    only scores the vectors in the ``nprobe`` lists whose centroids are closest to it. New vectors
+    are appended to the files and assigned to the existing centroids, so adding rows never
+    retrains. Rows are never rewritten: removed ids are tombstoned, and when an id is added again
+    only its last row counts, so re-embedded texts aren't returned twice. Files on disk:
+    - centroids.npy: the (nlist, dim) centroids.
+    - vectors.f32, ids.i64, lists.i32: row data, the ProcessedText id and list of every row.
+    - deleted.i64: tombstones, pairs of a removed id and the row count when it was removed.
+    - meta.json: dim, nlist and the number of rows the centroids were trained on.
+    """
+
+    def __init__(self, root=None):
+        self.path = os.path.join(root or VECTOR_STORE_DIR, ".ivf")
+        self._loaded = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def exists(self):
+        return os.path.exists(self._file("meta.json"))
+
+    @property
+    def meta(self):
+        with open(self._file("meta.json")) as meta_file:
+            return json.load(meta_file)
+
+    def build(self, chunk_ids, vectors, nlist=None, iterations=10):
+        """Train the centroids on vectors and write a fresh index holding them."""
+        vectors = normalize_rows(vectors)
+        nlist = nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        centroids = train_centroids(vectors, nlist, iterations=iterations)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path)
+        np.save(self._file("centroids.npy"), centroids)
+        with open(self._file("meta.json"), "w") as meta_file:
+            json.dump({"dim": vectors.shape[1], "nlist": len(centroids), "trained_count": len(vectors)}, meta_file)
+        self._append_rows(chunk_ids, vectors, _assign(vectors, centroids))
+        self._loaded = None
+
+    def add(self, chunk_ids, vectors):
+        """Assign new vectors to the existing lists and append them."""
+        if len(vectors) == 0:
+            return
+        vectors = normalize_rows(vectors)
+        centroids = np.load(self._file("centroids.npy"))
+        self._append_rows(chunk_ids, vectors, _assign(vectors, centroids))
+        self._loaded = None
+
+    def remove(self, chunk_ids):
+        """Tombstone the rows of ids whose embeddings were deleted, searches skip them."""
+        if len(chunk_ids) == 0 or not self.exists():
+            return
+        with open(self._file("vectors.f32"), "ab") as vectors_file:
+            fcntl.flock(vectors_file, fcntl.LOCK_EX)
+            try:
+                # Only rows written so far are removed, the id may be added again later
+                tombstones = np.empty((len(chunk_ids), 2), dtype='<i8')
+                tombstones[:, 0] = chunk_ids
+                tombstones[:, 1] = self.count()
+                with open(self._file("deleted.i64"), "ab") as deleted_file:
+                    deleted_file.write(tombstones.tobytes())
+            finally:
+                fcntl.flock(vectors_file, fcntl.LOCK_UN)
+        self._loaded = None
+
+    def _tombstones(self):
+        try:
+            tombstones = np.fromfile(self._file("deleted.i64"), dtype='<i8')
+        except FileNotFoundError:
+            return np.empty((0, 2), dtype=np.int64)
+        return tombstones[:len(tombstones) // 2 * 2].reshape(-1, 2)
+
+    def _live_rows(self, chunk_ids):
+        """Row numbers that are the last row of their id and weren't removed after it was written."""
+        count = len(chunk_ids)
+        _, last_from_end = np.unique(chunk_ids[::-1], return_index=True)
+        rows = np.sort(count - 1 - last_from_end)
+        tombstones = self._tombstones()
+        if len(tombstones):
+            # The latest tombstone of every id, sorted by id
+            tombstones = tombstones[np.lexsort((tombstones[:, 1], tombstones[:, 0]))]
+            latest = np.append(tombstones[1:, 0] != tombstones[:-1, 0], True)
+            removed_ids, removed_before = tombstones[latest, 0], tombstones[latest, 1]
+            position = np.searchsorted(removed_ids, chunk_ids[rows])
+            position[position == len(removed_ids)] = 0
+            hit = removed_ids[position] == chunk_ids[rows]
+            rows = rows[~(hit & (rows < removed_before[position]))]
+        return rows
+
+    def _append_rows(self, chunk_ids, vectors, lists):
+        with open(self._file("vectors.f32"), "ab") as vectors_file:
+            fcntl.flock(vectors_file, fcntl.LOCK_EX)
+            try:
+                with open(self._file("lists.i32"), "ab") as lists_file, open(self._file("ids.i64"), "ab") as ids_file:
+                    vectors_file.write(np.ascontiguousarray(vectors, dtype='<f4').tobytes())
+                    lists_file.write(np.ascontiguousarray(lists, dtype='<i4').tobytes())
+                    vectors_file.flush()
+                    lists_file.flush()
+                    # The id is written last, it is what makes the row count
+                    ids_file.write(np.ascontiguousarray(chunk_ids, dtype='<i8').tobytes())
+            finally:
+                fcntl.flock(vectors_file, fcntl.LOCK_UN)
+
+    def count(self):
+        if not self.exists():
+            return 0
+        dim = self.meta["dim"]
+        sizes = [os.path.getsize(self._file(name)) // width
+                 for name, width in (("vectors.f32", dim * 4), ("lists.i32", 4), ("ids.i64", 8))]
+        return min(sizes)
+
+    def _load(self):
+        """Map the row files and group the row numbers by list, the vectors themselves are not copied."""
+        count = self.count()
+        tombstone_count = len(self._tombstones())
+        if self._loaded is not None and self._loaded["count"] == count and \
+                self._loaded["tombstones"] == tombstone_count:
+            return self._loaded
+        meta = self.meta
+        vectors = np.memmap(self._file("vectors.f32"), dtype='<f4', mode='r', shape=(count, meta["dim"]))
+        lists = np.fromfile(self._file("lists.i32"), dtype='<i4', count=count)
+        chunk_ids = np.fromfile(self._file("ids.i64"), dtype='<i8', count=count)
+        rows = self._live_rows(chunk_ids)
+        order = rows[np.argsort(lists[rows], kind='stable')]
+        offsets = np.zeros(meta["nlist"] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists[rows], minlength=meta["nlist"]), out=offsets[1:])
+        self._loaded = {
+            "count": count,
+            "tombstones": tombstone_count,
+            "centroids": np.load(self._file("centroids.npy")),
+            "vectors": vectors,
+            "ids": chunk_ids,
+            "order": order,
+            "offsets": offsets,
+        }
+        return self._loaded
+
+    def search(self, query, top_k=10, nprobe=8):
+        """
+        Return the ids and cosine similarities of the approximate top_k neighbours of query.
+
+        Returns:
+        - tuple: (int64 ids, float32 scores), best first.
+        """
+        index = self._load()
+        query = normalize_rows(query)
+        nprobe = min(nprobe, len(index["centroids"]))
+        probed = np.argpartition(-(index["centroids"] @ query), nprobe - 1)[:nprobe]
+        offsets, order = index["offsets"], index["order"]
+        rows = np.concatenate([order[offsets[i]:offsets[i + 1]] for i in probed])
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows.sort()  # Read the memory map front to back
+        scores = index["vectors"][rows] @ query
+        best = top_k_indices(scores, top_k)
+        return index["ids"][rows[best]], scores[best]
+
+
+def top_k_indices(scores, top_k):
+    """Indices of the top_k highest scores, best first."""
+    if len(scores) > top_k:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
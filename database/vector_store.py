@@ -0,0 +1,126 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+# Where the sidecar vector files live, next to the database by default
+VECTOR_STORE_DIR = os.environ.get("CC_VC_VECTOR_STORE", "vector_store")
+
+_VECTORS = "vectors.f32"
+_IDS = "ids.i64"
+_META = "meta.json"
+
+
+class VectorStore:
+    """
+    Append-only, memory-mapped float32 vectors of one file, keyed by ProcessedText id.
+
+    Every file gets a directory under ``root`` holding:
+    - vectors.f32: the raw little-endian float32 rows, one per vector.
+    - ids.i64: the little-endian int64 ProcessedText id of every row.
+    - meta.json: the dimension and the file name.
+
+    Rows are only ever appended, readers map both files read-only with np.memmap, so loading a
+    file's vectors doesn't copy them. The embeddings table stays the source of truth, see
+    db_utils.check_vector_store and db_utils.rebuild_vector_store.
+    """
+
+    def __init__(self, file_name, root=None):
+        self.file_name = file_name
+        self.root = root or VECTOR_STORE_DIR
+        self.path = os.path.join(self.root, self.key(file_name))
+
+    @staticmethod
+    def key(file_name):
+        """Directory name of a file's store: its readable base name plus a hash of the full name."""
+        base = re.sub(r'[^A-Za-z0-9._-]+', '_', os.path.basename(file_name))[:64]
+        return f"{base}-{hashlib.sha1(file_name.encode()).hexdigest()[:12]}"
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @property
+    def dim(self):
+        try:
+            with open(self._file(_META)) as meta_file:
+                return json.load(meta_file)["dim"]
+        except FileNotFoundError:
+            return None
+
+    def _size(self, name):
+        try:
+            return os.path.getsize(self._file(name))
+        except FileNotFoundError:
+            return 0
+
+    def count(self):
+        """Number of complete rows. A row only counts once both its vector and its id are written."""
+        dim = self.dim
+        if not dim:
+            return 0
+        return min(self._size(_VECTORS) // (dim * 4), self._size(_IDS) // 8)
+
+    def append(self, chunk_ids, vectors):
+        """Append vectors (an (n, dim) array) and the ProcessedText ids they belong to."""
+        vectors = np.ascontiguousarray(vectors, dtype='<f4')
+        chunk_ids = np.ascontiguousarray(chunk_ids, dtype='<i8')
+        if len(vectors) == 0:
+            return
+        os.makedirs(self.path, exist_ok=True)
+
+        with open(self._file(_VECTORS), "ab") as vectors_file:
+            # Serialize writers of the same store, also across processes
+            fcntl.flock(vectors_file, fcntl.LOCK_EX)
+            try:
+                dim = self.dim
+                if dim is None:
+                    with open(self._file(_META), "w") as meta_file:
+                        json.dump({"dim": vectors.shape[1], "file_name": self.file_name}, meta_file)
+                elif dim != vectors.shape[1]:
+                    raise ValueError(f"Vector store of {self.file_name} holds {dim} dimensional vectors, "
+                                     f"got {vectors.shape[1]}")
+
+                # Trim a partially written tail left by a crashed writer before appending
+                count = self.count()
+                vectors_file.truncate(count * vectors.shape[1] * 4)
+                with open(self._file(_IDS), "ab") as ids_file:
+                    ids_file.truncate(count * 8)
+                    vectors_file.write(vectors.tobytes())
+                    vectors_file.flush()
+                    # The id is written last, it is what makes the row count
+                    ids_file.write(chunk_ids.tobytes())
+            finally:
+                fcntl.flock(vectors_file, fcntl.LOCK_UN)
+
+    def load(self):
+        """
+        Map the store read-only.
+
+        Returns:
+        - tuple: (float32 memmap of shape (n, dim), int64 memmap of the n ids). Empty arrays if there is no store.
+        """
+        count = self.count()
+        if count == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32), np.empty(0, dtype=np.int64)
+        dim = self.dim
+        vectors = np.memmap(self._file(_VECTORS), dtype='<f4', mode='r', shape=(count, dim))
+        chunk_ids = np.memmap(self._file(_IDS), dtype='<i8', mode='r', shape=(count,))
+        return vectors, chunk_ids
+
+    def rewrite(self, chunk_ids, vectors):
+        """Replace the whole store. The new files are written aside first and then moved into place."""
+        tmp = VectorStore(self.file_name, root=os.path.join(self.root, ".tmp"))
+        tmp.drop()
+        if len(vectors):
+            tmp.append(chunk_ids, vectors)
+        self.drop()
+        if len(vectors):
+            os.makedirs(self.root, exist_ok=True)
+            os.replace(tmp.path, self.path)
+
+    def drop(self):
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -1,89 +1,454 @@
 import argparse
+import functools
 import logging
 import queue
 import threading
+import time
+import traceback
 
 # Local module imports
-from get_data import extract_pdf_content_and_store, retrieve_chunks_and_apply_nlp
-from database.db_utils import initialize_database
+from get_data import (extract_pdf_content_and_store, extract_pdf_pages_and_store, retrieve_chunks_and_apply_nlp,
+                      file_content_hash)
+from database.db_utils import (initialize_database, get_embedded_file_names, check_vector_store, rebuild_vector_store,
+                               get_file_hashes)
+from database.session import configure_engine
+from database.job_queue import (STATUSES, ensure_job_table, worker_id, enqueue, claim_job, complete_job, fail_job,
+                                list_jobs, count_jobs, requeue_jobs, next_job_at, LeaseKeeper)
+from database.shards import SHARD_DIR, compact_shards
 from logging_util import logger
+from scheduler import expand_pdf_paths, run_bulk_ingestion, format_summary
+from model_registry import load_timings
+from metrics import metrics, format_report, REPORT_PATH
+from profiling import MODES as PROFILE_MODES, PROFILE_DIR, profile_task, format_profiles
+from pipeline import STAGES, run_pipeline, format_pipeline_summary
 
-from topic import generate_topic
+from topic import generate_topic, get_bert_embeddings
 
 # Create a global task queue
 task_queue = queue.Queue()
 
-def worker():
+# Tasks that are a stage of the per-file pipeline, see pipeline.py
+FILE_STAGES = {"process_pdf": "extract", "process_pdf_with_tables": "extract", "apply_nlp_on_file": "nlp",
+               "embed_file": "embed", "generate_topic_from_data": "topic"}
+
+# Seconds an idle job queue worker sleeps at most before looking for a ready job again
+POLL_SECONDS = 1
+
+def run_task(task, arg, options):
+    """Run one task by name."""
+    if task == "process_pdf":
+        process_pdf(arg, **options)
+    elif task == "process_pdf_with_tables":
+        process_pdf_with_tables(arg, **options)
+    elif task == "process_pdf_dir":
+        process_pdf_dir(arg, **options)
+    elif task == "apply_nlp_on_file":
+        apply_nlp_on_file(arg, **options)
+    elif task == "embed_file":
+        embed_file(arg, **options)
+    elif task == "generate_topic_from_data":
+        generate_topic_from_data(arg, **options)
+    elif task == "initialize_db":
+        initialize_db()
+    elif task == "check_vectors":
+        check_vectors()
+    elif task == "rebuild_vectors":
+        rebuild_vectors()
+    elif task == "build_index":
+        build_index()
+    elif task == "search_chunks":
+        search_chunks(arg, **options)
+    elif task == "compare_file_topics":
+        compare_file_topics(*arg)
+    elif task == "compact_shards":
+        compact_shard_dbs()
+    elif task == "run_pipeline":
+        run_file_pipeline(arg, **options)
+    else:
+        raise ValueError(f"Unknown task {task}")
+
+def run_profiled_task(task, arg, options, profile=None, profile_dir=None):
+    """Run a task, with profile ("cpu", "mem" or "both") under cProfile and/or tracemalloc."""
+    if not profile:
+        return run_task(task, arg, options)
+    with profile_task(task, arg, profile, profile_dir):
+        return run_task(task, arg, options)
+
+def worker(profile=None, profile_dir=None):
     """Worker function to process tasks."""
     while True:
-        task, arg = task_queue.get()
-        if task == "process_pdf":
-            process_pdf(arg)
-        elif task == "apply_nlp_on_file":
-            apply_nlp_on_file(arg)
-        elif task == "generate_topic_from_data":
-            generate_topic_from_data(arg)
-        elif task == "initialize_db":
-            initialize_db()
-        task_queue.task_done()
-
-def process_pdf(pdf_path):
+        task, arg, options = task_queue.get()
+        try:
+            run_profiled_task(task, arg, options, profile, profile_dir)
+        except Exception:
+            # The thread keeps serving the queue, and task_done is still called so join returns
+            logger.exception("Task %s %s failed", task, arg)
+        finally:
+            task_queue.task_done()
+
+def job_worker(profile=None, profile_dir=None):
+    """Run jobs of the durable job queue until none is pending or running anymore."""
+    worker = worker_id()
+    while True:
+        job = claim_job(worker)
+        if job is None:
+            next_at = next_job_at()
+            if next_at is None:
+                return
+            # Wait for a backoff or a lease to end, or for another worker to finish its job
+            time.sleep(min(max(next_at - time.time(), 0.1), POLL_SECONDS))
+            continue
+
+        logger.info("Running job %s (%s %s), attempt %s", job["id"], job["task"], job["arg"], job["attempts"])
+        try:
+            with LeaseKeeper(job["id"], worker):
+                run_profiled_task(job["task"], job["arg"], job["options"], profile, profile_dir)
+        except Exception:
+            logger.exception("Job %s failed", job["id"])
+            fail_job(job["id"], worker, traceback.format_exc(limit=5))
+        else:
+            complete_job(job["id"], worker)
+
+def drain_jobs(threads=2, profile=None, profile_dir=None):
+    """Run the durable job queue on worker threads until it is empty."""
+    ensure_job_table()
+    workers = [threading.Thread(target=job_worker, args=(profile, profile_dir), name=f"job-worker-{number}")
+               for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    counts = count_jobs()
+    print("Jobs: " + ", ".join(f"{counts.get(status, 0)} {status}" for status in STATUSES))
+
+def print_jobs(status=None):
+    """Print the most recent jobs of the durable job queue."""
+    ensure_job_table()
+    print(f"{'id':>6}  {'status':<8}  {'tries':>5}  {'seconds':>8}  task")
+    for job in list_jobs(None if status == "all" else status):
+        duration = f"{job['duration']:.1f}" if job["duration"] is not None else "-"
+        print(f"{job['id']:>6}  {job['status']:<8}  {job['attempts']:>2}/{job['max_attempts']:<2}  {duration:>8}  "
+              f"{job['task']} {job['arg'] if job['arg'] is not None else ''}")
+        if job["status"] in ("pending", "dead") and job["last_error"]:
+            print(f"        {job['last_error'].strip().splitlines()[-1][:160]}")
+
+def process_pdf(pdf_path, workers=None, force=False):
     """Process a given PDF by extracting its content and storing it."""
-    logger.info(f'Processing PDF: {pdf_path}')
-    pdf_text = extract_pdf_content_and_store(pdf_path)
+    logger.info("Processing PDF: %s", pdf_path)
+    pdf_text = extract_pdf_content_and_store(pdf_path, workers=workers, force=force)
     return pdf_text
 
-def apply_nlp_on_file(file_name):
+def process_pdf_with_tables(pdf_path, workers=None, force=False):
+    """Process a given PDF by extracting its text and tables in a single pass and storing both."""
+    logger.info("Processing PDF text and tables: %s", pdf_path)
+    return extract_pdf_pages_and_store(pdf_path, workers=workers, force=force)
+
+def process_pdf_dir(path_or_pattern, jobs=4, max_in_flight=None, memory_limit_mb=None, force=False, shard=False):
+    """
+    Extract every PDF in a directory or matching a glob pattern on a process pool.
+
+    With shard, every process writes to its own shard database and the shards are merged into the
+    main database at the end. Shards can't see the main database, so changed files are extracted
+    in full and unchanged ones are skipped up front.
+    """
+    paths = expand_pdf_paths(path_or_pattern)
+    if shard and not force:
+        paths = [path for path in paths if get_file_hashes(path)[0] != file_content_hash(path)]
+    logger.info("Processing %d PDFs from %s on %s processes", len(paths), path_or_pattern, jobs)
+    task = functools.partial(extract_pdf_content_and_store, force=force)
+    summary = run_bulk_ingestion(paths, task, workers=jobs, max_in_flight=max_in_flight,
+                                 memory_limit_mb=memory_limit_mb, shard_dir=SHARD_DIR if shard else None)
+    print(format_summary(summary))
+    for path in summary["failed_paths"]:
+        print(f"  failed: {path}")
+    if shard:
+        compact_shard_dbs()
+    return summary
+
+def run_file_pipeline(paths, stages=STAGES, options=None, workers=4):
+    """Run pipeline stages for files, directories or glob patterns, ordered per file as a dependency graph."""
+    file_names = [file_name for path in paths for file_name in (expand_pdf_paths(path) or [path])]
+    logger.info("Running the %s stages of %d files on %s threads", ", ".join(stages), len(file_names), workers)
+    summary = run_pipeline(file_names, stages=stages, options=options, workers=workers)
+    print(format_pipeline_summary(summary))
+    return summary
+
+def group_file_stages(tasks, workers=4):
+    """
+    Replace the stage tasks of a file that was given more than one stage, e.g. by
+    ``enq.py -e x.pdf -n x.pdf -t x.pdf``, with a single pipeline task. Otherwise the worker
+    threads would run them concurrently and NLP could read a half extracted file.
+
+    Raises ValueError if a file is given to two tasks of the same stage, -e and -a.
+    """
+    stages_by_file = {}
+    for task, arg, options in tasks:
+        if task in FILE_STAGES:
+            stage = FILE_STAGES[task]
+            if task == "process_pdf_with_tables":
+                options = dict(options, with_tables=True)
+            if stage in stages_by_file.get(arg, {}):
+                raise ValueError(f"{arg} is given to more than one {stage} task, e.g. both -e and -a. "
+                                 f"-a also extracts the text, give only one of them.")
+            stages_by_file.setdefault(arg, {})[stage] = options
+
+    grouped = []
+    pipelined = set()
+    for task, arg, options in tasks:
+        stages = stages_by_file.get(arg) if task in FILE_STAGES else None
+        if not stages or len(stages) < 2:
+            grouped.append((task, arg, options))
+        elif arg not in pipelined:
+            pipelined.add(arg)
+            grouped.append(("run_pipeline", [arg], {"stages": list(stages), "options": stages, "workers": workers}))
+    return grouped
+
+def compact_shard_dbs():
+    """Merge the shard databases written in sharded mode into the main database."""
+    summary = compact_shards()
+    print(f"Merged {summary['files']} files from {summary['shards']} shards in {summary['seconds']:.1f}s")
+
+def apply_nlp_on_file(file_name, batch_size=64, n_process=1):
     """Retrieve chunks of text from a file and apply NLP processing."""
-    logger.info(f"Processing PDF for NLP: {file_name}")
-    retrieve_chunks_and_apply_nlp(file_name)
+    logger.info("Processing PDF for NLP: %s", file_name)
+    retrieve_chunks_and_apply_nlp(file_name, batch_size=batch_size, n_process=n_process)
+
+def embed_file(file_name, batch_size=32, dtype="float16"):
+    """Embed the processed chunks of a file that have no embedding yet."""
+    logger.info("Embedding processed chunks of %s", file_name)
+    get_bert_embeddings(file_name, batch_size=batch_size, dtype=dtype)
 
-def generate_topic_from_data(file_name):
+def generate_topic_from_data(file_name, num_topics=100, workers=None, passes=1):
     """Retrieve processed NLP data and generate out of the box topic."""
-    logger.info(f"Processing content from NLP(DB) for Generating Topic: {file_name}")
-    generate_topic(file_name)
+    logger.info("Processing content from NLP(DB) for Generating Topic: %s", file_name)
+    generate_topic(file_name, num_topics=num_topics, workers=workers, passes=passes)
 
 def initialize_db():
     """Initialize the database."""
     initialize_database()
     logger.info("Database initialized successfully!")
 
+def check_vectors():
+    """Compare the sidecar vector stores with the embeddings table."""
+    for file_name in get_embedded_file_names():
+        report = check_vector_store(file_name)
+        status = "ok" if report["consistent"] else "INCONSISTENT"
+        print(f"{status:<12} {file_name}: {report['db_count']} in DB, {report['store_count']} in store, "
+              f"{len(report['missing'])} missing, {len(report['extra'])} extra")
+
+def rebuild_vectors():
+    """Rebuild every sidecar vector store from the embeddings table."""
+    for file_name in get_embedded_file_names():
+        rebuild_vector_store(file_name)
+    logger.info("Vector stores rebuilt successfully!")
+
+def build_index():
+    """Build the approximate nearest neighbour index used by searches over large corpora."""
+    from search import build_search_index
+    build_search_index()
+
+def search_chunks(query, top_k=10, file_names=None):
+    """Print the chunks most similar to a query."""
+    from search import search
+    for rank, result in enumerate(search(query, top_k=top_k, file_names=file_names), start=1):
+        print(f"{rank:>3}. {result['score']:.3f}  {result['file_name']} (chunk {result['chunk_id']})")
+        print(f"     {result['content'][:200]}")
+
+def compare_file_topics(file_a, file_b):
+    """Print the topics whose weight differs most between two files."""
+    from topic import compare_topics
+    print(f"{'topic':>5}  {file_a[:20]:>20}  {file_b[:20]:>20}  words")
+    for row in compare_topics(file_a, file_b):
+        print(f"{row['topic_id']:>5}  {row['weight_a']:>20.3f}  {row['weight_b']:>20.3f}  {row['words'][:120]}")
+
 def main():
     """Main function to manage command-line interface."""
     parser = argparse.ArgumentParser(description="Operations on PDF and Database.")
     
     # Argument to specify the PDF path for extraction
     parser.add_argument("-e", "--extract", help="Path to the PDF file for extraction.", default=None)
+
+    # Argument to specify the PDF path for text and table extraction in one pass
+    parser.add_argument("-a", "--extract-all", help="Path to the PDF file for text and table extraction.", default=None)
+
+    # Number of processes used to extract the pages of a single PDF
+    parser.add_argument("-w", "--workers", type=int, help="Number of processes for page extraction.", default=None)
+
+    # Bulk extraction of a directory or glob pattern on a process pool
+    parser.add_argument("-d", "--extract-dir", help="Directory or glob pattern of PDF files for extraction.", default=None)
+    parser.add_argument("-j", "--jobs", type=int, help="Number of processes for directory extraction.", default=4)
+    parser.add_argument("--max-in-flight", type=int, help="Maximum number of PDFs queued on the process pool.", default=None)
+    parser.add_argument("--memory-limit", type=int, help="Memory ceiling per extraction process, in MB.", default=None)
+    parser.add_argument("--shard", action="store_true",
+                        help="Let every extraction process write its own shard database, merged at the end.")
+
+    # Re-extract every page even if the file is unchanged since its last ingestion
+    parser.add_argument("-f", "--force", action="store_true", help="Re-extract unchanged files and pages.")
     
     # Argument to specify the PDF file name for NLP processing
     parser.add_argument("-n", "--nlp", help="File name of the PDF for NLP processing.", default=None)
 
+    # spaCy batching for NLP processing
+    parser.add_argument("--nlp-batch-size", type=int, help="Number of chunks per spaCy batch.", default=64)
+    parser.add_argument("--nlp-processes", type=int, help="Number of processes spaCy runs on.", default=1)
+
+    # Argument to specify the PDF file name for embedding its processed chunks
+    parser.add_argument("-m", "--embed", help="File name of the PDF whose processed chunks to embed.", default=None)
+    parser.add_argument("--embed-batch-size", type=int, help="Number of chunks encoded per batch.", default=32)
+    parser.add_argument("--embedding-dtype", choices=["float32", "float16", "int8"],
+                        help="Storage encoding of the embeddings.", default="float16")
+
+    # Semantic search over the embedded chunks
+    parser.add_argument("-s", "--search", help="Query to search the embedded chunks for.", default=None)
+    parser.add_argument("--top-k", type=int, help="Number of search results.", default=10)
+    parser.add_argument("--search-file", action="append", help="Only search this file, can be repeated.", default=None)
+
     parser.add_argument("-t", "--topic", help="Generate topic out of the processed NLP data.", default=None)
+    parser.add_argument("--num-topics", type=int, help="Number of LDA topics.", default=100)
+    parser.add_argument("--topic-workers", type=int, help="Number of LDA worker processes.", default=None)
+    parser.add_argument("--topic-passes", type=int, help="Number of LDA passes over the corpus.", default=1)
+    parser.add_argument("--compare-topics", nargs=2, metavar=("FILE_A", "FILE_B"),
+                        help="Compare the topic distributions of two files.", default=None)
     
     # Argument to manage the database
-    parser.add_argument("-c", "--command", choices=["initDB"], help="Database operation command.", default=None)
+    parser.add_argument("-c", "--command", choices=["initDB", "checkVectors", "rebuildVectors", "buildIndex", "compactShards"], help="Database operation command.", default=None)
+    parser.add_argument("--db-url", help="Database URL, overrides CC_VC_DATABASE_URL.", default=None)
+    parser.add_argument("--db-pool-size", type=int, help="Number of pooled database connections.", default=None)
     
-    args = parser.parse_args()
+    # Extract -> NLP -> embed -> cluster -> topic pipeline, see pipeline.py
+    parser.add_argument("-p", "--pipeline", action="append",
+                        help="PDF file, directory or glob pattern to run the pipeline stages for, can be repeated.", default=None)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, help="Pipeline stages to run.", default=list(STAGES))
+    parser.add_argument("--pipeline-workers", type=int, help="Number of threads the pipeline stages run on.", default=4)
+
+    # Run report, see metrics.py
+    parser.add_argument("--report", "--metrics-report", dest="metrics_report",
+                        help="Write the JSON run report here. Without it the report is only written, to "
+                             f"{REPORT_PATH}, when pipeline stages ran.", default=None)
+    parser.add_argument("--prometheus-file", help="Also write the metrics in the Prometheus text format here.", default=None)
+
+    # Durable job queue, see database/job_queue.py
+    parser.add_argument("--queue", action="store_true",
+                        help="Run the tasks through the durable job queue, --drain resumes them after a crash.")
+    parser.add_argument("--enqueue-only", action="store_true", help="Add the tasks to the job queue without running them.")
+    parser.add_argument("--drain", action="store_true", help="Run the job queue until it is empty.")
+    parser.add_argument("--list-jobs", nargs="?", const="all", choices=STATUSES + ("all",),
+                        help="List the most recent jobs, optionally with one status.", default=None)
+    parser.add_argument("--requeue", nargs="*", type=int, metavar="JOB_ID",
+                        help="Retry jobs again, by default every dead job.", default=None)
+    parser.add_argument("--max-attempts", type=int, help="Attempts before a failing job is dead-lettered.", default=None)
+    parser.add_argument("--threads", type=int, help="Number of worker threads.", default=2)
+
+    # Profiling, see profiling.py
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="Profile every task with cProfile (cpu), tracemalloc (mem) or both. Tasks then run one "
+                             "at a time, and work done in child processes is not profiled.", default=None)
+    parser.add_argument("--profile-dir", help="Directory of the per-task profile dumps.", default=PROFILE_DIR)
     
-    # Start worker threads
-    for _ in range(2):  # Starting 2 worker threads, adjust as needed
-        threading.Thread(target=worker, daemon=True).start()
+    args = parser.parse_args()
 
-    # Add tasks to the queue based on command-line arguments
+    if args.profile and args.threads > 1:
+        # cProfile only sees its own thread but tracemalloc sees all of them, concurrent tasks would mix
+        logger.info("Profiling, running the tasks on a single thread")
+        args.threads = 1
+
+    if args.db_url or args.db_pool_size:
+        pool_options = {"pool_size": args.db_pool_size} if args.db_pool_size else {}
+        configure_engine(args.db_url, **pool_options)
+    
+    # Collect the tasks of the command-line arguments
+    tasks = []
     if args.extract:
-        task_queue.put(("process_pdf", args.extract))
+        tasks.append(("process_pdf", args.extract, {"workers": args.workers, "force": args.force}))
     
+    if args.extract_all:
+        tasks.append(("process_pdf_with_tables", args.extract_all, {"workers": args.workers, "force": args.force}))
+
+    if args.extract_dir:
+        tasks.append(("process_pdf_dir", args.extract_dir,
+                      {"jobs": args.jobs, "max_in_flight": args.max_in_flight,
+                       "memory_limit_mb": args.memory_limit, "force": args.force, "shard": args.shard}))
+
     if args.nlp:
-        task_queue.put(("apply_nlp_on_file", args.nlp))
+        tasks.append(("apply_nlp_on_file", args.nlp,
+                      {"batch_size": args.nlp_batch_size, "n_process": args.nlp_processes}))
+
+    if args.embed:
+        tasks.append(("embed_file", args.embed, {"batch_size": args.embed_batch_size, "dtype": args.embedding_dtype}))
 
     if args.topic:
-        task_queue.put(("generate_topic_from_data", args.topic))
+        tasks.append(("generate_topic_from_data", args.topic,
+                      {"num_topics": args.num_topics, "workers": args.topic_workers, "passes": args.topic_passes}))
     
     if args.command == "initDB":
-        task_queue.put(("initialize_db", None))
+        tasks.append(("initialize_db", None, {}))
+    elif args.command == "checkVectors":
+        tasks.append(("check_vectors", None, {}))
+    elif args.command == "rebuildVectors":
+        tasks.append(("rebuild_vectors", None, {}))
+    elif args.command == "buildIndex":
+        tasks.append(("build_index", None, {}))
+    elif args.command == "compactShards":
+        tasks.append(("compact_shards", None, {}))
+
+    if args.compare_topics:
+        tasks.append(("compare_file_topics", tuple(args.compare_topics), {}))
+
+    if args.search:
+        tasks.append(("search_chunks", args.search, {"top_k": args.top_k, "file_names": args.search_file}))
+
+    if args.pipeline:
+        tasks.append(("run_pipeline", args.pipeline,
+                      {"stages": args.stages, "workers": args.pipeline_workers,
+                       "options": {"extract": {"workers": args.workers, "force": args.force},
+                                   "nlp": {"batch_size": args.nlp_batch_size, "n_process": args.nlp_processes},
+                                   "embed": {"batch_size": args.embed_batch_size, "dtype": args.embedding_dtype},
+                                   "topic": {"num_topics": args.num_topics, "workers": args.topic_workers,
+                                             "passes": args.topic_passes}}}))
+
+    # Stages given for the same file run in dependency order, not concurrently
+    try:
+        tasks = group_file_stages(tasks, args.pipeline_workers)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.queue or args.enqueue_only:
+        ensure_job_table()
+        for task, arg, options in tasks:
+            job_id = enqueue(task, arg, options, max_attempts=args.max_attempts)
+            logger.info("Queued job %s: %s %s", job_id, task, arg)
+    else:
+        # Start worker threads
+        for _ in range(args.threads):
+            threading.Thread(target=worker, args=(args.profile, args.profile_dir), daemon=True).start()
+        for task in tasks:
+            task_queue.put(task)
+        # Block until all tasks are done
+        task_queue.join()
+
+    if args.requeue is not None:
+        ensure_job_table()
+        print(f"Requeued {requeue_jobs(args.requeue)} jobs")
+
+    if args.drain or (args.queue and not args.enqueue_only):
+        drain_jobs(args.threads, args.profile, args.profile_dir)
+
+    if args.list_jobs:
+        print_jobs(args.list_jobs)
+
+    # Models are loaded on first use, report what this run paid for them
+    for name, seconds in load_timings().items():
+        logger.info("Model %s took %.2fs to load", name, seconds)
+
+    # Commands that ran no stage (initDB, search, queue management) leave the last report alone
+    report = metrics.report()
+    if report["stages"] or args.metrics_report or args.prometheus_file:
+        metrics.write_report(args.metrics_report, args.prometheus_file)
+    if report["stages"]:
+        print(format_report(report))
 
-    # Block until all tasks are done
-    task_queue.join()
+    if args.profile:
+        print(format_profiles())
 
 if __name__ == "__main__":
     main()
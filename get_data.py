@@ -1,16 +1,27 @@
 import PyPDF2
-import spacy
 import pdfplumber
-from spacy.lang.en.stop_words import STOP_WORDS
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextContainer
+from pdfminer.pdftypes import resolve1
+import hashlib
 import os
-import pandas as pd
-from logging_util import logger
-from database.db_utils import store_file_with_chunks, store_processed_text, get_chunks_for_file, store_extracted_tables
-nlp = spacy.load("en_core_web_sm")
-
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from logging_util import logger, RateLimitedLogger
+from metrics import metrics
+from model_registry import get_model
+from database.db_utils import (ChunkWriter, store_file_with_chunks, store_processed_text, get_chunks_for_file,
+                               store_extracted_tables, get_file_hashes, get_tables_hash, delete_tables,
+                               invalidate_pages, iter_chunks)
 from utility import reduce_duplicates, remove_consecutive_duplicates
+from chunker import chunk_pages, MAX_CHUNK_SIZE
+from normalize import join_single_letters
+
+
+# Per-page progress is logged at most once every PAGE_LOG_SECONDS per file
+PAGE_LOG_SECONDS = 5
+page_log = RateLimitedLogger(logger, interval=PAGE_LOG_SECONDS)
 
 
 def determine_chunk_size(file_path):
@@ -21,70 +32,223 @@ def determine_chunk_size(file_path):
         return 200000
     elif file_size < 50e6:  # 10MB to 50MB
         return 500000
-    elif file_size < 100e6:  # 50MB to 100MB
-        return 1000000
-    else:  # greater than 100MB
-        return 2000000
+    else:  # greater than 50MB, capped to what spaCy accepts
+        return MAX_CHUNK_SIZE
 
 
 
 def process_extracted_text(text):
-    words = text.split()
-    processed_words = []
+    """Re-join words that were split into single letters, see normalize.join_single_letters."""
+    return join_single_letters(text)
 
-    for i, word in enumerate(words):
-        if len(word) == 1 and processed_words:
-            processed_words[-1] += word  # append the character to the last word
-        else:
-            processed_words.append(word)
 
-    return ' '.join(processed_words)
+def _page_indexes(num_pages, pages=None):
+    """Zero based indexes of the requested page numbers, or of every page."""
+    if pages is None:
+        return list(range(num_pages))
+    return [page_number - 1 for page_number in sorted(pages) if 1 <= page_number <= num_pages]
+
+
+def file_content_hash(pdf_path):
+    """Return the sha256 of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as pdf_file:
+        for block in iter(lambda: pdf_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 
-def extract_layout_from_pdf_in_batches(pdf_path, batch_size=10):
+def page_content_hashes(pdf_path):
+    """
+    Return a hash for every page of a PDF.
+
+    Only the page box and the raw content streams are hashed, so no layout analysis is done.
+    """
+    hashes = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            digest = hashlib.sha1(repr(page.mediabox).encode())
+            for stream in page.page_obj.contents:
+                digest.update(resolve1(stream).get_data())
+            hashes.append(digest.hexdigest())
+    return hashes
+
+
+def _plan_incremental_extraction(pdf_path, force=False, with_tables=False):
+    """
+    Work out which pages of a PDF need to be (re-)extracted.
+
+    Unchanged files are skipped. For changed files, the chunks of pages whose hash differs
+    (and everything derived from them) are invalidated. With with_tables, a file whose tables
+    were never stored, e.g. because it was ingested text-only, also needs the tables of its
+    unchanged pages; their text is kept.
+
+    Returns:
+    - tuple: (file_hash, page_hashes, page_numbers_to_extract, page_numbers_missing_tables), or
+      None if the file is up to date.
+    """
+    file_hash = file_content_hash(pdf_path)
+    stored_hash, stored_pages, has_untracked = get_file_hashes(pdf_path)
+    tables_hash = get_tables_hash(pdf_path) if with_tables else file_hash
+    if stored_hash == file_hash and tables_hash == file_hash and not force:
+        logger.info("%s is unchanged since its last ingestion, skipping extraction.", pdf_path)
+        return None
+
+    page_hashes = page_content_hashes(pdf_path)
+    if force:
+        changed = list(range(1, len(page_hashes) + 1))
+    else:
+        changed = [page_number for page_number, page_hash in enumerate(page_hashes, start=1)
+                   if stored_pages.get(page_number) != page_hash]
+    removed = [page_number for page_number in stored_pages if page_number > len(page_hashes)]
+
+    if changed or removed or has_untracked:
+        invalidate_pages(pdf_path, changed + removed, drop_untracked=True)
+    missing_tables = []
+    if tables_hash is None:
+        missing_tables = [page_number for page_number in range(1, len(page_hashes) + 1) if page_number not in changed]
+        # Tables of an interrupted run are extracted again
+        delete_tables(pdf_path, missing_tables)
+    logger.info("%d of %d pages of %s need extraction, %d more only their tables.", len(changed), len(page_hashes),
+                pdf_path, len(missing_tables))
+    return file_hash, page_hashes, changed, missing_tables
+
+
+def _extract_page_content(page, with_tables=False):
+    """
+    Extract the content of a single pdfplumber page.
+
+    Text and tables are read from the same page object, so the layout pdfplumber
+    builds for the text is reused by the table finder instead of being parsed again.
+    """
+    extracted_text = page.dedupe_chars().extract_text()
+    page_content = {
+        "page_number": page.page_number,
+        "width": page.width,
+        "height": page.height,
+        "text": extracted_text if extracted_text else ""
+    }
+    if with_tables:
+        page_content["tables"] = page.extract_tables()
+    return page_content
+
+
+def _extract_page_range(pdf_path, page_indexes, with_tables=False):
+    """
+    Extracts the pages at the given (zero based) indexes of a PDF.
+
+    Runs inside a pool worker, so the PDF is opened here rather than shared
+    with the parent process.
+    """
+    batch_content = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for j in page_indexes:
+            page = pdf.pages[j]
+            batch_content.append(_extract_page_content(page, with_tables))
+            # Drop the cached layout objects, we no longer need them
+            page.flush_cache()
+    return batch_content
+
+
+def _extract_batches_in_parallel(pdf_path, page_indexes, batch_size, workers, with_tables=False):
+    """Spread page ranges over a process pool and yield the batches in page order."""
+    ranges = [page_indexes[i:i + batch_size] for i in range(0, len(page_indexes), batch_size)]
+    # Keep only a bounded number of ranges in flight so finished batches
+    # don't pile up in memory while the consumer is busy storing them
+    max_in_flight = workers * 2
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < max_in_flight:
+                pending.append(executor.submit(_extract_page_range, pdf_path, ranges[next_range], with_tables))
+                next_range += 1
+            yield pending.popleft().result()
+
+
+def extract_layout_from_pdf_in_batches(pdf_path, batch_size=10, workers=None, with_tables=False, pages=None):
     """
     Extracts content (text and tables) from a PDF in batches of pages.
 
     Parameters:
     - pdf_path (str): Path to the PDF file.
     - batch_size (int, optional): Number of pages to process in each batch. Default is 10.
+    - workers (int, optional): Number of worker processes. With more than one worker the
+      page ranges are extracted in parallel, each worker opening the PDF itself. Default
+      is None, which extracts in the current process.
+    - with_tables (bool, optional): Also extract the tables of each page in the same pass. Default is False.
+    - pages (list, optional): Page numbers (starting at 1) to extract. Default is None, which extracts every page.
 
     Yields:
     - dict: Dictionary containing both text content and tables of each page in the current batch.
+      Batches are always yielded in page order.
     """
-    
-    # Open the PDF file using pdfplumber
-    with pdfplumber.open(pdf_path) as pdf:
-        
-        # Determine the total number of pages in the PDF
-        num_pages = len(pdf.pages)
-        
-        # Iterate over the pages in batches
-        for i in range(0, num_pages, batch_size):
-            
-            # Initialize an empty list to store the content of the current batch of pages
-            batch_content = []
-            
-            # Iterate over each page in the current batch
-            for j in range(i, min(i + batch_size, num_pages)):
-                page = pdf.pages[j]
-                
-                # Extract the text and tables from the page
-                extracted_text = page.dedupe_chars().extract_text()
-                ## For now we stick to the text
-                
-                # Construct the page content as a dictionary
-                page_content = {
-                    "text": extracted_text if extracted_text else ""
-                }
-                
-                batch_content.append(page_content)
-            
-            # Yield the batch content
+    start_time = time.perf_counter()
+    page_count = 0
+
+    if workers and workers > 1:
+        # Only read the page count here, the workers open the PDF themselves
+        with pdfplumber.open(pdf_path) as pdf:
+            page_indexes = _page_indexes(len(pdf.pages), pages)
+
+        batch_start = time.perf_counter()
+        for batch_content in _extract_batches_in_parallel(pdf_path, page_indexes, batch_size, workers, with_tables):
+            page_count += len(batch_content)
+            metrics.observe_batch("extract", len(batch_content), batch_start, "page_seconds")
             yield batch_content
+            batch_start = time.perf_counter()
+    else:
+        # Open the PDF file using pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+
+            # Determine the pages of the PDF to extract
+            page_indexes = _page_indexes(len(pdf.pages), pages)
+
+            # Iterate over the pages in batches
+            for i in range(0, len(page_indexes), batch_size):
+
+                # Initialize an empty list to store the content of the current batch of pages
+                batch_content = []
+                batch_start = time.perf_counter()
+
+                # Iterate over each page in the current batch
+                for j in page_indexes[i:i + batch_size]:
+                    page = pdf.pages[j]
+                    batch_content.append(_extract_page_content(page, with_tables))
+                    page.flush_cache()
 
+                page_count += len(batch_content)
+                metrics.observe_batch("extract", len(batch_content), batch_start, "page_seconds")
 
+                # Yield the batch content
+                yield batch_content
+
+    elapsed = time.perf_counter() - start_time
+    pages_per_sec = page_count / elapsed if elapsed > 0 else 0.0
+    logger.info("Extracted %d pages from %s in %.2fs (%.1f pages/sec, workers=%d).",
+                page_count, pdf_path, elapsed, pages_per_sec, workers or 1)
+
+
+
+
+
+def iter_pdf_pages(pdf_path, batch_size=10, workers=None, pages=None):
+    """
+    Parses a PDF once and yields the text, tables and metadata of every page.
+
+    Parameters:
+    - pdf_path (str): Path to the PDF file.
+    - batch_size (int, optional): Number of pages extracted per batch. Default is 10.
+    - workers (int, optional): Number of worker processes, see extract_layout_from_pdf_in_batches.
+    - pages (list, optional): Page numbers (starting at 1) to extract. Default is None, which extracts every page.
 
+    Yields:
+    - dict: page_number, width, height, text and tables of a page, in page order.
+    """
+    for batch in extract_layout_from_pdf_in_batches(pdf_path, batch_size=batch_size,
+                                                    workers=workers, with_tables=True, pages=pages):
+        for page_content in batch:
+            yield page_content
 
 
 def extract_tables_from_pdf(pdf_path, batch_size=10):
@@ -107,98 +271,191 @@ def extract_tables_from_pdf(pdf_path, batch_size=10):
             tables_batch.extend(page.extract_tables())
             # If batch size is reached or it's the last page, yield the tables
             if i % batch_size == 0 or i == total_pages:
-                logger.info(f'Extracted tables from page {i-batch_size+1} to {i}')
+                logger.info('Extracted tables from page %d to %d', i - batch_size + 1, i)
                 yield tables_batch
                 tables_batch = []
                 
     logger.info('Table extraction finished.')
 
-def extract_text_from_pdf(pdf_path):
-    logger.info('Extracting Text From PDF')
+def iter_pdf_text_pages(pdf_path):
+    """Yields (page_number, text) for every page of a PDF, one page at a time."""
     with open(pdf_path, "rb") as pdf_file:
         pdf_reader = PyPDF2.PdfReader(pdf_file)  # Use PdfReader instead of PdfFileReader
-        pdf_text = []
         for page_num in range(len(pdf_reader.pages)):
-            text = pdf_reader.pages[page_num].extract_text()
-            pdf_text.append(text)
-    raw_text = "\n".join(pdf_text)
-    logger.info('Extracting Text From PDF finished', {len(raw_text)})
+            yield page_num + 1, pdf_reader.pages[page_num].extract_text()
+
+
+def extract_text_from_pdf(pdf_path):
+    logger.info('Extracting Text From PDF')
+    raw_text = "\n".join(text for _, text in iter_pdf_text_pages(pdf_path))
+    logger.info('Extracting Text From PDF finished, %d characters', len(raw_text))
     return raw_text
 
 
-def enhanced_preprocess_text(text):
+# The lemmatizer only needs the tagger and attribute ruler, parsing and NER are wasted work here
+NLP_DISABLED_COMPONENTS = ["parser", "ner"]
+
+
+def preprocess_texts(texts, batch_size=64, n_process=1):
+    """
+    Lowercases, lemmatizes and removes punctuation and stop words from a stream of texts.
+
+    Parameters:
+    - texts (iterable): Texts to preprocess.
+    - batch_size (int, optional): Number of texts spaCy processes per batch. Default is 64.
+    - n_process (int, optional): Number of processes spaCy runs the pipeline on. Default is 1.
+
+    Yields:
+    - str: The preprocessed text, in the order of the input.
+    """
     # Lowercasing
-    text = text.lower()
-    
-    # Using spaCy NLP pipeline for tokenization and lemmatization
-    doc = nlp(text)
-    
-    # Lemmatization, removing punctuation and stop words
-    tokens = [token.lemma_ for token in doc if not token.is_punct and not token.is_stop]
-    
-    # Joining tokens back into a single string
-    preprocessed_text = ' '.join(tokens)
-    
-    return preprocessed_text
+    lowered = (text.lower() for text in texts)
 
+    # Using spaCy NLP pipeline for tokenization and lemmatization, loaded on first use
+    nlp = get_model("spacy")
+    for doc in nlp.pipe(lowered, batch_size=batch_size, n_process=n_process, disable=NLP_DISABLED_COMPONENTS):
+        # Lemmatization, removing punctuation and stop words, joined back into a single string
+        yield ' '.join(token.lemma_ for token in doc if not token.is_punct and not token.is_stop)
 
-# 3. Information Extraction using pre-trained NER model
-def extract_pdf_in_chunks_and_store(pdf_path, chunk_size=500000):
-    """Extracts text from a PDF, splits it into chunks, and stores the chunks in the database."""
-    logger.info('Extracting PDF and Store in Chunks From PDF')
-    text = extract_text_from_pdf(pdf_path)
-    chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-    
-    # Store the chunks in the database
-    store_file_with_chunks(pdf_path, chunks)
-    logger.info('Extracting PDF and Storing in Chunks From PDF finished')
 
+def enhanced_preprocess_text(text):
+    return next(preprocess_texts([text]))
 
-def retrieve_chunks_and_apply_nlp(file_name):
-    """Retrieves chunks associated with a file from the database and applies NLP processing."""
-    logger.info('Retrieve Chunks and Apply NLP in Chunks From DB')
-    chunks = get_chunks_for_file(file_name)
-    
-    processed_chunks = []
-    for chunk in chunks:
-        preprocessed_chunk = enhanced_preprocess_text(chunk)
-        logger.info(f'Processing chunk: {preprocessed_chunk[:50]}...')  # Log the start of the chunk for reference
-        doc = nlp(preprocessed_chunk)
-        processed_chunks.append(doc.text)  # Assuming you want to store the processed text; modify as needed
-    
-    # Store the processed NLP data in the database
-    store_processed_text(file_name, processed_chunks)
-    logger.info(f'Retrieved {processed_chunks} , Chunks and Applied NLP in Chunks From DB')
-    
-    return processed_chunks
 
+# 3. Information Extraction using pre-trained NER model
+def extract_pdf_in_chunks_and_store(pdf_path, chunk_size=500000, overlap=0):
+    """Extracts text from a PDF, splits it into chunks, and stores the chunks in the database.
 
-def extract_pdf_content_and_store(pdf_path):
-    """Extracts text and tables from a PDF, then stores the chunks and tables in the database."""
+    Pages are streamed into sentence bounded chunks of at most ``chunk_size`` characters (see
+    chunker.chunk_pages), so the whole text is never held in memory. Every chunk records the
+    pages it starts and ends on.
+
+    The chunks replace everything stored for the file, so they never mix with the per-page chunks
+    of extract_pdf_content_and_store. A chunk can span pages, so it gets no page hash: once the
+    file changes, an incremental extraction re-extracts every page of it.
+    """
+    logger.info('Extracting PDF and Store in Chunks From PDF')
+    file_hash = file_content_hash(pdf_path)
+    _, stored_pages, _ = get_file_hashes(pdf_path)
+    invalidate_pages(pdf_path, stored_pages, drop_untracked=True)
+    chunk_count = 0
+
+    # Store the chunks in the database as they are produced
+    with ChunkWriter(pdf_path, on_flush=_log_flush) as writer:
+        for chunk in chunk_pages(iter_pdf_text_pages(pdf_path), chunk_size=chunk_size, overlap=overlap):
+            writer.add_chunk(chunk["text"], chunk["start_page"], end_page_number=chunk["end_page"])
+            chunk_count += 1
+        writer.set_content_hash(file_hash)
+    logger.info('Extracting PDF and Storing %d Chunks From PDF finished', chunk_count)
+    return chunk_count
+
+
+@metrics.stage("nlp")
+def retrieve_chunks_and_apply_nlp(file_name, batch_size=64, n_process=1, on_flush=None):
+    """Retrieves chunks associated with a file from the database and applies NLP processing.
+
+    Chunks are streamed from the database a page of ids at a time (see db_utils.iter_chunks) and
+    through spaCy with ``batch_size`` and ``n_process``, so memory doesn't grow with the file. Every
+    batch of results is stored with a single store_processed_text call, an interrupted run resumes
+    with the chunks that have no processed text yet. ``on_flush`` is called with the number of
+    processed chunks after every stored batch. Returns the number of processed chunks.
+    """
+    logger.info('Retrieve Chunks and Apply NLP in Chunks From DB')
+    # Ids of the chunks handed to spaCy and not yet returned, in order
+    pending_ids = deque()
+
+    def unprocessed_texts():
+        # Only chunks without a processed text, chunks of unchanged pages keep theirs
+        for chunk_id, _, content in iter_chunks(file_name, unprocessed_only=True):
+            pending_ids.append(chunk_id)
+            yield content
+
+    processed_count = 0
+    batch_ids = []
+    batch_texts = []
+    batch_start = time.perf_counter()
+    for processed_text in preprocess_texts(unprocessed_texts(), batch_size=batch_size, n_process=n_process):
+        batch_ids.append(pending_ids.popleft())
+        batch_texts.append(processed_text)
+        if len(batch_texts) >= batch_size:
+            # Store the processed NLP data in the database
+            store_processed_text(file_name, batch_texts, batch_ids)
+            processed_count += len(batch_texts)
+            metrics.observe_batch("nlp", len(batch_texts), batch_start)
+            logger.info('Applied NLP to %d chunks of %s', processed_count, file_name)
+            if on_flush:
+                on_flush(processed_count)
+            batch_ids = []
+            batch_texts = []
+            batch_start = time.perf_counter()
+
+    if batch_texts:
+        store_processed_text(file_name, batch_texts, batch_ids)
+        processed_count += len(batch_texts)
+        metrics.observe_batch("nlp", len(batch_texts), batch_start)
+        if on_flush:
+            on_flush(processed_count)
+
+    logger.info('Retrieved %d Chunks and Applied NLP in Chunks From DB', processed_count)
+    return processed_count
+
+
+def _log_flush(writer):
+    logger.info("Committed %d rows for %s.", writer.rows_written, writer.file_name)
+
+
+def _flush_callback(on_flush):
+    """Log every ChunkWriter flush and pass the writer on to on_flush, if given."""
+    if on_flush is None:
+        return _log_flush
+
+    def flushed(writer):
+        _log_flush(writer)
+        on_flush(writer)
+    return flushed
+
+
+@metrics.stage("extract")
+def extract_pdf_content_and_store(pdf_path, workers=None, flush_every=500, force=False, on_flush=None):
+    """Extracts text and tables from a PDF, then stores the chunks and tables in the database.
+
+    With ``workers`` greater than one, pages are extracted on a process pool. Chunks are
+    committed every ``flush_every`` pages, or once per file if it is None, and ``on_flush`` is
+    called with the ChunkWriter after every commit. Files that are unchanged since their last
+    ingestion are skipped and only changed pages are re-extracted, unless ``force`` is set.
+    """
     
     # Log start of PDF extraction
-    logger.info(f"Starting extraction of {pdf_path} content and storing in DB.")
+    logger.info("Starting extraction of %s content and storing in DB.", pdf_path)
     
     # Determine the chunk size for the specific PDF
     chunk_size = determine_chunk_size(pdf_path)
-    logger.info(f"Determined chunk size: {chunk_size} characters.")
+    logger.info("Determined chunk size: %d characters.", chunk_size)
     
+    plan = _plan_incremental_extraction(pdf_path, force)
+    if plan is None:
+        return 0
+    file_hash, page_hashes, pages, _ = plan
+
     # Extract content from PDF page by page
-    batched_content = extract_layout_from_pdf_in_batches(pdf_path)
+    batched_content = extract_layout_from_pdf_in_batches(pdf_path, workers=workers, pages=pages)
     
     page_count = 0  # Keep track of processed pages
     
-    for batch in batched_content:
-        for content in batch:
-            page_count += 1
-            text = content.get("text", "").replace('\n', ' ')
-            # Store each chunk in the database
-            store_file_with_chunks(pdf_path, text)
-            logger.info(f"Stored content from page {page_count} of {pdf_path}.")            
-            logger.info(f"Processed page {page_count} of text from {pdf_path}.")
+    with ChunkWriter(pdf_path, flush_every=flush_every, on_flush=_flush_callback(on_flush)) as writer:
+        for batch in batched_content:
+            for content in batch:
+                page_count += 1
+                text = content.get("text", "").replace('\n', ' ')
+                page_number = content["page_number"]
+                # Buffer each chunk, the writer stores them in bulk
+                writer.add_chunk(text, page_number, page_hashes[page_number - 1])
+                page_log.info(pdf_path, "Processed page %d of text from %s.", page_number, pdf_path)
+        writer.set_content_hash(file_hash)
 
     # Log completion of PDF extraction
-    logger.info(f"Finished extracting content from {pdf_path} and storing in DB.")
+    logger.info("Finished extracting content from %s and storing in DB.", pdf_path)
+    return page_count
 
 
 
@@ -206,7 +463,9 @@ def extract_pdf_content_and_store(pdf_path):
 
 def extract_pdf_tables_and_store(pdf_path):
     """Extracts  tables from a PDF, then stores  and tables in the database."""
-    logger.info('Extracting tables {pdf_path} , Content and Storing in DB')
+    import pandas as pd
+
+    logger.info('Extracting tables %s, Content and Storing in DB', pdf_path)
 
     for batch_index, table_batch in enumerate(extract_tables_from_pdf(pdf_path)):
         for table_index, table in enumerate(table_batch):
@@ -214,10 +473,41 @@ def extract_pdf_tables_and_store(pdf_path):
             df = pd.DataFrame(table[1:], columns=table[0])
             df.to_csv(f"batch_{batch_index}_table_{table_index}.csv", index=False)
             store_extracted_tables(pdf_path, table_batch)
-            logger.info(f"Stored tables from batch {batch_index}")
-
-        logger.info(f"Processed batch {batch_index}")
+            logger.info("Stored tables from batch %d", batch_index)
 
+        logger.info("Processed batch %d", batch_index)
 
 
+@metrics.stage("extract")
+def extract_pdf_pages_and_store(pdf_path, workers=None, flush_every=500, force=False, on_flush=None):
+    """Extracts text and tables from a PDF in a single pass and stores both in the database.
 
+    Like extract_pdf_content_and_store, only new or changed pages are extracted unless ``force`` is set.
+    """
+    logger.info("Starting single pass extraction of %s text and tables.", pdf_path)
+
+    plan = _plan_incremental_extraction(pdf_path, force, with_tables=True)
+    if plan is None:
+        return 0
+    file_hash, page_hashes, pages, missing_tables = plan
+    text_pages = set(pages)
+
+    page_count = 0
+    table_count = 0
+    with ChunkWriter(pdf_path, flush_every=flush_every, on_flush=_flush_callback(on_flush)) as writer:
+        for content in iter_pdf_pages(pdf_path, workers=workers, pages=sorted(text_pages.union(missing_tables))):
+            page_count += 1
+            page_number = content["page_number"]
+            # Pages whose stored text is unchanged only lack their tables
+            if page_number in text_pages:
+                writer.add_chunk(content["text"].replace('\n', ' '), page_number, page_hashes[page_number - 1])
+
+            tables = content["tables"]
+            if tables:
+                writer.add_tables(tables, page_number)
+                table_count += len(tables)
+            page_log.info(pdf_path, "Processed text and %d tables from page %d of %s.", len(tables), page_number, pdf_path)
+        writer.set_content_hash(file_hash, tables=True)
+
+    logger.info("Finished single pass extraction of %s: %d pages, %d tables.", pdf_path, page_count, table_count)
+    return page_count
@@ -1,8 +1,48 @@
 # logger_util.py
 
 import logging
+import threading
+import time
 
 # Set up the logger
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
+
+
+class RateLimitedLogger:
+    """
+    Log at most one message per key every ``interval`` seconds, e.g. per-page progress of a file.
+
+    Suppressed messages are counted and the count is added to the next message that gets through.
+    Arguments are %-style and only formatted for the messages that are logged.
+
+    Usage:
+        page_log = RateLimitedLogger(logger, interval=5)
+        page_log.info(pdf_path, "Processed page %d of %s", page_number, pdf_path)
+    """
+
+    def __init__(self, logger, interval=5.0):
+        self.logger = logger
+        self.interval = interval
+        self._lock = threading.Lock()
+        # key -> (time of the last logged message, messages suppressed since)
+        self._state = {}
+
+    def log(self, level, key, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._state.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._state[key] = (last, suppressed + 1)
+                return
+            self._state[key] = (now, 0)
+        if suppressed:
+            msg += " (%d similar messages suppressed)"
+            args += (suppressed,)
+        self.logger.log(level, msg, *args)
+
+    def info(self, key, msg, *args):
+        self.log(logging.INFO, key, msg, *args)
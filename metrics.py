@@ -0,0 +1,216 @@
+import bisect
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from logging_util import logger
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Where enq.py writes the JSON report of a run
+REPORT_PATH = os.environ.get("CC_VC_METRICS_REPORT", "run_report.json")
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process and of its finished child processes."""
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale}
+
+
+class Metrics:
+    """
+    Thread-safe counters and histograms, keyed by a name and labels.
+
+    Usage:
+        metrics.inc("rows_written_total", 50, table="text_chunks")
+        with metrics.stage("extract"):
+            ...
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters = {}
+        # key -> [bucket counts (the last one is +Inf), count, sum, min, max]
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, count=1, **labels):
+        """Record count observations of value, e.g. the mean latency of every chunk of a batch."""
+        key = _key(name, labels)
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, value)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0, 0.0, value, value]
+            histogram[0][bucket] += count
+            histogram[1] += count
+            histogram[2] += value * count
+            histogram[3] = min(histogram[3], value)
+            histogram[4] = max(histogram[4], value)
+
+    def observe_batch(self, stage, item_count, batch_start, histogram="chunk_seconds"):
+        """
+        Count the items (pages, chunks) a stage finished in a batch and record their latency, the
+        time since batch_start (a perf_counter value) spread evenly over them.
+        """
+        if item_count:
+            self.inc("items_total", item_count, stage=stage)
+            self.observe(histogram, (time.perf_counter() - batch_start) / item_count, count=item_count, stage=stage)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the seconds the block took."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    @contextmanager
+    def stage(self, stage):
+        """Count a run of a pipeline stage by outcome and observe how long it took."""
+        start_time = time.perf_counter()
+        status = "failed"
+        try:
+            yield
+            status = "done"
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start_time, stage=stage)
+            self.inc("stage_runs_total", stage=stage, status=status)
+
+    def counter(self, name, **labels):
+        return self.counters.get(_key(name, labels), 0)
+
+    def snapshot(self, reset=False):
+        """Plain copy of the counters and histograms, e.g. to send from a pool worker to merge."""
+        with self._lock:
+            snapshot = {"counters": dict(self.counters),
+                        "histograms": {key: [list(value[0])] + value[1:] for key, value in self.histograms.items()}}
+            if reset:
+                self.counters.clear()
+                self.histograms.clear()
+        return snapshot
+
+    def merge(self, snapshot):
+        """Add a snapshot of another registry, e.g. of a pool worker, to this one."""
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, (buckets, count, total, low, high) in snapshot["histograms"].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = [list(buckets), count, total, low, high]
+                    continue
+                histogram[0] = [mine + theirs for mine, theirs in zip(histogram[0], buckets)]
+                histogram[1] += count
+                histogram[2] += total
+                histogram[3] = min(histogram[3], low)
+                histogram[4] = max(histogram[4], high)
+
+    def report(self):
+        """
+        The metrics of the run as a JSON serializable dict.
+
+        Returns:
+        - dict: started_at, seconds, peak_rss_bytes, counters and histograms, both lists of dicts
+          with name and labels, and a per-stage throughput summary.
+        """
+        snapshot = self.snapshot()
+        seconds = time.time() - self.started_at
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(snapshot["counters"].items())]
+        histograms = []
+        for (name, labels), (buckets, count, total, low, high) in sorted(snapshot["histograms"].items()):
+            histograms.append({"name": name, "labels": dict(labels), "count": count, "sum": total,
+                               "mean": total / count if count else 0.0, "min": low, "max": high,
+                               "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], buckets))})
+
+        stages = {}
+        for histogram in histograms:
+            if histogram["name"] == "stage_seconds":
+                stage = histogram["labels"]["stage"]
+                stages[stage] = {"runs": histogram["count"], "seconds": histogram["sum"],
+                                 "failures": self.counter("stage_runs_total", stage=stage, status="failed")}
+        for counter in counters:
+            stage = counter["labels"].get("stage")
+            if counter["name"] == "items_total" and stage in stages:
+                items = counter["value"]
+                stages[stage]["items"] = items
+                stages[stage]["items_per_sec"] = items / stages[stage]["seconds"] if stages[stage]["seconds"] else 0.0
+
+        return {"started_at": self.started_at, "seconds": seconds, "peak_rss_bytes": peak_rss_bytes(),
+                "stages": stages, "counters": counters, "histograms": histograms}
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        def label_text(labels, **extra):
+            labels = dict(labels, **extra)
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{name}="{value}"' for name, value in sorted(labels.items())) + "}"
+
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(snapshot["counters"].items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{label_text(labels)} {value}")
+        for (name, labels), (buckets, count, total, _, _) in sorted(snapshot["histograms"].items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], buckets):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{label_text(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{label_text(labels)} {total}")
+            lines.append(f"{name}_count{label_text(labels)} {count}")
+        lines.append("# TYPE peak_rss_bytes gauge")
+        for process, value in peak_rss_bytes().items():
+            lines.append(f'peak_rss_bytes{{process="{process}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path=None, prometheus_path=None):
+        """Write the JSON report to path (default REPORT_PATH) and, if given, the Prometheus file."""
+        path = path or REPORT_PATH
+        with open(f"{path}.tmp", "w") as report_file:
+            json.dump(self.report(), report_file, indent=2)
+        os.replace(f"{path}.tmp", path)
+        if prometheus_path:
+            with open(f"{prometheus_path}.tmp", "w") as prometheus_file:
+                prometheus_file.write(self.prometheus())
+            os.replace(f"{prometheus_path}.tmp", prometheus_path)
+        logger.info("Wrote the run report to %s", path)
+
+
+def format_report(report):
+    """One throughput line per stage of a report."""
+    lines = [f"{'stage':<10}  {'runs':>5}  {'failed':>6}  {'seconds':>9}  {'items':>9}  {'items/sec':>10}"]
+    for stage, summary in sorted(report["stages"].items()):
+        lines.append(f"{stage:<10}  {summary['runs']:>5}  {summary['failures']:>6}  {summary['seconds']:>9.1f}  "
+                     f"{summary.get('items', 0):>9}  {summary.get('items_per_sec', 0.0):>10.1f}")
+    rss = report["peak_rss_bytes"]
+    lines.append(f"peak RSS: {rss['self'] / 2 ** 20:.0f} MB, children {rss['children'] / 2 ** 20:.0f} MB")
+    return "\n".join(lines)
+
+
+# The registry of the process
+metrics = Metrics()
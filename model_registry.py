@@ -0,0 +1,70 @@
+import threading
+import time
+
+from logging_util import logger
+
+# name -> function that loads the model
+_loaders = {}
+# name -> loaded model, cached for the lifetime of the process
+_models = {}
+# name -> seconds it took to load the model
+_load_times = {}
+
+_registry_lock = threading.Lock()
+_model_locks = {}
+
+
+def register_model(name, loader):
+    """Register a function that loads a model. Nothing is loaded until get_model(name) is called."""
+    with _registry_lock:
+        _loaders[name] = loader
+        _model_locks.setdefault(name, threading.Lock())
+
+
+def get_model(name):
+    """
+    Return the model registered under name, loading it on first use.
+
+    Loading is guarded by a lock per model, so concurrent callers load it once and
+    different models can load in parallel.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    if name not in _loaders:
+        raise KeyError(f"No model registered under {name!r}. Registered: {sorted(_loaders)}")
+
+    with _model_locks[name]:
+        # Another thread may have loaded it while we were waiting
+        model = _models.get(name)
+        if model is None:
+            start_time = time.perf_counter()
+            model = _loaders[name]()
+            _load_times[name] = time.perf_counter() - start_time
+            _models[name] = model
+            logger.info("Loaded model %s in %.2fs", name, _load_times[name])
+    return model
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def load_timings():
+    """Seconds spent loading each model this process loaded so far."""
+    return dict(_load_times)
+
+
+def _load_spacy():
+    import spacy
+    return spacy.load("en_core_web_sm")
+
+
+def _load_sentence_transformer():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('bert-base-nli-mean-tokens')
+
+
+register_model("spacy", _load_spacy)
+register_model("sentence_transformer", _load_sentence_transformer)
@@ -0,0 +1,140 @@
+import numpy as np
+
+# Code points str.split() treats as whitespace beyond the ASCII range
+_NON_ASCII_WHITESPACE = np.array([0x85, 0xa0, 0x1680, *range(0x2000, 0x200b), 0x2028, 0x2029, 0x202f, 0x205f, 0x3000],
+                                 dtype=np.uint32)
+_SPACE = 0x20
+
+
+def _encode(text):
+    """Text as an array of code points."""
+    return np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+
+
+def _decode(codepoints):
+    return codepoints.tobytes().decode('utf-32-le', 'surrogatepass')
+
+
+def _whitespace_mask(codepoints):
+    # \t \n \v \f \r, the \x1c-\x1f separators and the space itself
+    mask = (codepoints <= _SPACE) & ((codepoints >= 0x1c) | ((codepoints >= 0x09) & (codepoints <= 0x0d)))
+    non_ascii = codepoints >= 0x85
+    if non_ascii.any():
+        mask[non_ascii] = np.isin(codepoints[non_ascii], _NON_ASCII_WHITESPACE)
+    return mask
+
+
+def _collapse_repeats(codepoints):
+    if len(codepoints) < 2:
+        return codepoints
+    keep = np.empty(len(codepoints), dtype=bool)
+    keep[0] = True
+    np.not_equal(codepoints[1:], codepoints[:-1], out=keep[1:])
+    return codepoints[keep]
+
+
+def _rejoin_words(codepoints, join_single_letters):
+    """
+    Drop all whitespace and put a single space back in front of every word but the first.
+
+    With join_single_letters, words that are one character long get no space, so they
+    are appended to the word before them.
+    """
+    if len(codepoints) == 0:
+        return codepoints
+    whitespace = _whitespace_mask(codepoints)
+    word_start = ~whitespace
+    word_start[1:] &= whitespace[:-1]
+    starts = np.flatnonzero(word_start)
+    if len(starts) == 0:
+        return codepoints[:0]
+
+    separated = starts[1:]
+    if join_single_letters:
+        word_end = ~whitespace
+        word_end[:-1] &= whitespace[1:]
+        separated = separated[~word_end[separated]]
+
+    # Reuse the whitespace character in front of each separated word as its space
+    separators = separated - 1
+    keep = ~whitespace
+    keep[separators] = True
+    result = codepoints.copy()
+    result[separators] = _SPACE
+    return result[keep]
+
+
+def _collapse_whitespace(codepoints):
+    return _rejoin_words(codepoints, join_single_letters=False)
+
+
+def _join_single_letters(codepoints):
+    return _rejoin_words(codepoints, join_single_letters=True)
+
+
+STEPS = {
+    "collapse_repeats": _collapse_repeats,
+    "collapse_whitespace": _collapse_whitespace,
+    "join_single_letters": _join_single_letters,
+}
+
+DEFAULT_STEPS = ("join_single_letters",)
+
+
+class TextNormalizer:
+    """
+    Applies a configurable sequence of cleanup steps to text.
+
+    The text is converted to a NumPy array of code points once, every step runs as
+    vectorized array operations and the result is converted back once, instead of
+    scanning the text character by character or word by word in Python.
+
+    Available steps:
+    - collapse_repeats: runs of the same character become one, "aaabbc" becomes "abc".
+    - collapse_whitespace: whitespace and newlines become single spaces, both ends are stripped.
+    - join_single_letters: like collapse_whitespace, but one character words are appended to
+      the word before them, so "f u n d" becomes "fund".
+
+    Usage:
+        normalizer = TextNormalizer(["collapse_repeats", "collapse_whitespace"])
+        clean = normalizer(text)
+    """
+
+    def __init__(self, steps=DEFAULT_STEPS):
+        unknown = [step for step in steps if step not in STEPS]
+        if unknown:
+            raise ValueError(f"Unknown normalization steps: {unknown}. Available: {sorted(STEPS)}")
+        self.steps = tuple(steps)
+        self._functions = [STEPS[step] for step in self.steps]
+
+    def __call__(self, text):
+        if not text:
+            return text
+        codepoints = _encode(text)
+        for function in self._functions:
+            codepoints = function(codepoints)
+        return _decode(codepoints)
+
+    def normalize_many(self, texts):
+        """Normalize a stream of texts lazily."""
+        for text in texts:
+            yield self(text)
+
+
+def normalize_text(text, steps=DEFAULT_STEPS):
+    return TextNormalizer(steps)(text)
+
+
+def collapse_repeats(text):
+    """Collapse runs of the same character into one, "aaabbc" becomes "abc"."""
+    return normalize_text(text, ("collapse_repeats",))
+
+
+def collapse_whitespace(text):
+    """Collapse whitespace and newlines into single spaces and strip both ends."""
+    return normalize_text(text, ("collapse_whitespace",))
+
+
+def join_single_letters(text):
+    """Re-join words that were split into single letters, "f u n d" becomes "fund"."""
+    return normalize_text(text, ("join_single_letters",))
@@ -0,0 +1,268 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from get_data import (extract_pdf_content_and_store, extract_pdf_pages_and_store, retrieve_chunks_and_apply_nlp,
+                      file_content_hash)
+from database.db_utils import get_file_hashes, get_tables_hash, get_file_backlog, get_chunk_topic_versions
+from logging_util import logger
+from topic import (generate_topic, get_bert_embeddings, cluster_embeddings, processed_texts_hash,
+                   topic_model_files, topic_model_version, refresh_chunk_topics)
+
+STAGES = ("extract", "nlp", "embed", "cluster", "topic")
+
+# stage -> stages whose output it reads
+DEPENDENCIES = {
+    "extract": (),
+    "nlp": ("extract",),
+    "embed": ("nlp",),
+    "cluster": ("embed",),
+    "topic": ("nlp",),
+}
+
+# Stages that start once their dependency committed its first batch and then follow it, processing
+# every new batch. The other stages need the complete output of their dependencies.
+STREAMING = {"nlp", "embed"}
+
+# Pages per commit while extracting, smaller than extraction's default so NLP can start early
+FLUSH_EVERY = 50
+
+# Seconds a streaming stage waits for new batches before looking at the database again
+POLL_SECONDS = 5
+
+# A stage ends in one of these
+FINISHED = ("done", "skipped", "failed", "blocked")
+
+
+def _run_extract(file_name, on_flush, with_tables=False, **options):
+    options.setdefault("flush_every", FLUSH_EVERY)
+    extract = extract_pdf_pages_and_store if with_tables else extract_pdf_content_and_store
+    return extract(file_name, on_flush=on_flush, **options)
+
+
+def _run_nlp(file_name, on_flush, **options):
+    return retrieve_chunks_and_apply_nlp(file_name, on_flush=on_flush, **options)
+
+
+def _run_embed(file_name, on_flush, **options):
+    return get_bert_embeddings(file_name, on_flush=on_flush, **options)
+
+
+def _run_cluster(file_name, on_flush, **options):
+    return len(cluster_embeddings(file_name, **options))
+
+
+def _run_topic(file_name, on_flush, **options):
+    return generate_topic(file_name, **options)
+
+
+RUNNERS = {"extract": _run_extract, "nlp": _run_nlp, "embed": _run_embed, "cluster": _run_cluster,
+           "topic": _run_topic}
+
+
+def is_up_to_date(stage, file_name, options=None):
+    """
+    Whether the stored output of a stage already reflects its input, so the stage can be skipped.
+    Only meaningful once the stage's dependencies finished.
+    """
+    options = options or {}
+    if stage == "extract":
+        if options.get("force"):
+            return False
+        file_hash = file_content_hash(file_name)
+        # A text-only extraction didn't store the tables
+        return get_file_hashes(file_name)[0] == file_hash and (
+            not options.get("with_tables") or get_tables_hash(file_name) == file_hash)
+
+    backlog = get_file_backlog(file_name)
+    if backlog is None:
+        return False
+    if stage == "nlp":
+        return backlog["unprocessed"] == 0
+    if stage == "embed":
+        return backlog["unembedded"] == 0
+    if stage == "cluster":
+        return backlog["unclustered"] == 0
+    if stage == "topic":
+        # Every file updates the model online, chunk topics assigned by an older version are stale
+        return (backlog["without_topics"] == 0
+                and topic_model_files().get(file_name) == processed_texts_hash(file_name)
+                and get_chunk_topic_versions(file_name) == {topic_model_version()})
+    raise ValueError(f"Unknown stage {stage}")
+
+
+class _StageRun:
+    def __init__(self, file_name, stage, options):
+        self.file_name = file_name
+        self.stage = stage
+        self.options = options
+        # waiting, queued, running, then one of FINISHED
+        self.status = "waiting"
+        self.batches = 0  # Batches committed so far, streaming stages follow this
+        self.seconds = 0.0
+        self.error = None
+
+
+class Pipeline:
+    """
+    Run stages of the extract -> nlp -> embed -> cluster -> topic pipeline for many files.
+
+    Every file is a DAG of its stages (see DEPENDENCIES). Stages of different files run in
+    parallel on ``workers`` threads, the stages of one file in dependency order: a streaming stage
+    (see STREAMING) starts once its dependency committed a first batch and keeps processing new
+    batches until the dependency finished, the others wait for their dependencies to finish. A
+    stage whose output is already up to date is skipped, and when a stage fails the stages
+    depending on it are not run. Once every stage finished, the chunk topics assigned under an
+    older version of the topic model are re-assigned under the final one, see refresh_chunk_topics.
+
+    Usage:
+        summary = Pipeline(["a.pdf", "b.pdf"], stages=["extract", "nlp"]).run()
+    """
+
+    def __init__(self, file_names, stages=STAGES, options=None, workers=4):
+        """
+        Parameters:
+        - file_names (list): Files to run the stages for.
+        - stages (list, optional): Stages to run, the dependencies of a stage that are not listed are
+          assumed to be done. Default is every stage.
+        - options (dict, optional): stage -> keyword arguments of the stage's function.
+        - workers (int, optional): Number of threads the stages run on. Default is 4.
+        """
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown stages {sorted(unknown)}, the stages are {STAGES}")
+        options = options or {}
+        self.stages = [stage for stage in STAGES if stage in stages]
+        self.workers = workers
+        self.runs = {(file_name, stage): _StageRun(file_name, stage, dict(options.get(stage) or {}))
+                     for file_name in file_names for stage in self.stages}
+        # Notified on every status change and committed batch
+        self._changed = threading.Condition()
+
+    def _dependencies(self, run):
+        return [self.runs[(run.file_name, stage)] for stage in DEPENDENCIES[run.stage]
+                if (run.file_name, stage) in self.runs]
+
+    def _ready(self, run):
+        """Whether a waiting stage can be submitted, None if it can never run."""
+        dependencies = self._dependencies(run)
+        if any(dependency.status in ("failed", "blocked") for dependency in dependencies):
+            return None
+        if all(dependency.status in ("done", "skipped") for dependency in dependencies):
+            return True
+        # A running dependency holds a thread and keeps committing, the streaming stage can't starve
+        return run.stage in STREAMING and all(
+            dependency.status in ("done", "skipped") or (dependency.status == "running" and dependency.batches > 0)
+            for dependency in dependencies)
+
+    def _set_status(self, run, status):
+        with self._changed:
+            run.status = status
+            self._changed.notify_all()
+
+    def _flushed(self, run):
+        def on_flush(_):
+            with self._changed:
+                run.batches += 1
+                self._changed.notify_all()
+        return on_flush
+
+    def _run_stage(self, run):
+        self._set_status(run, "running")
+        start_time = time.perf_counter()
+        dependencies = self._dependencies(run)
+        try:
+            if all(dependency.status in ("done", "skipped") for dependency in dependencies) and \
+                    is_up_to_date(run.stage, run.file_name, run.options):
+                logger.info("%s of %s is up to date, skipping it", run.stage, run.file_name)
+                self._set_status(run, "skipped")
+                return
+            while True:
+                with self._changed:
+                    if any(dependency.status in ("failed", "blocked") for dependency in dependencies):
+                        logger.warning("Stopping %s of %s, a stage it depends on failed", run.stage, run.file_name)
+                        run.status = "blocked"
+                        self._changed.notify_all()
+                        return
+                    # Decided before the pass, so the last pass sees everything the dependencies stored
+                    last_pass = all(dependency.status in ("done", "skipped") for dependency in dependencies)
+                    seen = sum(dependency.batches for dependency in dependencies)
+
+                RUNNERS[run.stage](run.file_name, self._flushed(run), **run.options)
+                if run.stage not in STREAMING or last_pass:
+                    break
+                with self._changed:
+                    self._changed.wait_for(
+                        lambda: sum(dependency.batches for dependency in dependencies) > seen
+                        or any(dependency.status in FINISHED for dependency in dependencies), POLL_SECONDS)
+        except Exception as error:
+            logger.exception("%s of %s failed", run.stage, run.file_name)
+            run.error = repr(error)
+            self._set_status(run, "failed")
+        else:
+            self._set_status(run, "done")
+        finally:
+            run.seconds = time.perf_counter() - start_time
+
+    def run(self):
+        """
+        Run every stage of every file, blocking until all of them finished.
+
+        Returns:
+        - dict: file_name -> {stage: {"status", "seconds", "error"}}.
+        """
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pipeline") as executor:
+            with self._changed:
+                while True:
+                    for run in self.runs.values():
+                        if run.status != "waiting":
+                            continue
+                        ready = self._ready(run)
+                        if ready is None:
+                            logger.warning("Not running %s of %s, a stage it depends on failed",
+                                           run.stage, run.file_name)
+                            run.status = "blocked"
+                        elif ready:
+                            run.status = "queued"
+                            executor.submit(self._run_stage, run)
+                    if all(run.status in FINISHED for run in self.runs.values()):
+                        break
+                    self._changed.wait()
+
+        # Every file folded into the topic model made the chunk topics of the files before it stale
+        if any(run.stage == "topic" and run.status == "done" for run in self.runs.values()):
+            try:
+                refresh_chunk_topics()
+            except Exception:
+                logger.exception("Re-assigning the chunk topics under the final topic model failed")
+
+        summary = {}
+        for (file_name, stage), run in self.runs.items():
+            summary.setdefault(file_name, {})[stage] = {"status": run.status, "seconds": run.seconds,
+                                                        "error": run.error}
+        logger.info("Ran %d stages of %d files in %.1fs",
+                    len(self.stages), len(summary), time.perf_counter() - start_time)
+        return summary
+
+
+def run_pipeline(file_names, stages=STAGES, options=None, workers=4):
+    """Run the pipeline stages for the given files, see Pipeline."""
+    return Pipeline(file_names, stages=stages, options=options, workers=workers).run()
+
+
+def format_pipeline_summary(summary):
+    stages = [stage for stage in STAGES if any(stage in file_stages for file_stages in summary.values())]
+    lines = [f"{'file':<40}" + "".join(f"{stage:>14}" for stage in stages)]
+    for file_name, file_stages in summary.items():
+        cells = []
+        for stage in stages:
+            result = file_stages.get(stage)
+            if result is None:
+                cells.append(f"{'-':>14}")
+            elif result["status"] == "done":
+                cells.append(f"{result['seconds']:>13.1f}s")
+            else:
+                cells.append(f"{result['status']:>14}")
+        lines.append(f"{file_name[-40:]:<40}" + "".join(cells))
+    return "\n".join(lines)
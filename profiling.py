@@ -0,0 +1,128 @@
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from logging_util import logger
+
+# Where enq.py --profile writes the per-task profile dumps
+PROFILE_DIR = os.environ.get("CC_VC_PROFILE_DIR", "profiles")
+
+MODES = ("cpu", "mem", "both")
+
+# Frames kept per allocation, more make the dumps useful for grouping by traceback but cost more
+TRACE_FRAMES = 10
+
+# Rows of the printed summary per task
+TOP_N = 15
+
+# Profiles of the tasks run so far, in the order they finished
+profiles = []
+_profiles_lock = threading.Lock()
+_sequence = itertools.count(1)
+
+
+def _dump_name(task, arg):
+    """timestamp-sequence-task-file, e.g. 20261018-142501-001-process_pdf-report.pdf"""
+    if isinstance(arg, (list, tuple)):
+        arg = "+".join(os.path.basename(str(item)) for item in arg)
+    elif arg is not None:
+        arg = os.path.basename(str(arg).rstrip("/"))
+    label = re.sub(r"[^A-Za-z0-9._+-]+", "_", arg)[:80] if arg else "none"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{next(_sequence):03d}-{task}-{label}"
+
+
+def _top_functions(profiler, top):
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (file_name, line, function), (_, calls, own_seconds, seconds, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(file_name)}:{line}({function})" if line else function,
+                     "calls": calls, "own_seconds": own_seconds, "seconds": seconds})
+    return sorted(rows, key=lambda row: row["seconds"], reverse=True)[:top]
+
+
+def _top_allocations(snapshot, top):
+    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                       tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")))
+    return [{"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "bytes": stat.size,
+             "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:top]]
+
+
+@contextmanager
+def profile_task(task, arg, mode="both", directory=None, top=TOP_N):
+    """
+    Profile the CPU time and/or the memory allocations of the block, a run of an enq.py task.
+
+    The cProfile stats are written to <directory>/<timestamp>-<n>-<task>-<file>.prof (open them with
+    ``python -m pstats`` or snakeviz), the tracemalloc snapshot to the same name with .tracemalloc
+    (``tracemalloc.Snapshot.load``). Only the calling thread is CPU profiled, and tracemalloc sees
+    every thread, so tasks must not be profiled concurrently. Child processes are not profiled.
+
+    Parameters:
+    - task (str): Task name, for the file name and the summary.
+    - arg: Task argument, its file name goes into the file name.
+    - mode (str, optional): "cpu", "mem" or "both". Default is "both".
+    - directory (str, optional): Where to write the dumps. Default is PROFILE_DIR.
+    - top (int, optional): Functions and allocation sites kept for the summary. Default is TOP_N.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode {mode}, expected one of {MODES}")
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, _dump_name(task, arg))
+    result = {"task": task, "arg": arg, "status": "failed"}
+
+    profiler = cProfile.Profile() if mode in ("cpu", "both") else None
+    if mode in ("mem", "both"):
+        tracemalloc.start(TRACE_FRAMES)
+    start_time = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+        result["status"] = "done"
+    finally:
+        if profiler:
+            profiler.disable()
+        result["seconds"] = time.perf_counter() - start_time
+        # The memory snapshot first, so it doesn't hold what writing the CPU stats allocates
+        if mode in ("mem", "both"):
+            snapshot = tracemalloc.take_snapshot()
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result["mem_path"] = f"{path}.tracemalloc"
+            snapshot.dump(result["mem_path"])
+            result["allocations"] = _top_allocations(snapshot, top)
+        if profiler:
+            result["cpu_path"] = f"{path}.prof"
+            profiler.dump_stats(result["cpu_path"])
+            result["functions"] = _top_functions(profiler, top)
+        with _profiles_lock:
+            profiles.append(result)
+        logger.info("Profiled %s %s in %.1fs, wrote %s.*", task, arg, result["seconds"], path)
+
+
+def format_profiles(results=None, top=10):
+    """The top functions by cumulative time and the top allocation sites still held, per task."""
+    lines = []
+    for result in profiles if results is None else results:
+        lines.append(f"== {result['task']} {result['arg'] if result['arg'] is not None else ''} "
+                     f"({result['status']}, {result['seconds']:.1f}s)")
+        if "functions" in result:
+            lines.append(f"   {'cumulative':>10}  {'own':>9}  {'calls':>9}  function    [{result['cpu_path']}]")
+            for row in result["functions"][:top]:
+                lines.append(f"   {row['seconds']:>9.2f}s  {row['own_seconds']:>8.2f}s  {row['calls']:>9}  "
+                             f"{row['function']}")
+        if "allocations" in result:
+            lines.append(f"   peak traced memory {result['peak_bytes'] / 2 ** 20:.1f} MB, held at the end:"
+                         f"    [{result['mem_path']}]")
+            for row in result["allocations"][:top]:
+                lines.append(f"   {row['bytes'] / 2 ** 10:>9.1f} KiB  {row['count']:>9}  {row['site']}")
+    return "\n".join(lines)
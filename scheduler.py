@@ -0,0 +1,141 @@
+import glob
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from database.db_utils import initialize_database
+from database.session import configure_engine, get_database_url
+from database.shards import shard_url
+from logging_util import logger
+from metrics import metrics
+
+
+def expand_pdf_paths(path_or_pattern):
+    """
+    Expand a directory or a glob pattern into a sorted list of PDF paths.
+
+    A directory is searched recursively for *.pdf files, anything else is treated as a glob
+    pattern (``**`` is supported).
+    """
+    if os.path.isdir(path_or_pattern):
+        pattern = os.path.join(path_or_pattern, "**", "*.pdf")
+    else:
+        pattern = path_or_pattern
+    return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+
+def _init_worker(memory_limit_mb, database_url, shard_dir=None):
+    """Prepare a pool worker process."""
+    # A forked worker starts with a copy of the parent's metrics, they would be merged back twice
+    metrics.snapshot(reset=True)
+    if shard_dir:
+        # Sharded mode: every worker writes to a database of its own, merged later by compact_shards
+        configure_engine(shard_url(f"worker-{os.getpid()}", shard_dir))
+        initialize_database()
+    else:
+        # The connections inherited from the parent can't be shared across processes, and spawned
+        # workers would otherwise fall back to the default database
+        configure_engine(database_url)
+
+    if memory_limit_mb:
+        # Cap the address space, a runaway PDF raises MemoryError instead of taking the host down
+        limit = int(memory_limit_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _run_task(task, path):
+    """
+    Run a task on one file in a pool worker, returning the pages it handled, the time it took and
+    the metrics it recorded, which the parent merges into its own.
+    """
+    start_time = time.perf_counter()
+    try:
+        pages = task(path)
+    except Exception as error:
+        # Travels with the pickled exception, so the failed run still counts in the parent
+        error.worker_metrics = metrics.snapshot(reset=True)
+        raise
+    return pages or 0, time.perf_counter() - start_time, metrics.snapshot(reset=True)
+
+
+def run_bulk_ingestion(paths, task, workers=4, max_in_flight=None, memory_limit_mb=None, shard_dir=None):
+    """
+    Run ``task(path)`` for every path on a bounded process pool.
+
+    Parameters:
+    - paths (list): Files to process.
+    - task (callable): Module level function taking a path and returning the number of pages it stored.
+    - workers (int, optional): Number of worker processes. Default is 4.
+    - max_in_flight (int, optional): Maximum number of submitted but unfinished files. New files are only
+      submitted once others finish, which bounds the memory held by pending work. Default is twice the workers.
+    - memory_limit_mb (int, optional): Address space ceiling for every worker process. Default is None, no limit.
+    - shard_dir (str, optional): Write to one shard database per worker process in this directory instead of
+      the main database, see database.shards.compact_shards. Default is None, the main database.
+
+    Returns:
+    - dict: files, pages, seconds, failures and the list of failed paths.
+    """
+    max_in_flight = max_in_flight or workers * 2
+    summary = {"files": 0, "pages": 0, "seconds": 0.0, "failures": 0, "failed_paths": []}
+    start_time = time.perf_counter()
+    pending_paths = list(reversed(paths))
+
+    def new_executor():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(memory_limit_mb, get_database_url(), shard_dir))
+
+    executor = new_executor()
+    in_flight = {}
+    try:
+        while pending_paths or in_flight:
+            # Top up the in-flight set, this is where the backpressure comes from
+            while pending_paths and len(in_flight) < max_in_flight:
+                path = pending_paths.pop()
+                in_flight[executor.submit(_run_task, task, path)] = path
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            pool_broken = False
+            for future in done:
+                path = in_flight.pop(future)
+                try:
+                    pages, elapsed, worker_metrics = future.result()
+                except BrokenProcessPool:
+                    pool_broken = True
+                    summary["failures"] += 1
+                    summary["failed_paths"].append(path)
+                    logger.error("Worker died while processing %s", path)
+                except Exception as exc:
+                    if getattr(exc, "worker_metrics", None):
+                        metrics.merge(exc.worker_metrics)
+                    summary["failures"] += 1
+                    summary["failed_paths"].append(path)
+                    logger.error("Failed to process %s: %r", path, exc)
+                else:
+                    metrics.merge(worker_metrics)
+                    summary["files"] += 1
+                    summary["pages"] += pages
+                    logger.info("Processed %s: %s pages in %.2fs", path, pages, elapsed)
+
+            if pool_broken:
+                # Every other in-flight file went down with the pool as well
+                for future, path in in_flight.items():
+                    summary["failures"] += 1
+                    summary["failed_paths"].append(path)
+                    logger.error("Worker pool broke while processing %s", path)
+                in_flight = {}
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = new_executor()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    summary["seconds"] = time.perf_counter() - start_time
+    return summary
+
+
+def format_summary(summary):
+    seconds = summary["seconds"]
+    pages_per_sec = summary["pages"] / seconds if seconds > 0 else 0.0
+    files_per_min = summary["files"] * 60 / seconds if seconds > 0 else 0.0
+    return (f"Processed {summary['files']} files, {summary['pages']} pages in {seconds:.1f}s "
+            f"({pages_per_sec:.1f} pages/sec, {files_per_min:.1f} files/min), {summary['failures']} failures")
@@ -0,0 +1,125 @@
+import time
+
+import numpy as np
+
+from database.db_utils import (count_embeddings, get_embedded_file_names, get_processed_texts_by_ids,
+                               load_file_vectors)
+from database.vector_index import IVFIndex, normalize_rows, top_k_indices
+from logging_util import logger
+from model_registry import get_model
+
+# Up to this many vectors a query scores every vector, above it the IVF index is used if it exists
+EXACT_SEARCH_LIMIT = 50000
+
+
+def embed_query(query):
+    """Embed a query with the model the chunks were embedded with."""
+    model = get_model("sentence_transformer")
+    return np.asarray(model.encode([query], convert_to_numpy=True, show_progress_bar=False)[0], dtype=np.float32)
+
+
+def exact_search(query_vector, top_k=10, file_names=None):
+    """
+    Score every stored vector against the query, one memory-mapped file at a time.
+
+    Returns:
+    - tuple: (int64 ProcessedText ids, float32 cosine similarities), best first.
+    """
+    query_vector = normalize_rows(query_vector)
+    found_ids = []
+    found_scores = []
+    for file_name in file_names or get_embedded_file_names():
+        vectors, chunk_ids = load_file_vectors(file_name)
+        if len(vectors) == 0:
+            continue
+        norms = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+        norms[norms == 0] = 1.0
+        scores = (vectors @ query_vector) / norms
+        best = top_k_indices(scores, top_k)
+        found_ids.append(np.asarray(chunk_ids[best]))
+        found_scores.append(scores[best])
+
+    if not found_ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    found_ids = np.concatenate(found_ids)
+    found_scores = np.concatenate(found_scores)
+    best = top_k_indices(found_scores, top_k)
+    return found_ids[best], found_scores[best]
+
+
+def build_search_index(nlist=None):
+    """(Re)build the IVF index from the vector stores of every file. Returns the number of indexed vectors."""
+    start_time = time.perf_counter()
+    all_ids = []
+    all_vectors = []
+    for file_name in get_embedded_file_names():
+        vectors, chunk_ids = load_file_vectors(file_name)
+        all_ids.append(np.asarray(chunk_ids))
+        all_vectors.append(np.asarray(vectors))
+    if not all_ids:
+        logger.info("No embeddings to index")
+        return 0
+
+    chunk_ids = np.concatenate(all_ids)
+    vectors = np.concatenate(all_vectors)
+    IVFIndex().build(chunk_ids, vectors, nlist=nlist)
+    logger.info("Built search index over %d vectors in %.1fs", len(chunk_ids), time.perf_counter() - start_time)
+    return len(chunk_ids)
+
+
+def search_vectors(query_vector, top_k=10, file_names=None, nprobe=8, exact=None):
+    """
+    Find the stored chunks most similar to a query vector.
+
+    Small corpora, searches restricted to some files and corpora without an index are searched
+    exactly. Otherwise the IVF index is probed, it skips the rows of deleted texts (see
+    IVFIndex.remove). Ids are never reused, so a text deleted since it was embedded can't be
+    mistaken for another one, search drops it when its text isn't found. The index is asked for a
+    few extra candidates to make up for those.
+    """
+    index = IVFIndex()
+    if exact is None:
+        exact = bool(file_names) or not index.exists() or count_embeddings() <= EXACT_SEARCH_LIMIT
+    if exact:
+        return exact_search(query_vector, top_k, file_names)
+
+    meta = index.meta
+    if index.count() > 4 * meta["trained_count"]:
+        logger.warning("The search index grew over 4x since its centroids were trained, "
+                       "rebuild it with enq.py -c buildIndex")
+    return index.search(query_vector, top_k=top_k * 2, nprobe=nprobe)
+
+
+def search(query, top_k=10, file_names=None, nprobe=8, exact=None):
+    """
+    Semantic search over the processed chunks of all files.
+
+    Parameters:
+    - query (str): Free text query.
+    - top_k (int, optional): Number of chunks to return. Default is 10.
+    - file_names (list, optional): Only search the chunks of these files. Default is None, every file.
+    - nprobe (int, optional): Number of IVF lists probed by approximate searches. Default is 8.
+    - exact (bool, optional): Force (True) or avoid (False) the exact search. Default is None, decided by size.
+
+    Returns:
+    - list: Dictionaries with chunk_id, file_name, score and content, best first.
+    """
+    start_time = time.perf_counter()
+    chunk_ids, scores = search_vectors(embed_query(query), top_k, file_names, nprobe, exact)
+    texts = get_processed_texts_by_ids(chunk_ids.tolist())
+
+    results = []
+    seen = set()
+    for chunk_id, score in zip(chunk_ids.tolist(), scores.tolist()):
+        # A text embedded twice is returned once, with its best score
+        if chunk_id not in texts or chunk_id in seen:
+            continue
+        seen.add(chunk_id)
+        file_name, content = texts[chunk_id]
+        results.append({"chunk_id": chunk_id, "file_name": file_name, "score": score, "content": content})
+        if len(results) == top_k:
+            break
+
+    logger.info("Search for %r returned %d chunks in %.0fms",
+                query, len(results), (time.perf_counter() - start_time) * 1000)
+    return results
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from database.db_utils import (initialize_database, ChunkWriter, store_processed_text, store_embeddings,
+                               get_unprocessed_chunks, get_unembedded_processed_texts)
+from database.embedding_codec import encode_embeddings
+from database.session import configure_engine, get_engine
+
+# Chunks draw their words from one of these, so topic models have structure to find
+TOPIC_WORDS = [
+    "revenue growth margin profit quarter earnings dividend shareholder forecast sales".split(),
+    "school teacher student exam classroom curriculum university degree lesson campus".split(),
+    "hospital patient doctor nurse clinic treatment disease vaccine surgery health".split(),
+    "river rain flood drought water reservoir irrigation dam rainfall catchment".split(),
+]
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fresh SQLite database in a temporary working directory, as the current engine."""
+    monkeypatch.chdir(tmp_path)
+    engine = configure_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    yield engine
+    get_engine().dispose()
+
+
+def clustered_vectors(count, dim=16, groups=4, seed=0):
+    """float32 vectors scattered around groups random directions."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((groups, dim)).astype(np.float32)
+    return centers[rng.integers(0, groups, count)] + 0.3 * rng.standard_normal((count, dim)).astype(np.float32)
+
+
+@pytest.fixture
+def store_files(database):
+    """
+    Fill the test database. Call it with {file_name: number of pages}, every page gets a chunk of
+    random words on one of TOPIC_WORDS and, unless turned off, a processed text and a float16 embedding.
+    """
+    def store(files, processed=True, embedded=True, dim=16, seed=0):
+        initialize_database()
+        rng = np.random.default_rng(seed)
+        for number, (file_name, page_count) in enumerate(files.items()):
+            with ChunkWriter(file_name) as writer:
+                for page_number in range(1, page_count + 1):
+                    words = TOPIC_WORDS[rng.integers(len(TOPIC_WORDS))]
+                    writer.add_chunk(" ".join(rng.choice(words, 40)), page_number)
+            if not processed:
+                continue
+            chunks = get_unprocessed_chunks(file_name)
+            store_processed_text(file_name, [content for _, content in chunks], [chunk_id for chunk_id, _ in chunks])
+            if not embedded:
+                continue
+            texts = get_unembedded_processed_texts(file_name)
+            vectors = clustered_vectors(len(texts), dim=dim, seed=seed + number)
+            store_embeddings([dict(encoded, file_name=file_name, chunk_id=text_id)
+                              for (text_id, _), encoded in zip(texts, encode_embeddings(vectors, "float16"))])
+        return list(files)
+    return store
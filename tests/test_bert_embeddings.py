@@ -0,0 +1,36 @@
+import numpy as np
+
+import topic
+from database.db_utils import get_file_backlog, get_embedding_matrix
+
+
+class _FakeModel:
+    def __init__(self):
+        self.windows = []
+
+    def encode(self, texts, batch_size, **options):
+        self.windows.append(list(texts))
+        return np.array([[len(text), 1.0, 0.0, 0.0] for text in texts], dtype=np.float32)
+
+
+def test_texts_are_embedded_in_length_sorted_windows(store_files, monkeypatch):
+    model = _FakeModel()
+    monkeypatch.setattr(topic, "get_model", lambda name: model)
+    file_name, = store_files({"a.pdf": 8}, embedded=False)
+    flushed = []
+
+    assert topic.get_bert_embeddings(file_name, store_every=3, on_flush=flushed.append) == 8
+    assert flushed == [3, 6, 8]
+    assert [len(window) for window in model.windows] == [3, 3, 2]
+    assert all(window == sorted(window, key=len) for window in model.windows)
+    assert get_file_backlog(file_name)["unembedded"] == 0
+    matrix, _ = get_embedding_matrix(file_name)
+    assert matrix.shape == (8, 4)
+
+
+def test_nothing_to_embed_does_not_load_the_model(store_files, monkeypatch):
+    def get_model(name):
+        raise AssertionError("the model was loaded")
+    monkeypatch.setattr(topic, "get_model", get_model)
+    file_name, = store_files({"a.pdf": 4})
+    assert topic.get_bert_embeddings(file_name) == 0
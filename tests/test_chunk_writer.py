@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from database.db_utils import initialize_database, ChunkWriter, get_chunks_for_file, get_file_hashes
+
+
+def _fail_next_commit(writer):
+    commit = writer.session.commit
+
+    def failing_commit():
+        writer.session.commit = commit
+        raise OperationalError("COMMIT", {}, Exception("database is locked"))
+    writer.session.commit = failing_commit
+
+
+def test_failed_flush_keeps_rows_for_the_next_flush(database):
+    initialize_database()
+    with ChunkWriter("a.pdf", flush_every=None) as writer:
+        writer.add_chunk("first", 1)
+        _fail_next_commit(writer)
+        with pytest.raises(OperationalError):
+            writer.flush()
+        writer.add_chunk("second", 2)
+    assert get_chunks_for_file("a.pdf") == ["first", "second"]
+
+
+def test_exit_keeps_the_original_error_and_the_buffered_rows(database):
+    initialize_database()
+    with pytest.raises(ValueError, match="extraction failed"):
+        with ChunkWriter("b.pdf", flush_every=None) as writer:
+            writer.add_chunk("page", 1)
+            writer.set_content_hash("hash")
+            raise ValueError("extraction failed")
+    assert get_chunks_for_file("b.pdf") == ["page"]
+    # The file wasn't stored completely, its hash isn't recorded
+    assert get_file_hashes("b.pdf")[0] is None
+
+
+def test_exit_after_failed_flush_raises_the_flush_error(database):
+    initialize_database()
+    with pytest.raises(OperationalError, match="database is locked"):
+        with ChunkWriter("c.pdf", flush_every=1) as writer:
+            _fail_next_commit(writer)
+            writer.add_chunk("page", 1)
+    assert get_chunks_for_file("c.pdf") == ["page"]
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from chunker import chunk_pages, _hard_split
+
+
+def _sentences(rng, count):
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(3, 12))).capitalize() + rng.choice(".!?")
+            for _ in range(count)]
+
+
+def _pages(rng, page_count=6):
+    pages = []
+    for page_number in range(1, page_count + 1):
+        paragraphs = [" ".join(_sentences(rng, rng.randint(1, 5))) for _ in range(rng.randint(1, 4))]
+        pages.append((page_number, "\n\n".join(paragraphs)))
+    return pages
+
+
+def test_chunks_end_on_sentence_boundaries_and_fit_the_chunk_size():
+    rng = random.Random(0)
+    pages = _pages(rng)
+    for chunk_size in (80, 200, 1000):
+        chunks = list(chunk_pages(pages, chunk_size=chunk_size))
+        assert all(len(chunk["text"]) <= chunk_size for chunk in chunks)
+        assert all(chunk["text"][-1] in ".!?" for chunk in chunks)
+        # Nothing is lost or reordered
+        assert "".join(chunk["text"] for chunk in chunks).replace(" ", "").replace("\n", "") == \
+            "".join(text for _, text in pages).replace(" ", "").replace("\n", "")
+
+
+def test_chunks_keep_paragraph_breaks():
+    pages = [(1, "First sentence. Second one.\n\nA new paragraph.\n  \nAnd another!"), (2, "Next page.")]
+    chunk, = chunk_pages(pages, chunk_size=1000)
+    assert chunk["text"] == "First sentence. Second one.\n\nA new paragraph.\n\nAnd another!\nNext page."
+
+
+def test_overlap_repeats_whole_trailing_sentences():
+    pages = [(1, "A1 aaaa. B2 bbbb. C3 cccc.\n\nD4 dddd. E5 a longer sentence.")]
+    chunks = [chunk["text"] for chunk in chunk_pages(pages, chunk_size=28, overlap=10)]
+    assert chunks == ["A1 aaaa. B2 bbbb. C3 cccc.", "C3 cccc.\n\nD4 dddd.", "E5 a longer sentence."]
+
+    # Every chunk starts with the trailing sentences of the one before it that fit the overlap
+    rng = random.Random(1)
+    chunks = [chunk["text"] for chunk in chunk_pages(_pages(rng), chunk_size=400, overlap=150)]
+    carried = 0
+    for previous, chunk in zip(chunks, chunks[1:]):
+        ends = [end + 1 for end in range(min(len(chunk), 150)) if chunk[end] in ".!?"]
+        carried += any(previous.endswith(chunk[:end]) for end in ends)
+        assert len(chunk) <= 400
+    assert carried == len(chunks) - 1
+
+
+def test_overlap_must_be_smaller_than_the_chunk_size():
+    with pytest.raises(ValueError):
+        list(chunk_pages([(1, "Some text.")], chunk_size=100, overlap=100))
+
+
+def test_units_without_whitespace_are_split_anywhere():
+    assert list(_hard_split("x" * 25, 10)) == ["x" * 10, "x" * 10, "x" * 5]
+    assert list(_hard_split("aaaa bbbb cccc", 10)) == ["aaaa bbbb", "cccc"]
+    chunks = list(chunk_pages([(1, "y" * 25)], chunk_size=10))
+    assert [chunk["text"] for chunk in chunks] == ["y" * 10, "y" * 10, "y" * 5]
+
+
+def test_chunks_spanning_pages_record_their_first_and_last_page():
+    pages = [(1, "One."), (2, "Two."), (3, "Three is a longer sentence."), (4, "Four.")]
+    chunks = list(chunk_pages(pages, chunk_size=15))
+    assert [(chunk["text"], chunk["start_page"], chunk["end_page"]) for chunk in chunks] == [
+        ("One.\nTwo.", 1, 2), ("Three is a", 3, 3), ("longer", 3, 3), ("sentence.\nFour.", 3, 4)]
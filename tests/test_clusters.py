@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("sklearn")
+
+from database.db_utils import get_clusters_by_file, get_file_backlog
+from topic import cluster_embeddings
+
+
+def test_file_and_corpus_clusterings_are_kept_apart(store_files):
+    first, second = store_files({"a.pdf": 40, "b.pdf": 40})
+    cluster_embeddings(first, n_clusters=3, warm_start=False)
+    cluster_embeddings(second, n_clusters=3, warm_start=False)
+    file_labels = get_clusters_by_file(first)
+
+    cluster_embeddings(None, n_clusters=8, warm_start=False)
+    assert get_clusters_by_file(first) == file_labels
+    assert len(get_clusters_by_file(first, scope="corpus")) == 40
+    assert len(get_clusters_by_file(second, scope="corpus")) == 40
+
+    # A per-file run replaces the labels of that file only, the corpus labels stay
+    cluster_embeddings(first, n_clusters=5, warm_start=False)
+    assert {row["cluster_label"] for row in get_clusters_by_file(first)} <= set(range(5))
+    assert len(get_clusters_by_file(first, scope="corpus")) == 40
+    assert len(get_clusters_by_file(second)) == 40
+
+
+def test_corpus_labels_dont_count_as_file_clustering(store_files):
+    file_name, = store_files({"a.pdf": 30})
+    cluster_embeddings(None, n_clusters=4, warm_start=False)
+    assert get_file_backlog(file_name)["unclustered"] == 30
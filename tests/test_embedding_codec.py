@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from database.db_utils import get_embedding_matrix, get_unembedded_processed_texts, store_embeddings
+from database.embedding_codec import encode_embeddings, decode_embeddings
+
+
+def _vectors(count=50, dim=32, seed=0):
+    return np.random.default_rng(seed).normal(scale=3.0, size=(count, dim)).astype(np.float32)
+
+
+def _round_trip(vectors, dtype):
+    rows = encode_embeddings(vectors, dtype)
+    assert {row["dtype"] for row in rows} == {dtype} and {row["dim"] for row in rows} == {vectors.shape[1]}
+    return decode_embeddings([row["embedding"] for row in rows], dtype, vectors.shape[1], [row["scale"] for row in rows])
+
+
+def test_round_trip_error_bounds():
+    vectors = _vectors()
+    assert np.array_equal(_round_trip(vectors, "float32"), vectors)
+
+    # float16 keeps 11 significant bits
+    assert np.all(np.abs(_round_trip(vectors, "float16") - vectors) <= np.abs(vectors) * 2.0 ** -11 + 1e-7)
+
+    # int8 rounds every component to a multiple of its row's scale, the largest one maps to 127
+    scales = np.abs(vectors).max(axis=1, keepdims=True) / 127
+    decoded = _round_trip(vectors, "int8")
+    assert np.all(np.abs(decoded - vectors) <= scales / 2 + 1e-6)
+    assert np.allclose(np.abs(decoded).max(axis=1), np.abs(vectors).max(axis=1), rtol=1e-6)
+
+
+def test_edge_cases():
+    zero = np.zeros((2, 4), dtype=np.float32)
+    assert np.array_equal(_round_trip(zero, "int8"), zero)
+    assert decode_embeddings([], "float16", 8).shape == (0, 8)
+    # A single vector is encoded as one row
+    assert len(encode_embeddings(np.ones(4), "float16")) == 1
+    with pytest.raises(ValueError):
+        encode_embeddings(zero, "float64")
+
+
+def test_rows_of_mixed_dtypes_decode_into_one_matrix(store_files):
+    file_name, = store_files({"a.pdf": 8}, embedded=False)
+    texts = get_unembedded_processed_texts(file_name)
+    vectors = _vectors(len(texts), dim=16)
+    dtypes = ["float32", "float16", "int8", "float16", "int8", "float32", "float32", "int8"]
+    rows = [dict(encode_embeddings(vector, dtype)[0], file_name=file_name, chunk_id=text_id)
+            for (text_id, _), vector, dtype in zip(texts, vectors, dtypes)]
+    # Rows stored before the encoding columns existed are raw float32 without dtype and dim
+    rows[-2].update(embedding=vectors[-2].tobytes(), dtype=None, dim=None, scale=None)
+    store_embeddings(rows)
+
+    matrix, chunk_ids = get_embedding_matrix(file_name)
+    assert chunk_ids.tolist() == sorted(text_id for text_id, _ in texts)
+    assert matrix.dtype == np.float32 and matrix.shape == vectors.shape
+    order = np.argsort([text_id for text_id, _ in texts])
+    assert np.allclose(matrix, vectors[order], atol=np.abs(vectors).max() / 127)
+    exact = [position for position, row in enumerate(order) if dtypes[row] == "float32" or row == len(texts) - 2]
+    assert np.array_equal(matrix[exact], vectors[order][exact])
+
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("pdfplumber")
+
+import enq
+from enq import group_file_stages
+from metrics import metrics
+
+
+def test_stages_of_one_file_run_as_a_pipeline():
+    tasks = [("process_pdf", "a.pdf", {"force": False}), ("apply_nlp_on_file", "a.pdf", {}),
+             ("apply_nlp_on_file", "b.pdf", {})]
+    grouped = group_file_stages(tasks, workers=2)
+    assert grouped == [("run_pipeline", ["a.pdf"], {"stages": ["extract", "nlp"],
+                                                    "options": {"extract": {"force": False}, "nlp": {}},
+                                                    "workers": 2}),
+                       ("apply_nlp_on_file", "b.pdf", {})]
+
+
+def test_text_and_table_extraction_of_one_file_is_rejected():
+    with pytest.raises(ValueError, match="a.pdf"):
+        group_file_stages([("process_pdf", "a.pdf", {}), ("process_pdf_with_tables", "a.pdf", {})])
+    # Different files don't conflict
+    assert len(group_file_stages([("process_pdf", "a.pdf", {}), ("process_pdf_with_tables", "b.pdf", {})])) == 2
+
+
+def _run_enq(monkeypatch, *args):
+    metrics.snapshot(reset=True)
+    monkeypatch.setattr("sys.argv", ["enq.py", *args])
+    enq.main()
+
+
+def test_commands_without_stages_write_no_report(database, tmp_path, monkeypatch):
+    _run_enq(monkeypatch, "-c", "initDB")
+    assert not (tmp_path / "run_report.json").exists()
+
+
+def test_report_is_written_where_asked(database, tmp_path, monkeypatch):
+    _run_enq(monkeypatch, "-c", "initDB", "--report", "initdb.json")
+    assert (tmp_path / "initdb.json").exists()
+    assert not (tmp_path / "run_report.json").exists()
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("pdfplumber")
+
+from benchmarks.synthetic_pdf import write_pdf
+from database.db_utils import initialize_database, get_chunks_for_file, get_tables_hash, get_tables_for_file
+
+
+def test_tables_are_extracted_for_a_file_ingested_text_only(database):
+    from get_data import extract_pdf_content_and_store, extract_pdf_pages_and_store, file_content_hash
+    initialize_database()
+    path = write_pdf("tables.pdf", pages=2, kind="tables")
+
+    assert extract_pdf_content_and_store(path) == 2
+    chunks = get_chunks_for_file(path)
+    assert get_tables_hash(path) is None
+
+    # Only the tables are extracted, the stored text is kept
+    assert extract_pdf_pages_and_store(path) == 2
+    assert get_chunks_for_file(path) == chunks
+    assert len(get_tables_for_file(path)) == 4
+    assert get_tables_hash(path) == file_content_hash(path)
+
+    assert extract_pdf_pages_and_store(path) == 0
+    assert extract_pdf_content_and_store(path) == 0
+
+
+def test_chunked_extraction_never_mixes_with_per_page_chunks(database):
+    from get_data import extract_pdf_content_and_store, extract_pdf_in_chunks_and_store
+    initialize_database()
+    path = write_pdf("report.pdf", pages=4)
+
+    assert extract_pdf_content_and_store(path) == 4
+    chunk_count = extract_pdf_in_chunks_and_store(path, chunk_size=1500)
+    assert len(get_chunks_for_file(path)) == chunk_count
+    assert any(end_page > page for page, end_page in _chunk_pages(database, path))
+
+    # The changed file is extracted page by page again, none of the spanning chunks survive
+    write_pdf(path, pages=4, seed=1)
+    assert extract_pdf_content_and_store(path) == 4
+    assert _chunk_pages(database, path) == [(page, page) for page in range(1, 5)]
+
+
+def _chunk_pages(engine, file_name):
+    from sqlalchemy import text
+    with engine.connect() as connection:
+        return [tuple(row) for row in connection.execute(text(
+            "SELECT c.page_number, c.end_page_number FROM text_chunks c JOIN files f ON f.id = c.file_id "
+            "WHERE f.file_name = :file_name ORDER BY c.id"), {"file_name": file_name})]
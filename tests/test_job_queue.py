@@ -0,0 +1,57 @@
+import time
+
+from database import job_queue
+from database.job_queue import (ensure_job_table, enqueue, claim_job, complete_job, fail_job, list_jobs,
+                                backoff_seconds)
+
+
+def _job(job_id):
+    return next(job for job in list_jobs() if job["id"] == job_id)
+
+
+def test_failed_job_is_retried_then_dead_lettered(database):
+    ensure_job_table()
+    job_id = enqueue("process_pdf", "a.pdf", max_attempts=2)
+
+    assert claim_job("w1")["id"] == job_id
+    assert fail_job(job_id, "w1", "boom") == "pending"
+    assert _job(job_id)["available_at"] >= time.time() + backoff_seconds(1) - 1
+    assert claim_job("w1") is None
+
+    with job_queue.session_scope(write=True) as session:
+        session.query(job_queue.Job).update({"available_at": time.time()})
+    assert claim_job("w1")["attempts"] == 2
+    assert fail_job(job_id, "w1", "boom") == "dead"
+    assert claim_job("w1") is None
+
+
+def test_expired_lease_counts_as_failed_attempt(database):
+    ensure_job_table()
+    job_id = enqueue("process_pdf", "poison.pdf", max_attempts=2)
+
+    assert claim_job("w1", lease_seconds=0.01)["attempts"] == 1
+    time.sleep(0.02)
+    # The lease ended without the worker finishing: retried after the backoff, not right away
+    assert claim_job("w2", lease_seconds=0.01) is None
+    job = _job(job_id)
+    assert job["status"] == "pending"
+    assert job["attempts"] == 1
+    assert job["available_at"] >= time.time() + backoff_seconds(1) - 1
+    assert "Lease expired" in job["last_error"]
+
+    with job_queue.session_scope(write=True) as session:
+        session.query(job_queue.Job).update({"available_at": time.time()})
+    assert claim_job("w2", lease_seconds=0.01)["attempts"] == 2
+    time.sleep(0.02)
+    assert claim_job("w3", lease_seconds=0.01) is None
+    assert _job(job_id)["status"] == "dead"
+
+
+def test_worker_that_lost_its_lease_cannot_complete(database):
+    ensure_job_table()
+    job_id = enqueue("process_pdf", "slow.pdf", max_attempts=3)
+    claim_job("w1", lease_seconds=0.01)
+    time.sleep(0.02)
+    claim_job("w2")
+    complete_job(job_id, "w1")
+    assert _job(job_id)["status"] == "pending"
@@ -0,0 +1,109 @@
+import os
+import pstats
+import re
+
+import pytest
+
+import profiling
+from metrics import LATENCY_BUCKETS, Metrics
+from profiling import profile_task
+
+
+def test_stage_counts_runs_by_outcome_and_observes_their_time():
+    registry = Metrics()
+    with registry.stage("extract"):
+        registry.inc("items_total", 3, stage="extract")
+    with pytest.raises(RuntimeError):
+        with registry.stage("extract"):
+            raise RuntimeError("broken pdf")
+
+    assert registry.counter("stage_runs_total", stage="extract", status="done") == 1
+    assert registry.counter("stage_runs_total", stage="extract", status="failed") == 1
+    assert registry.counter("items_total", stage="extract") == 3
+    buckets, count, total, low, high = registry.histograms[("stage_seconds", (("stage", "extract"),))]
+    assert count == 2 and sum(buckets) == 2 and 0 <= low <= high and total >= high
+
+
+def test_observations_land_in_their_buckets():
+    registry = Metrics()
+    registry.observe("chunk_seconds", 0.003, count=4)
+    registry.observe("chunk_seconds", 0.005)
+    registry.observe("chunk_seconds", 1000.0)
+    buckets, count, total, low, high = registry.histograms[("chunk_seconds", ())]
+    # A bucket counts the values up to and including its bound
+    assert buckets[LATENCY_BUCKETS.index(0.005)] == 5 and buckets[-1] == 1
+    assert count == 6 and total == pytest.approx(1000.017)
+    assert (low, high) == (0.003, 1000.0)
+
+
+def test_merged_snapshots_add_up():
+    parent, worker = Metrics(), Metrics()
+    parent.inc("items_total", 2, stage="embed")
+    parent.observe("chunk_seconds", 0.02, count=2, stage="embed")
+    worker.inc("items_total", 5, stage="embed")
+    worker.inc("items_total", 1, stage="nlp")
+    worker.observe("chunk_seconds", 0.4, count=5, stage="embed")
+
+    parent.merge(worker.snapshot(reset=True))
+    assert worker.counters == {} and worker.histograms == {}
+    assert parent.counter("items_total", stage="embed") == 7 and parent.counter("items_total", stage="nlp") == 1
+    buckets, count, total, low, high = parent.histograms[("chunk_seconds", (("stage", "embed"),))]
+    assert count == 7 and sum(buckets) == 7
+    assert total == pytest.approx(2.04) and (low, high) == (0.02, 0.4)
+
+    # A snapshot is a copy, merging it doesn't change the registry it came from
+    snapshot = parent.snapshot()
+    parent.merge(snapshot)
+    assert snapshot["counters"][("items_total", (("stage", "embed"),))] == 7
+    assert parent.counter("items_total", stage="embed") == 14
+
+
+def test_prometheus_exposition_is_well_formed():
+    registry = Metrics()
+    registry.inc("stage_runs_total", stage="nlp", status="done")
+    registry.observe("stage_seconds", 0.07, stage="nlp")
+    registry.observe("stage_seconds", 3.0, stage="nlp")
+    text = registry.prometheus()
+    lines = text.splitlines()
+    assert text.endswith("\n")
+
+    sample = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? -?[0-9.e+]+$')
+    for line in lines:
+        assert line.startswith("# TYPE ") or sample.match(line), line
+    assert "# TYPE stage_runs_total counter" in lines and "# TYPE stage_seconds histogram" in lines
+    assert 'stage_runs_total{stage="nlp",status="done"} 1' in lines
+
+    bucket_counts = [int(line.rsplit(" ", 1)[1]) for line in lines if line.startswith("stage_seconds_bucket")]
+    assert len(bucket_counts) == len(LATENCY_BUCKETS) + 1
+    # Cumulative, the +Inf bucket holds every observation
+    assert bucket_counts == sorted(bucket_counts) and bucket_counts[-1] == 2
+    assert 'stage_seconds_bucket{le="+Inf",stage="nlp"} 2' in lines
+    assert 'stage_seconds_count{stage="nlp"} 2' in lines
+    assert float(next(line for line in lines if line.startswith("stage_seconds_sum")).split()[1]) == pytest.approx(3.07)
+
+
+def test_profile_task_writes_dumps_named_after_the_task(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "profiles", [])
+    with profile_task("process_pdf", "/data/reports/q3 report.pdf", mode="both", directory=str(tmp_path)):
+        sum(range(1000))
+
+    result, = profiling.profiles
+    assert result["status"] == "done"
+    name = os.path.basename(result["cpu_path"])
+    assert re.fullmatch(r"\d{8}-\d{6}-\d{3}-process_pdf-q3_report\.pdf\.prof", name), name
+    assert sorted(os.listdir(tmp_path)) == sorted([name, name[:-len(".prof")] + ".tracemalloc"])
+    assert pstats.Stats(result["cpu_path"]).total_calls > 0
+    assert result["functions"] and result["peak_bytes"] > 0
+
+
+def test_profile_task_records_failed_tasks(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "profiles", [])
+    with pytest.raises(ValueError):
+        with profile_task("embed", None, mode="cpu", directory=str(tmp_path)):
+            raise ValueError("no texts")
+    result, = profiling.profiles
+    assert result["status"] == "failed" and result["cpu_path"].endswith("-embed-none.prof")
+    assert "mem_path" not in result
+    with pytest.raises(ValueError):
+        with profile_task("embed", None, mode="gpu", directory=str(tmp_path)):
+            pass
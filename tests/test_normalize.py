@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from benchmarks.bench_normalize import random_text, reference_reduce_duplicates, reference_process_extracted_text
+from normalize import TextNormalizer, collapse_repeats, collapse_whitespace, join_single_letters
+
+# Every character str.split() splits on, beyond the ASCII space
+UNICODE_WHITESPACE = ("\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f\x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005"
+                      "\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000")
+
+EDGE_CASES = ["", " ", "a", "a b c", " x hello ", "aaa", "\n\n", "ab c  ", "  ", "a  a", "\u20ac\u20ac\xe9 \xe9",
+              "x\xa0y z", "\u3000a\u2003b\u3000", "a\x1cb", "\u200b", "a\u200bb c", "\ufb01 \ufb01",
+              "\U0001F600\U0001F600 a"] + list(UNICODE_WHITESPACE)
+
+
+def _assert_matches_reference(text):
+    assert collapse_repeats(text) == reference_reduce_duplicates(text)
+    assert join_single_letters(text) == reference_process_extracted_text(text)
+    assert collapse_whitespace(text) == " ".join(text.split())
+    assert TextNormalizer(["collapse_repeats", "join_single_letters"])(text) == \
+        reference_process_extracted_text(reference_reduce_duplicates(text))
+
+
+@pytest.mark.parametrize("text", EDGE_CASES)
+def test_edge_cases_match_the_reference(text):
+    _assert_matches_reference(text)
+
+
+def test_random_text_matches_the_reference():
+    rng = random.Random(0)
+    for _ in range(500):
+        _assert_matches_reference(random_text(rng, rng.randint(0, 300)))
+
+
+def test_unicode_whitespace_matches_the_reference():
+    rng = random.Random(1)
+    for _ in range(200):
+        words = ["".join(rng.choice("ab€") * rng.randint(1, 3) for _ in range(rng.choice([1, 1, 2, 4])))
+                 for _ in range(rng.randint(0, 12))]
+        text = "".join(word + rng.choice(UNICODE_WHITESPACE) * rng.randint(1, 2) for word in words)
+        _assert_matches_reference(text)
+
+
+def test_normalize_many_matches_one_by_one():
+    texts = EDGE_CASES + [random_text(random.Random(2), 200)]
+    normalizer = TextNormalizer(["collapse_repeats", "join_single_letters"])
+    assert list(normalizer.normalize_many(texts)) == [normalizer(text) for text in texts]
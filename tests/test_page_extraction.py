@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("pdfplumber")
+
+from benchmarks.synthetic_pdf import write_pdf
+from get_data import extract_layout_from_pdf_in_batches
+
+
+@pytest.fixture(scope="module")
+def pdf_path(tmp_path_factory):
+    return write_pdf(str(tmp_path_factory.mktemp("pdfs") / "report.pdf"), pages=13, kind="tables")
+
+
+def _pages(pdf_path, **options):
+    return [page for batch in extract_layout_from_pdf_in_batches(pdf_path, batch_size=2, **options) for page in batch]
+
+
+@pytest.mark.parametrize("pages", [None, [12, 2, 5, 6, 99]])
+def test_parallel_extraction_yields_the_pages_of_a_serial_one_in_order(pdf_path, pages):
+    serial = _pages(pdf_path, workers=1, pages=pages, with_tables=True)
+    # Seven page ranges of two pages with at most four in flight
+    parallel = _pages(pdf_path, workers=2, pages=pages, with_tables=True)
+    assert parallel == serial
+    expected = list(range(1, 14)) if pages is None else [2, 5, 6, 12]
+    assert [page["page_number"] for page in parallel] == expected
+    assert all(page["text"] and len(page["tables"]) == 2 for page in parallel)
@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("gensim")
+pytest.importorskip("pdfplumber")
+
+from benchmarks.synthetic_pdf import write_pdf
+from database.db_utils import initialize_database, get_topic_distributions
+from get_data import extract_pdf_content_and_store, extract_pdf_pages_and_store
+from pipeline import Pipeline, is_up_to_date
+from topic import generate_topic, topic_model_version
+
+
+def test_chunk_topics_of_an_older_model_version_are_stale(store_files):
+    first, second = store_files({"a.pdf": 20, "b.pdf": 20}, embedded=False)
+    generate_topic(first, num_topics=4, workers=1)
+    assert is_up_to_date("topic", first)
+
+    # Folding in the second file updates the model, the topics of the first were assigned by the old version
+    generate_topic(second, num_topics=4, workers=1)
+    assert is_up_to_date("topic", second)
+    assert not is_up_to_date("topic", first)
+
+    generate_topic(first, num_topics=4, workers=1)
+    assert is_up_to_date("topic", first)
+
+
+def test_every_file_of_a_pipeline_run_ends_up_with_current_topics(store_files):
+    file_names = store_files({"a.pdf": 20, "b.pdf": 20}, embedded=False)
+    summary = Pipeline(file_names, stages=["topic"], options={"topic": {"num_topics": 4, "workers": 1}},
+                       workers=2).run()
+    assert all(summary[file_name]["topic"]["status"] == "done" for file_name in file_names)
+    assert all(is_up_to_date("topic", file_name) for file_name in file_names)
+    assert get_topic_distributions(file_names)[file_names[0]]["model_versions"] == {topic_model_version()}
+
+    # A second run has nothing left to do
+    summary = Pipeline(file_names, stages=["topic"], workers=2).run()
+    assert all(summary[file_name]["topic"]["status"] == "skipped" for file_name in file_names)
+
+
+def test_text_only_extraction_is_stale_for_table_extraction(database):
+    initialize_database()
+    path = write_pdf("tables.pdf", pages=2, kind="tables")
+    extract_pdf_content_and_store(path)
+    assert is_up_to_date("extract", path)
+    assert not is_up_to_date("extract", path, {"with_tables": True})
+
+    extract_pdf_pages_and_store(path)
+    assert is_up_to_date("extract", path, {"with_tables": True})
@@ -0,0 +1,62 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("pdfplumber")
+
+from benchmarks.synthetic_pdf import write_pdf
+from database.db_utils import initialize_database, get_chunks_for_file
+from get_data import extract_pdf_content_and_store
+from metrics import metrics
+from scheduler import run_bulk_ingestion
+
+
+def _ingest(path):
+    if "crash" in path:
+        # A worker killed mid-file, e.g. by the OOM killer
+        os._exit(1)
+    return extract_pdf_content_and_store(path)
+
+
+def _record_overlap(path):
+    with open("events.log", "a") as log:
+        log.write("start\n")
+    time.sleep(0.2)
+    with open("events.log", "a") as log:
+        log.write("end\n")
+    return 1
+
+
+def test_failed_files_are_counted_and_the_rest_is_stored(database, tmp_path):
+    initialize_database()
+    metrics.snapshot(reset=True)
+    paths = [write_pdf(str(tmp_path / "a.pdf"), pages=2), str(tmp_path / "broken.pdf"),
+             str(tmp_path / "crash.pdf"), write_pdf(str(tmp_path / "b.pdf"), pages=3, seed=1)]
+    for path in paths[1:3]:
+        with open(path, "wb") as pdf_file:
+            pdf_file.write(b"not a pdf")
+
+    # One file in flight at a time, so only the crashing file goes down with the pool
+    summary = run_bulk_ingestion(paths, _ingest, workers=2, max_in_flight=1)
+    assert (summary["files"], summary["pages"], summary["failures"]) == (2, 5, 2)
+    assert sorted(summary["failed_paths"]) == sorted(paths[1:3])
+    # The pool was replaced after the crash, the file after it was still stored
+    assert len(get_chunks_for_file(paths[0])) == 2 and len(get_chunks_for_file(paths[3])) == 3
+
+    # The metrics the workers recorded are merged into the parent's
+    assert metrics.counter("stage_runs_total", stage="extract", status="done") == 2
+    assert metrics.counter("stage_runs_total", stage="extract", status="failed") == 1
+    assert metrics.counter("items_total", stage="extract") == 5
+
+
+def test_files_in_flight_are_bounded(database):
+    summary = run_bulk_ingestion([f"{number}.pdf" for number in range(6)], _record_overlap, workers=3,
+                                 max_in_flight=2)
+    assert summary["files"] == 6
+    running = overlap = 0
+    with open("events.log") as log:
+        for event in log.read().split():
+            running += 1 if event == "start" else -1
+            overlap = max(overlap, running)
+    assert overlap == 2
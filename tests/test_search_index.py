@@ -0,0 +1,59 @@
+import numpy as np
+
+import search
+from conftest import clustered_vectors
+from database.db_utils import (ChunkWriter, invalidate_pages, get_unprocessed_chunks, store_processed_text,
+                               get_unembedded_processed_texts, store_embeddings)
+from database.embedding_codec import encode_embeddings
+from database.vector_index import IVFIndex
+
+
+def test_removed_and_replaced_rows_are_not_returned(tmp_path):
+    index = IVFIndex(str(tmp_path))
+    vectors = clustered_vectors(200)
+    index.build(np.arange(200), vectors, nlist=4)
+
+    index.remove([0, 1])
+    # Id 2 is added again, only its new row counts
+    index.add([2], -vectors[2:3])
+    ids, _ = index.search(vectors[0], top_k=200, nprobe=4)
+    assert 0 not in ids and 1 not in ids
+    assert list(ids).count(2) == 1
+    assert len(ids) == 198
+
+    # An id removed and then added again is found through its new row
+    index.add([0], vectors[0:1])
+    ids, _ = index.search(vectors[0], top_k=1, nprobe=4)
+    assert list(ids) == [0]
+
+
+def test_search_after_reprocessing_returns_no_stale_texts(store_files, monkeypatch):
+    monkeypatch.setattr(search, "embed_query", lambda query: clustered_vectors(1)[0])
+    file_name, = store_files({"a.pdf": 60})
+    search.build_search_index(nlist=4)
+    before = {result["chunk_id"] for result in search.search("q", top_k=60, exact=False)}
+    assert before
+
+    # Pages 31-60 changed and are extracted and processed again
+    invalidate_pages(file_name, range(31, 61))
+    with ChunkWriter(file_name) as writer:
+        for page_number in range(31, 61):
+            writer.add_chunk(f"changed page {page_number}", page_number)
+    chunks = get_unprocessed_chunks(file_name)
+    store_processed_text(file_name, [content for _, content in chunks], [chunk_id for chunk_id, _ in chunks])
+    new_ids = {text_id for text_id, _ in get_unembedded_processed_texts(file_name)}
+    assert len(new_ids) == 30
+    # Deleted ids are never handed out again
+    assert not new_ids & before
+
+    results = search.search("q", top_k=60, exact=False)
+    assert {result["chunk_id"] for result in results} <= before
+    assert len(results) == len({result["chunk_id"] for result in results}) == 30
+
+    texts = get_unembedded_processed_texts(file_name)
+    rows = [dict(encoded, file_name=file_name, chunk_id=text_id)
+            for (text_id, _), encoded in zip(texts, encode_embeddings(clustered_vectors(len(texts), seed=1), "float16"))]
+    store_embeddings(rows)
+    store_embeddings(rows[:5])  # Embedded twice
+    results = search.search("q", top_k=100, exact=False)
+    assert len(results) == len({result["chunk_id"] for result in results}) == 60
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from database import shards
+from database.db_utils import (ChunkWriter, initialize_database, get_unprocessed_chunks, store_processed_text,
+                               get_unembedded_processed_texts, store_embeddings, get_embedding_matrix,
+                               get_chunks_for_file, get_file_names_across_shards, count_rows_across_shards)
+from database.embedding_codec import encode_embeddings
+from database.models import ChunkTopic
+from database.session import configure_engine, get_database_url, get_engine
+from database.shards import compact_shards, shard_url, ATTACH_LIMIT
+
+
+def _write_files(files):
+    """files: file_name -> number of chunks, every chunk with a processed text and an embedding."""
+    initialize_database()
+    for file_name, chunk_count in files.items():
+        with ChunkWriter(file_name) as writer:
+            for page_number in range(1, chunk_count + 1):
+                writer.add_chunk(f"{file_name} page {page_number}", page_number)
+        chunks = get_unprocessed_chunks(file_name)
+        store_processed_text(file_name, [content.upper() for _, content in chunks], [chunk_id for chunk_id, _ in chunks])
+        texts = get_unembedded_processed_texts(file_name)
+        vectors = np.random.default_rng(chunk_count).normal(size=(len(texts), 8)).astype(np.float32)
+        store_embeddings([dict(encoded, file_name=file_name, chunk_id=text_id)
+                          for (text_id, _), encoded in zip(texts, encode_embeddings(vectors, "float16"))])
+
+
+def _write_shard(shard_dir, name, files):
+    """Write a shard the way a sharded ingestion worker does, then switch back to the main database."""
+    main_url = get_database_url()
+    configure_engine(shard_url(name, shard_dir))
+    _write_files(files)
+    configure_engine(main_url)
+    return os.path.join(shard_dir, f"{name}.db")
+
+
+def _scalar(sql):
+    with get_engine().connect() as connection:
+        return connection.execute(text(sql)).scalar()
+
+
+def _file_id(file_name):
+    return _scalar(f"SELECT id FROM files WHERE file_name = '{file_name}'")
+
+
+@pytest.fixture
+def shard_dir(database, tmp_path):
+    # The main database holds a file the first shard replaces and one it leaves alone
+    _write_files({"kept.pdf": 3, "replaced.pdf": 4})
+    return str(tmp_path / "shards")
+
+
+def test_merge_keeps_every_reference_valid(shard_dir):
+    replaced_id = _file_id("replaced.pdf")
+    paths = [_write_shard(shard_dir, "a", {"replaced.pdf": 2, "new-a.pdf": 5}),
+             _write_shard(shard_dir, "b", {"new-b.pdf": 6})]
+
+    summary = compact_shards(paths)
+    assert summary["shards"] == 2 and summary["files"] == 3
+    assert not any(os.path.exists(path) for path in paths)
+
+    assert _file_id("replaced.pdf") == replaced_id
+    assert get_chunks_for_file("replaced.pdf") == ["replaced.pdf page 1", "replaced.pdf page 2"]
+    for file_name, chunk_count in {"kept.pdf": 3, "replaced.pdf": 2, "new-a.pdf": 5, "new-b.pdf": 6}.items():
+        matrix, chunk_ids = get_embedding_matrix(file_name)
+        assert matrix.shape == (chunk_count, 8) and len(set(chunk_ids.tolist())) == chunk_count
+
+    # Every processed text points at a chunk of its own file, every embedding at a processed text
+    assert _scalar("SELECT COUNT(*) FROM processed_texts p LEFT JOIN text_chunks c ON c.id = p.text_chunk_id "
+                   "WHERE c.id IS NULL OR c.file_id != p.file_id") == 0
+    assert _scalar("SELECT COUNT(*) FROM embeddings e LEFT JOIN processed_texts p ON p.id = e.chunk_id "
+                   "LEFT JOIN files f ON f.id = p.file_id WHERE f.file_name IS NOT e.file_name") == 0
+    assert _scalar("SELECT COUNT(*) FROM processed_texts p JOIN text_chunks c ON c.id = p.text_chunk_id "
+                   "WHERE p.content != UPPER(c.chunk_content)") == 0
+    assert _scalar("SELECT COUNT(*) FROM text_chunks") == 3 + 2 + 5 + 6
+
+
+def test_failed_merge_rolls_back(shard_dir, monkeypatch):
+    path = _write_shard(shard_dir, "a", {"replaced.pdf": 2, "new-a.pdf": 5})
+    before = count_rows_across_shards(shard_paths=[])
+    # The last table fails to copy, after every other table was replaced and copied
+    with monkeypatch.context() as patch, pytest.raises(Exception, match="no_such_column"):
+        patch.setattr(shards, "_REMAP", shards._REMAP + [(ChunkTopic, {"id": None, "chunk_id": "t.no_such_column"})])
+        compact_shards([path])
+    assert count_rows_across_shards(shard_paths=[]) == before
+    assert get_chunks_for_file("replaced.pdf") == [f"replaced.pdf page {page}" for page in range(1, 5)]
+    assert os.path.exists(path)
+
+    compact_shards([path])
+    assert get_chunks_for_file("replaced.pdf") == ["replaced.pdf page 1", "replaced.pdf page 2"]
+
+
+def test_readers_span_more_shards_than_can_be_attached(shard_dir):
+    paths = [_write_shard(shard_dir, f"s{number}", {f"shard{number}.pdf": number + 1})
+             for number in range(ATTACH_LIMIT + 2)]
+    chunk_counts = get_file_names_across_shards(paths)
+    assert chunk_counts == {"kept.pdf": 3, "replaced.pdf": 4,
+                            **{f"shard{number}.pdf": number + 1 for number in range(ATTACH_LIMIT + 2)}}
+    assert count_rows_across_shards(paths)["text_chunks"] == 7 + sum(range(1, ATTACH_LIMIT + 3))
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("gensim")
+
+from database.db_utils import get_chunk_topic_versions, get_topic_distributions, iter_processed_texts, replace_chunk_topics
+from topic import generate_topic, refresh_chunk_topics, topic_model_version
+
+
+def test_chunk_topics_of_an_older_model_version_are_refreshed(store_files):
+    first, second = store_files({"a.pdf": 20, "b.pdf": 20}, embedded=False)
+    generate_topic(first, num_topics=4, workers=1)
+    assert get_chunk_topic_versions(first) == {topic_model_version()}
+
+    # Folding in the second file updates the model, the topics of the first were assigned by the old version
+    generate_topic(second, num_topics=4, workers=1)
+    assert get_chunk_topic_versions(second) == {topic_model_version()}
+    assert get_chunk_topic_versions(first) != {topic_model_version()}
+
+    assert refresh_chunk_topics() == [first]
+    assert get_chunk_topic_versions(first) == {topic_model_version()}
+    assert refresh_chunk_topics() == []
+
+
+def test_topic_distributions_list_every_model_version(store_files):
+    file_name, = store_files({"a.pdf": 3}, embedded=False)
+    chunk_ids = [chunk_id for chunk_id, _ in iter_processed_texts(file_name, with_ids=True)]
+    replace_chunk_topics(file_name, [{"chunk_id": chunk_id, "topic_id": 0, "weight": 1.0, "model_version": version}
+                                     for chunk_id, version in zip(chunk_ids, (1, 2, 3))])
+    assert get_topic_distributions([file_name])[file_name]["model_versions"] == {1, 2, 3}
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pytest
+
+from database.db_utils import check_vector_store, load_file_vectors, invalidate_pages, get_embedding_matrix
+from database.vector_store import VectorStore
+
+
+def _vectors(rows, dim=4, start=0):
+    return np.arange(start, start + rows * dim, dtype=np.float32).reshape(rows, dim)
+
+
+def test_appended_rows_are_memory_mapped(tmp_path):
+    store = VectorStore("reports/a b.pdf", root=str(tmp_path))
+    store.append([1, 2], _vectors(2))
+    store.append([3], _vectors(1, start=8))
+
+    vectors, chunk_ids = store.load()
+    assert isinstance(vectors, np.memmap) and isinstance(chunk_ids, np.memmap)
+    assert np.array_equal(vectors, _vectors(3))
+    assert chunk_ids.tolist() == [1, 2, 3]
+    assert store.dim == 4 and store.count() == 3
+
+    with pytest.raises(ValueError):
+        store.append([4], _vectors(1, dim=3))
+
+
+def test_a_torn_tail_is_ignored_and_trimmed(tmp_path):
+    store = VectorStore("a.pdf", root=str(tmp_path))
+    store.append([1, 2], _vectors(2))
+    # A writer crashed after writing a complete vector and part of its id, then part of another vector
+    with open(os.path.join(store.path, "vectors.f32"), "ab") as vectors_file:
+        vectors_file.write(_vectors(1, start=100).tobytes() + b"\x00" * 6)
+    with open(os.path.join(store.path, "ids.i64"), "ab") as ids_file:
+        ids_file.write(b"\x09\x00\x00")
+
+    assert store.count() == 2
+    assert store.load()[1].tolist() == [1, 2]
+
+    store.append([3], _vectors(1, start=8))
+    vectors, chunk_ids = store.load()
+    assert np.array_equal(vectors, _vectors(3)) and chunk_ids.tolist() == [1, 2, 3]
+    assert os.path.getsize(os.path.join(store.path, "vectors.f32")) == 3 * 4 * 4
+    assert os.path.getsize(os.path.join(store.path, "ids.i64")) == 3 * 8
+
+
+def test_rewrite_and_drop(tmp_path):
+    store = VectorStore("a.pdf", root=str(tmp_path))
+    store.append([1, 2, 3], _vectors(3))
+    store.rewrite([7], _vectors(1, start=40))
+    vectors, chunk_ids = store.load()
+    assert np.array_equal(vectors, _vectors(1, start=40)) and chunk_ids.tolist() == [7]
+    assert not os.path.exists(os.path.join(str(tmp_path), ".tmp", store.key("a.pdf")))
+
+    store.drop()
+    assert store.count() == 0 and len(store.load()[0]) == 0
+
+
+def test_stores_are_rebuilt_from_the_table_after_invalidation(store_files):
+    file_name, = store_files({"a.pdf": 5})
+    assert check_vector_store(file_name)["consistent"]
+
+    invalidate_pages(file_name, [1, 2])
+    report = check_vector_store(file_name)
+    assert report["db_count"] == 3 and report["store_count"] == 0 and not report["consistent"]
+
+    vectors, chunk_ids = load_file_vectors(file_name)
+    matrix, table_ids = get_embedding_matrix(file_name)
+    assert chunk_ids.tolist() == table_ids.tolist()
+    assert np.array_equal(vectors, matrix)
+    assert check_vector_store(file_name)["consistent"]
+
+    # Rows the table doesn't have, e.g. of a crashed re-embedding, are dropped by the next rebuild
+    VectorStore(file_name).append([999], matrix[:1])
+    assert check_vector_store(file_name)["extra"] == [999]
+    assert load_file_vectors(file_name)[1].tolist() == table_ids.tolist()
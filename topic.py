@@ -1,71 +1,568 @@
-import gensim
-from gensim import corpora
-from database.db_utils import get_processed_texts, store_topics, store_clusters, store_embeddings, get_embeddings_by_file
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+import numpy as np
+
+from database.db_utils import (iter_processed_texts, replace_topics, replace_clusters,
+                               store_embeddings, get_embedded_file_names, load_file_vectors, replace_chunk_topics,
+                               get_topic_distributions, get_chunk_topic_versions)
+from database.vector_store import VectorStore, VECTOR_STORE_DIR
+from database.embedding_codec import DEFAULT_DTYPE, encode_embeddings
 from logging_util import logger
-import tensorflow_hub as hub
-import tensorflow as tf
-from sklearn.cluster import KMeans
-from sentence_transformers import SentenceTransformer
+from metrics import metrics
+from model_registry import get_model
+
+# gensim, scikit-learn and the embedding models are imported or loaded inside the functions
+# that use them, so importing this module stays cheap for commands that don't need them.
+
+# Cached gensim dictionaries and corpora, keyed by the hash of the texts they were built from
+TOPIC_CACHE_DIR = os.environ.get("CC_VC_TOPIC_CACHE", "topic_cache")
+
+# Smaller corpora keep their whole vocabulary, frequency filters would empty it
+MIN_TEXTS_TO_FILTER = 20
+
+# The corpus-level topic model shared by all files, see update_topic_model
+TOPIC_MODEL_DIR = os.environ.get("CC_VC_TOPIC_MODEL", "topic_model")
+
+# Chunk topic weights below this are not stored
+MIN_TOPIC_WEIGHT = 0.01
+
+# version -> loaded topic model, only the latest version is kept
+_topic_models = {}
+
+
+def processed_texts_hash(file_name):
+    """sha256 of the processed texts of a file, in id order."""
+    digest = hashlib.sha256()
+    for content in iter_processed_texts(file_name):
+        digest.update(content.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _tokenized_texts(file_name):
+    for content in iter_processed_texts(file_name):
+        yield content.split()
+
+
+def load_topic_corpus(file_name, no_below=2, no_above=0.5, keep_n=100000):
+    """
+    Return the gensim dictionary and bag-of-words corpus of a file's processed texts.
+
+    Both are built by streaming the texts from the database, and cached in TOPIC_CACHE_DIR
+    as a Dictionary and a serialized MmCorpus keyed by the hash of the texts and the filter
+    settings, so unchanged files are not tokenized again. Tokens in fewer than ``no_below``
+    texts or more than ``no_above`` of them are filtered out (for corpora of at least
+    MIN_TEXTS_TO_FILTER texts) and at most ``keep_n`` tokens are kept.
+    """
+    from gensim import corpora
+
+    key = hashlib.sha256(f"{processed_texts_hash(file_name)}:{no_below}:{no_above}:{keep_n}".encode()).hexdigest()
+    base = os.path.join(TOPIC_CACHE_DIR, key[:32])
+    if os.path.exists(f"{base}.dict") and os.path.exists(f"{base}.mm"):
+        logger.info("Using cached dictionary and corpus of %s", file_name)
+        return corpora.Dictionary.load(f"{base}.dict"), corpora.MmCorpus(f"{base}.mm")
+
+    start_time = time.perf_counter()
+    dictionary = corpora.Dictionary(_tokenized_texts(file_name))
+    if dictionary.num_docs >= MIN_TEXTS_TO_FILTER:
+        dictionary.filter_extremes(no_below=no_below, no_above=no_above, keep_n=keep_n)
+
+    os.makedirs(TOPIC_CACHE_DIR, exist_ok=True)
+    corpora.MmCorpus.serialize(f"{base}.mm", (dictionary.doc2bow(tokens) for tokens in _tokenized_texts(file_name)))
+    # The dictionary is saved last, it marks the cache entry as complete
+    dictionary.save(f"{base}.dict")
+    logger.info("Built dictionary of %d tokens over %s texts of %s in %.1fs",
+                len(dictionary), dictionary.num_docs, file_name, time.perf_counter() - start_time)
+    return dictionary, corpora.MmCorpus(f"{base}.mm")
+
+
+class _FileBowCorpus:
+    """Re-iterable bag-of-words corpus of a file's processed texts under a fixed dictionary."""
+
+    def __init__(self, file_name, dictionary):
+        self.file_name = file_name
+        self.dictionary = dictionary
+        # Tokens seen and tokens in the dictionary during the last iteration
+        self.token_count = 0
+        self.known_count = 0
+
+    def __iter__(self):
+        self.token_count = self.known_count = 0
+        for tokens in _tokenized_texts(self.file_name):
+            bow = self.dictionary.doc2bow(tokens)
+            self.token_count += len(tokens)
+            self.known_count += sum(count for _, count in bow)
+            yield bow
+
+
+def _topic_model_meta():
+    try:
+        with open(os.path.join(TOPIC_MODEL_DIR, "meta.json")) as meta_file:
+            return json.load(meta_file)
+    except FileNotFoundError:
+        return None
+
+
+def topic_model_files():
+    """file_name -> hash of the processed texts folded into the topic model, see update_topic_model."""
+    meta = _topic_model_meta()
+    return meta["files"] if meta else {}
+
+
+def topic_model_version():
+    """Version of the saved topic model, None if there is none yet."""
+    meta = _topic_model_meta()
+    return meta["version"] if meta else None
+
+
+@contextmanager
+def _topic_model_lock():
+    """Serialize updates of the topic model, also across processes."""
+    os.makedirs(TOPIC_MODEL_DIR, exist_ok=True)
+    with open(os.path.join(TOPIC_MODEL_DIR, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_topic_model():
+    """
+    Load the corpus-level topic model, cached per process until a newer version is saved.
+
+    Returns:
+    - tuple: (LdaMulticore model, meta dict), (None, None) if no model was trained yet.
+    """
+    from gensim.models import LdaMulticore
+
+    meta = _topic_model_meta()
+    if meta is None:
+        return None, None
+    model = _topic_models.get(meta["version"])
+    if model is None:
+        start_time = time.perf_counter()
+        model = LdaMulticore.load(os.path.join(TOPIC_MODEL_DIR, f"v{meta['version']}", "lda"))
+        _topic_models.clear()
+        _topic_models[meta["version"]] = model
+        logger.info("Loaded topic model version %s in %.2fs", meta["version"], time.perf_counter() - start_time)
+    return model, meta
+
+
+def _save_topic_model(model, meta):
+    """Save the model as version meta["version"], then point meta.json at it and remove older versions."""
+    version_name = f"v{meta['version']}"
+    version_dir = os.path.join(TOPIC_MODEL_DIR, version_name)
+    shutil.rmtree(version_dir, ignore_errors=True)
+    os.makedirs(version_dir)
+    model.save(os.path.join(version_dir, "lda"))
+
+    meta_path = os.path.join(TOPIC_MODEL_DIR, "meta.json")
+    with open(f"{meta_path}.tmp", "w") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+    for entry in os.listdir(TOPIC_MODEL_DIR):
+        if entry.startswith("v") and entry != version_name:
+            shutil.rmtree(os.path.join(TOPIC_MODEL_DIR, entry), ignore_errors=True)
+    _topic_models.clear()
+    _topic_models[meta["version"]] = model
+
+
+def update_topic_model(file_name, num_topics=100, workers=None, passes=1, iterations=400, force=False):
+    """
+    Fold the processed texts of a file into the corpus-level topic model and save it.
+
+    The first file trains the model (LdaMulticore on ``workers`` processes) and fixes its vocabulary,
+    see load_topic_corpus. Later files update it online with gensim's update instead of retraining:
+    their tokens are mapped onto that vocabulary and unknown tokens are dropped. Delete
+    TOPIC_MODEL_DIR to retrain from scratch. Files already folded in with the same processed texts
+    are skipped unless force. ``num_topics`` and ``iterations`` only apply when the model is created.
+
+    Returns:
+    - dict: Meta of the saved model (version, num_topics and the hash of every folded in file),
+      None if the file has no texts to train on.
+    """
+    from gensim.models import LdaMulticore
+
+    with _topic_model_lock():
+        model, meta = load_topic_model()
+        texts_hash = processed_texts_hash(file_name)
+        if meta and not force and meta["files"].get(file_name) == texts_hash:
+            logger.info("Topic model version %s already includes %s", meta["version"], file_name)
+            return meta
+
+        if model is None:
+            dictionary, corpus = load_topic_corpus(file_name)
+            if len(dictionary) == 0 or len(corpus) == 0:
+                logger.warning("No processed texts to generate topics from for %s", file_name)
+                return None
+            # LdaMulticore can't learn an asymmetric alpha ('auto'), eta is still learned
+            model = LdaMulticore(id2word=dictionary, num_topics=num_topics, workers=workers, passes=1,
+                                 iterations=iterations, random_state=42, alpha='symmetric', eta='auto')
+            meta = {"version": 0, "num_topics": num_topics, "files": {}}
+        else:
+            if num_topics != meta["num_topics"]:
+                logger.warning("The topic model has %s topics, ignoring num_topics=%s", meta["num_topics"], num_topics)
+            if workers:
+                model.workers = workers
+            corpus = _FileBowCorpus(file_name, model.id2word)
+
+        for pass_number in range(1, passes + 1):
+            start_time = time.perf_counter()
+            model.update(corpus)
+            logger.info("LDA pass %d/%d over the texts of %s took %.1fs",
+                        pass_number, passes, file_name, time.perf_counter() - start_time)
+            if pass_number == 1 and isinstance(corpus, _FileBowCorpus) and corpus.known_count < corpus.token_count / 2:
+                logger.warning("Only %s of %s tokens of %s are in the topic model's vocabulary, consider retraining it "
+                               "(delete %s)", corpus.known_count, corpus.token_count, file_name, TOPIC_MODEL_DIR)
+
+        meta = dict(meta, version=meta["version"] + 1, files=dict(meta["files"], **{file_name: texts_hash}))
+        _save_topic_model(model, meta)
+    logger.info("Saved topic model version %s covering %d files", meta["version"], len(meta["files"]))
+    return meta
 
-model = SentenceTransformer('bert-base-nli-mean-tokens')
 
-# Load the BERT model
-bert_embed = hub.KerasLayer("https://tfhub.dev/tensorflow/bert_en_uncased_L-12_H-768_A-12/3", trainable=False)
+def infer_topics(texts):
+    """
+    Topic distributions of processed texts under the saved model, the model itself is not updated.
+
+    Returns:
+    - numpy.ndarray: float32 (len(texts), num_topics) matrix, every row sums to 1.
+    """
+    model, _ = load_topic_model()
+    if model is None:
+        raise RuntimeError("No topic model trained yet, generate the topics of a file first (enq.py -t)")
+    if not texts:
+        return np.empty((0, model.num_topics), dtype=np.float32)
+    # One batched variational inference call instead of get_document_topics per text
+    gamma, _ = model.inference([model.id2word.doc2bow(text.split()) for text in texts])
+    return (gamma / gamma.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def assign_chunk_topics(file_name, batch_size=1000):
+    """
+    Infer the topic distribution of every processed text of a file and store its weights of at least
+    MIN_TOPIC_WEIGHT in the chunk_topics table, replacing earlier ones.
+
+    Returns:
+    - int: Number of chunks with topics.
+    """
+    _, meta = load_topic_model()
+    start_time = time.perf_counter()
+    rows = []
+    chunk_count = 0
+    texts = iter_processed_texts(file_name, batch_size=batch_size, with_ids=True)
+    while True:
+        batch = list(islice(texts, batch_size))
+        if not batch:
+            break
+        weights = infer_topics([content for _, content in batch])
+        for (chunk_id, _), chunk_weights in zip(batch, weights):
+            rows.extend({"chunk_id": chunk_id, "topic_id": int(topic_id), "weight": float(chunk_weights[topic_id]),
+                         "model_version": meta["version"]}
+                        for topic_id in np.flatnonzero(chunk_weights >= MIN_TOPIC_WEIGHT))
+        chunk_count += len(batch)
+
+    replace_chunk_topics(file_name, rows)
+    elapsed = time.perf_counter() - start_time
+    logger.info("Assigned topics to %s chunks of %s in %.2fs", chunk_count, file_name, elapsed)
+    return chunk_count
 
 
 # Function to generate topics
-def generate_topic(file_name):
-    logger.info(f'Working out the topic for {file_name}')
-    processed_chunks = get_processed_texts(file_name)
+@metrics.stage("topic")
+def generate_topic(file_name, num_topics=100, workers=None, passes=1, iterations=400):
+    """
+    Fold a file into the corpus-level topic model, store the topic weights of its chunks and its topics.
+
+    The stored topics of the file are the model's topics with a mean chunk weight of at least
+    MIN_TOPIC_WEIGHT in the file, most prominent first.
+    """
+    logger.info("Working out the topic for %s", file_name)
+    if update_topic_model(file_name, num_topics=num_topics, workers=workers, passes=passes,
+                          iterations=iterations) is None:
+        return
+    metrics.inc("items_total", assign_chunk_topics(file_name), stage="topic")
+    _store_file_topics(file_name)
 
-    # Prepare the corpus and dictionary
-    texts = [chunk.split() for chunk in processed_chunks]
-    dictionary = corpora.Dictionary(texts)
-    corpus = [dictionary.doc2bow(text) for text in texts]
 
-    # Apply LDA with hyperparameter tuning
-    lda_model = gensim.models.ldamodel.LdaModel(corpus=corpus, id2word=dictionary, num_topics=100, random_state=42, 
-                                                alpha='auto', eta='auto', iterations=400)
-    topics = lda_model.print_topics(num_words=100)
+def _store_file_topics(file_name):
+    """Store the model's topics with a mean chunk weight of at least MIN_TOPIC_WEIGHT in the file."""
+    model, _ = load_topic_model()
+    distribution = get_topic_distributions([file_name]).get(file_name, {"topics": {}})["topics"]
+    ranked = sorted((topic_id for topic_id, weight in distribution.items() if weight >= MIN_TOPIC_WEIGHT),
+                    key=distribution.get, reverse=True)
 
     # Store topics in the database
-    topics_to_store = [{"file_name": file_name, "topic": topic[1]} for topic in topics]
-    store_topics(topics_to_store)
+    topics_to_store = [{"file_name": file_name, "topic": model.print_topic(topic_id, topn=100)} for topic_id in ranked]
+    replace_topics(file_name, topics_to_store)
+
+
+def refresh_chunk_topics():
+    """
+    Re-assign the chunk topics and topics of every file folded into the topic model whose chunk
+    topics come from an older version of it, without updating the model.
+
+    Every file folded in saves a new version, so after a run over many files only the last file's
+    chunk topics are current. Call this once at the end of the run.
+
+    Returns:
+    - list: Names of the refreshed files.
+    """
+    version = topic_model_version()
+    refreshed = []
+    for file_name in topic_model_files():
+        versions = get_chunk_topic_versions(file_name)
+        if versions and versions != {version}:
+            assign_chunk_topics(file_name)
+            _store_file_topics(file_name)
+            refreshed.append(file_name)
+    if refreshed:
+        logger.info("Re-assigned the chunk topics of %d files under topic model version %s", len(refreshed), version)
+    return refreshed
+
+
+def compare_topics(file_a, file_b, top_n=10):
+    """
+    Compare the mean topic distributions of two files' chunks, e.g. a North and a South report.
+
+    Returns:
+    - list: The top_n topics with the largest difference in weight, as dicts with topic_id, the
+      topic's top words, the weight in each file and weight_a - weight_b.
+    """
+    distributions = get_topic_distributions([file_a, file_b])
+    for file_name in (file_a, file_b):
+        if file_name not in distributions:
+            raise ValueError(f"No chunk topics stored for {file_name}, generate its topics first (enq.py -t)")
+    versions = distributions[file_a]["model_versions"] | distributions[file_b]["model_versions"]
+    if len(versions) > 1:
+        logger.warning("Chunk topics of %s and %s come from topic model versions %s, rerun enq.py -t on both to "
+                       "compare them under the same model", file_a, file_b, sorted(versions))
+
+    model, _ = load_topic_model()
+    topics_a = distributions[file_a]["topics"]
+    topics_b = distributions[file_b]["topics"]
+    rows = []
+    for topic_id in set(topics_a) | set(topics_b):
+        weight_a = topics_a.get(topic_id, 0.0)
+        weight_b = topics_b.get(topic_id, 0.0)
+        rows.append({"topic_id": topic_id, "words": model.print_topic(topic_id, topn=8),
+                     "weight_a": weight_a, "weight_b": weight_b, "difference": weight_a - weight_b})
+    rows.sort(key=lambda row: abs(row["difference"]), reverse=True)
+    return rows[:top_n]
 
 
 # Function to get BERT embeddings
-def get_bert_embeddings(file_name):
-    """Convert texts into BERT embeddings."""
-    embeddings = []
-
-    processed_chunks = get_processed_texts(file_name)
-    
-    # Tokenize texts using BERT tokenizer
-    for text in processed_chunks:
-        tokenized_text = model.tokenize(text)  # We're now consistently using SentenceTransformer's tokenization
-        input_mask = [1] * len(tokenized_text)
-        segment_ids = [0] * len(tokenized_text)
-        bert_inputs = [tokenized_text, input_mask, segment_ids]
-        
-        # Get embeddings using the provided BERT model
-        embedding = bert_embed(bert_inputs)
-        embeddings.append(embedding)
-
-    embeddings_to_store = [{"file_name": file_name, "embedding": embedding} for embedding in embeddings]
-    store_embeddings(embeddings_to_store)
-    return embeddings
+@metrics.stage("embed")
+def get_bert_embeddings(file_name, batch_size=32, store_every=512, dtype=DEFAULT_DTYPE, on_flush=None):
+    """
+    Convert the processed texts of a file into BERT embeddings and store them.
+
+    Only processed texts without an embedding are encoded. They are streamed from the database
+    ``store_every`` at a time, so memory doesn't grow with the file, and the model is only loaded
+    once there is something to embed. Every window is sorted by length, so every batch holds texts
+    of similar length and little compute goes to padding, and encoded with the SentenceTransformer
+    model ``batch_size`` texts at a time. The embeddings of a window are stored with the id of the
+    processed text they belong to, encoded as ``dtype`` (float32, float16 or int8, see
+    database.embedding_codec), and ``on_flush`` is called with the number of chunks embedded so far.
+
+    Returns:
+    - int: Number of embedded chunks.
+    """
+    texts = iter_processed_texts(file_name, batch_size=store_every, with_ids=True, unembedded_only=True)
+    bucket = list(islice(texts, store_every))
+    if not bucket:
+        logger.info("All processed texts of %s are embedded", file_name)
+        return 0
+    model = get_model("sentence_transformer")
+
+    start_time = time.perf_counter()
+    embedded_count = 0
+    while bucket:
+        bucket_start = time.perf_counter()
+        # Length buckets: neighbouring texts after sorting have similar token counts
+        bucket.sort(key=lambda chunk: len(chunk[1]))
+        vectors = model.encode([text for _, text in bucket], batch_size=batch_size,
+                               convert_to_numpy=True, show_progress_bar=False)
+
+        embeddings_to_store = [dict(encoded, file_name=file_name, chunk_id=chunk_id)
+                               for (chunk_id, _), encoded in zip(bucket, encode_embeddings(vectors, dtype))]
+        store_embeddings(embeddings_to_store)
+        embedded_count += len(bucket)
+        metrics.observe_batch("embed", len(bucket), bucket_start)
+        if on_flush:
+            on_flush(embedded_count)
+
+        elapsed = time.perf_counter() - start_time
+        logger.info("Embedded %d chunks of %s (%.1f chunks/sec)", embedded_count, file_name, embedded_count / elapsed)
+        # Ids are read past the last window, the embeddings just stored don't shift the reader
+        bucket = list(islice(texts, store_every))
+
+    elapsed = time.perf_counter() - start_time
+    chunks_per_sec = embedded_count / elapsed if elapsed > 0 else 0.0
+    logger.info("Finished embedding %d chunks of %s in %.2fs (%.1f chunks/sec, batch_size=%d)",
+                embedded_count, file_name, elapsed, chunks_per_sec, batch_size)
+    return embedded_count
+
+def _clustering_sources(file_name=None):
+    """(file_name, vectors, chunk_ids) of every file to cluster, the vectors memory-mapped."""
+    file_names = [file_name] if file_name else get_embedded_file_names()
+    sources = []
+    for name in file_names:
+        vectors, chunk_ids = load_file_vectors(name)
+        if len(vectors):
+            sources.append((name, vectors, chunk_ids))
+    return sources
+
+
+def _iter_batches(sources, batch_size):
+    """(file_name, vectors, chunk_ids) batches of at most batch_size rows, never spanning files."""
+    for name, vectors, chunk_ids in sources:
+        for start in range(0, len(vectors), batch_size):
+            yield name, np.asarray(vectors[start:start + batch_size]), chunk_ids[start:start + batch_size]
+
+
+def _iter_fit_batches(sources, batch_size):
+    """Batches of exactly batch_size rows (but the last), filled across files."""
+    pending = []
+    pending_rows = 0
+    for _, batch, _ in _iter_batches(sources, batch_size):
+        pending.append(batch)
+        pending_rows += len(batch)
+        if pending_rows >= batch_size:
+            merged = np.concatenate(pending)
+            yield merged[:batch_size]
+            pending = [merged[batch_size:]]
+            pending_rows = len(pending[0])
+    if pending_rows:
+        yield np.concatenate(pending)
+
+
+def _sample_vectors(sources, sample_size, seed=42):
+    """A uniform random sample of the vectors of all sources, loaded into memory."""
+    counts = [len(vectors) for _, vectors, _ in sources]
+    total = sum(counts)
+    rng = np.random.default_rng(seed)
+    picked = np.sort(rng.choice(total, min(sample_size, total), replace=False))
+    sample = []
+    offset = 0
+    for (_, vectors, _), count in zip(sources, counts):
+        rows = picked[(picked >= offset) & (picked < offset + count)] - offset
+        sample.append(np.asarray(vectors[rows]))
+        offset += count
+    return np.concatenate(sample)
+
+
+def _centroids_path(file_name=None):
+    key = VectorStore.key(file_name) if file_name else "corpus"
+    return os.path.join(VECTOR_STORE_DIR, ".clusters", f"{key}.npy")
+
+
+def choose_n_clusters(sample, k_range=(2, 50), previous_k=None, candidates=6, seed=42):
+    """
+    Pick the number of clusters with the best silhouette score on a sample.
+
+    Candidates are spread geometrically over k_range; the k of the previous clustering is always
+    tried too, so a stable corpus keeps its k and can warm-start.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.metrics import silhouette_score
+
+    k_max = min(k_range[1], len(sample) - 1)
+    k_min = min(k_range[0], k_max)
+    if k_max < 2:
+        return 1
+    ks = set(np.unique(np.geomspace(max(k_min, 2), k_max, candidates).round().astype(int)).tolist())
+    if previous_k and k_min <= previous_k <= k_max:
+        ks.add(previous_k)
+
+    best_k, best_score = None, -1.0
+    for k in sorted(ks):
+        labels = MiniBatchKMeans(n_clusters=k, random_state=seed, n_init=3,
+                                 batch_size=max(1024, 3 * k)).fit_predict(sample)
+        if len(set(labels.tolist())) < 2:
+            continue
+        score = silhouette_score(sample, labels, random_state=seed)
+        logger.info("k=%s: silhouette %.4f", k, score)
+        if score > best_score:
+            best_k, best_score = k, score
+    return best_k or k_min
+
 
 # Function to cluster embeddings
-def cluster_embeddings(file_name,n_clusters=100):
-    """Cluster embeddings using KMeans."""
-    embeddings = get_embeddings_by_file(file_name)
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42).fit(embeddings)
-    labels = kmeans.labels_
+@metrics.stage("cluster")
+def cluster_embeddings(file_name=None, n_clusters=None, k_range=(2, 50), batch_size=1024,
+                       sample_size=5000, epochs=2, warm_start=True):
+    """
+    Cluster the embeddings of one file, or of every file, with MiniBatchKMeans.
 
-    # Store clusters in the database
-    if file_name:
-        clusters_to_store = [{"file_name": file_name, "chunk_id": idx, "cluster_label": label} for idx, label in enumerate(labels)]
-        store_clusters(clusters_to_store)
+    Parameters:
+    - file_name (str, optional): File to cluster. Default is None, which clusters the whole corpus.
+    - n_clusters (int, optional): Number of clusters. Default is None, which picks it within k_range
+      by the silhouette score on a sample of sample_size vectors.
+    - batch_size (int, optional): Vectors per partial_fit call. The vectors are streamed from the
+      memory-mapped vector stores, ``epochs`` times.
+    - warm_start (bool, optional): Start from the centroids of the previous clustering of the same
+      scope if it had the same number of clusters. Default is True.
+
+    Labels replace the previous clustering of the same scope in the clusters table, per-file and
+    corpus labels are kept apart by its scope column.
+
+    Returns:
+    - numpy.ndarray: The cluster label of every embedding, in the order of the stored clusters.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    start_time = time.perf_counter()
+    sources = _clustering_sources(file_name)
+    total = sum(len(vectors) for _, vectors, _ in sources)
+    if total == 0:
+        logger.warning("No embeddings to cluster for %s", file_name or "the corpus")
+        return np.empty(0, dtype=np.int32)
+
+    centroids_path = _centroids_path(file_name)
+    previous = np.load(centroids_path) if warm_start and os.path.exists(centroids_path) else None
+    previous_k = len(previous) if previous is not None else None
 
-    return labels
+    if n_clusters is None:
+        n_clusters = choose_n_clusters(_sample_vectors(sources, sample_size), k_range, previous_k)
+    n_clusters = min(n_clusters, total)
+
+    if previous is not None and previous.shape == (n_clusters, sources[0][1].shape[1]):
+        logger.info("Warm-starting %s clusters from the previous centroids", n_clusters)
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=previous, n_init=1, random_state=42)
+    else:
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3)
+
+    # partial_fit needs at least n_clusters vectors in the batch it initializes on, the first
+    # batch has min(total, batch_size) rows
+    batch_size = max(batch_size, 3 * n_clusters)
+    for _ in range(epochs):
+        for batch in _iter_fit_batches(sources, batch_size):
+            kmeans.partial_fit(batch)
+
+    all_labels = []
+    clusters_to_store = []
+    for name, batch, chunk_ids in _iter_batches(sources, batch_size):
+        labels = kmeans.predict(batch)
+        all_labels.append(labels)
+        clusters_to_store.extend({"file_name": name, "chunk_id": int(chunk_id), "cluster_label": int(label)}
+                                 for chunk_id, label in zip(chunk_ids.tolist(), labels.tolist()))
+
+    # Store clusters in the database
+    replace_clusters(clusters_to_store, file_name)
+    os.makedirs(os.path.dirname(centroids_path), exist_ok=True)
+    np.save(centroids_path, kmeans.cluster_centers_.astype(np.float32))
 
+    metrics.inc("items_total", total, stage="cluster")
+    logger.info("Clustered %d embeddings of %s into %d clusters in %.1fs",
+                total, file_name or "the corpus", n_clusters, time.perf_counter() - start_time)
+    return np.concatenate(all_labels)
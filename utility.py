@@ -1,4 +1,4 @@
-import pandas as pd
+from normalize import collapse_repeats
 
 def extract_data(filename):
     """
@@ -11,6 +11,8 @@ def extract_data(filename):
     - DataFrame: Extracted data in the form of a pandas DataFrame.
     """
     
+    import pandas as pd
+
     # Check the file extension to determine the file type
     file_extension = filename.split('.')[-1]
     
@@ -29,27 +31,11 @@ def table_to_string(table):
 
 
 def reduce_duplicates(s):
+    """Collapse runs of the same character, see normalize.collapse_repeats."""
     if not s:
         return s
-
-    result = [s[0]]  # Start with the first character
-
-    for i in range(1, len(s)):
-        # If current character is not the same as the previous one, add it to the result
-        if s[i] != s[i-1]:
-            result.append(s[i])
-
-    return ''.join(result)
+    return collapse_repeats(s)
 
 def remove_consecutive_duplicates(text):
-    cleaned_text = []
-    prev_char = None
-    for char in text:
-        if char != prev_char:
-            cleaned_text.append(char)
-        prev_char = char
-    return ''.join(cleaned_text)
-
-
-
-
+    """Collapse runs of the same character, see normalize.collapse_repeats."""
+    return collapse_repeats(text)